@@ -9,6 +9,7 @@ from member_card.models.user import User, Role
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 from member_card import utils
 from member_card import monitoring
+from member_card import transport
 from flask_security import SQLAlchemySessionUserDatastore
 
 if TYPE_CHECKING:
@@ -26,6 +27,10 @@ def create_cli_app(env=None) -> "Flask":
     logger.debug("register_asset_bundles")
     utils.register_asset_bundles(app)
 
+    # Created up front (with this app's config), as API clients may first make requests from pool threads
+    logger.debug("init_http_session")
+    transport.init_http_session(app)
+
     from member_card import commands
 
     assert commands
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from datetime import datetime, timedelta
 from functools import wraps
+from io import BytesIO
 
 from flask import (
     Flask,
@@ -23,7 +24,7 @@ from social_flask.template_filters import backends
 from social_flask.utils import load_strategy
 
 from member_card import utils
-from member_card.db import db
+from member_card.db import db, record_pool_stats
 from member_card.exceptions import MemberCardException
 from member_card.models import (
     AnnualMembership,
@@ -33,7 +34,7 @@ from member_card.models import (
 )
 from member_card.models.membership_card import get_or_create_membership_card
 from member_card.models.user import edit_user_name
-from member_card.passes import get_apple_pass_from_card
+from member_card.passes import get_apple_pass_from_card, gpay
 from member_card.gcp import publish_message
 from member_card.squarespace import (
     InvalidSquarespaceWebhookSignature,
@@ -74,6 +75,13 @@ def commit_on_success(error=None):
     db.session.remove()
 
 
+@app.after_request
+def annotate_db_pool_stats(response):
+    if "sqlalchemy" in app.extensions:
+        record_pool_stats(db.engine)
+    return response
+
+
 @app.context_processor
 def inject_user():
     return {
@@ -375,6 +383,17 @@ def email_distribution_request():
 @app.route("/passes/google-pay")
 @active_membership_card_required
 def passes_google_pay(membership_card):
+    if gpay.pass_object_needs_sync(membership_card):
+        # Keep the Wallet API's copy of the pass object current without holding up this redirect
+        publish_message(
+            project_id=app.config["GCLOUD_PROJECT"],
+            topic_id=app.config["GCLOUD_PUBSUB_TOPIC_ID"],
+            message_data=dict(
+                type="sync_google_pay_object_request",
+                member_email_address=membership_card.user.email,
+            ),
+        )
+    gpay.save_pass_jwt(membership_card)
     return redirect(membership_card.google_pass_save_url)
 
 
@@ -382,11 +401,11 @@ def passes_google_pay(membership_card):
 @active_membership_card_required
 def passes_apple_pay(membership_card):
     attachment_filename = f"lv_apple_pass-{g.user.last_name.lower()}.pkpass"
-    pkpass_out_path = get_apple_pass_from_card(
+    pkpass_data = get_apple_pass_from_card(
         membership_card=membership_card,
     )
     return send_file(
-        pkpass_out_path,
+        BytesIO(pkpass_data),
         attachment_filename=attachment_filename,
         mimetype="application/vnd.apple.pkpass",
         as_attachment=True,
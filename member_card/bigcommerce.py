@@ -1,17 +1,35 @@
 import logging
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime, timedelta, timezone
-from typing import List
+from time import sleep
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 
 import requests
 from bigcommerce.api import BigcommerceApi
+from bigcommerce.exception import RateLimitingException
 from dateutil.parser import parse
 from flask import current_app
 from member_card.utils import sign
-from member_card.db import db, get_or_update
+from member_card.db import (
+    bulk_upsert,
+    checkpoint,
+    chunked,
+    db,
+    filter_unchanged_rows,
+    get_instances_by_pks,
+    get_source_fingerprint,
+    unit_of_work,
+)
 from member_card.models import table_metadata, User
-from member_card.models.user import ensure_user
+from member_card.models.annual_membership import count_memberships
+from member_card.models.user import ensure_user, get_user_index, user_index
+from member_card.transport import get_http_session
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
 
 logger = logging.getLogger(__name__)
 
@@ -64,7 +82,7 @@ class BiggercommerceApi(object):
             f"BiggercommerceApi attempting {method} request to {url=} ({kwargs=})"
         )
 
-        response = requests.request(
+        response = get_http_session().request(
             method=method,
             headers=headers,
             url=url,
@@ -205,16 +223,13 @@ class BiggercommerceApi(object):
         )
 
 
-def insert_order_as_membership(order, order_products, membership_skus):
-    from member_card.models import AnnualMembership
-
-    membership_orders = []
+def get_membership_kwargs(order, order_products, membership_skus):
+    membership_kwargs_list = []
     line_items = order_products
     # breakpoint()
     subscription_line_items = [i for i in line_items if i["sku"] in membership_skus]
     ignored_line_items = [i for i in line_items if i["sku"] not in membership_skus]
     logger.debug(f"{ignored_line_items=}")
-    customer_id = order["customer_id"]
     for subscription_line_item in subscription_line_items:
         fulfillment_status = order["status"]
         # breakpoint()
@@ -250,57 +265,177 @@ def insert_order_as_membership(order, order_products, membership_skus):
             product_id=subscription_line_item["product_id"],
             product_name=subscription_line_item["name"],
         )
-        membership = get_or_update(
-            session=db.session,
-            model=AnnualMembership,
-            filters=["order_id"],
-            kwargs=membership_kwargs,
-        )
-        db.session.add(membership)
+        membership_kwargs_list.append(membership_kwargs)
+
+    return membership_kwargs_list
+
+
+def upsert_orders_as_memberships(
+    orders_with_products, membership_skus
+) -> Tuple[List, int]:
+    """Upsert memberships for the given orders, returning the new or changed memberships and the number skipped as
+    unchanged."""
+    from member_card.models import AnnualMembership
 
+    membership_rows = []
+    customer_ids_by_order_id = {}
+    for order, order_products in orders_with_products:
+        source_fingerprint = get_source_fingerprint(order, order_products)
+        for membership_kwargs in get_membership_kwargs(
+            order, order_products, membership_skus
+        ):
+            membership_kwargs["source_fingerprint"] = source_fingerprint
+            membership_rows.append(membership_kwargs)
+            customer_ids_by_order_id[membership_kwargs["order_id"]] = order[
+                "customer_id"
+            ]
+
+    changed_membership_rows = filter_unchanged_rows(
+        session=db.session,
+        model=AnnualMembership,
+        rows=membership_rows,
+        key="order_id",
+        criteria=[AnnualMembership.user_id.isnot(None)],
+    )
+    num_unchanged_memberships = len(membership_rows) - len(changed_membership_rows)
+    membership_ids = bulk_upsert(
+        session=db.session,
+        model=AnnualMembership,
+        rows=changed_membership_rows,
+        conflict_keys=["order_id"],
+    )
+    membership_orders = get_instances_by_pks(
+        session=db.session,
+        model=AnnualMembership,
+        pks=membership_ids,
+    )
+
+    for membership in membership_orders:
         membership_user = ensure_user(
             email=membership.customer_email,
             first_name=membership.billing_address_first_name,
             last_name=membership.billing_address_last_name,
-            bigcommerce_id=customer_id,
+            bigcommerce_id=customer_ids_by_order_id[membership.order_id],
         )
         db.session.add(membership_user)
         setattr(membership, "user_id", membership_user.id)
+        db.session.add(membership)
 
-        membership_orders.append(membership)
+    return membership_orders, num_unchanged_memberships
 
+
+def insert_orders_as_memberships(orders_with_products, membership_skus):
+    membership_orders, _ = upsert_orders_as_memberships(
+        orders_with_products=orders_with_products,
+        membership_skus=membership_skus,
+    )
     return membership_orders
 
 
-def parse_subscription_orders(bigcommerce_client, membership_skus, subscription_orders):
+def insert_order_as_membership(order, order_products, membership_skus):
+    return insert_orders_as_memberships(
+        orders_with_products=[(order, order_products)],
+        membership_skus=membership_skus,
+    )
+
+
+def wait_for_rate_limit_reset(bigcommerce_client, min_requests_remaining):
+    # The upstream OAuthConnection records the `X-Rate-Limit-*` headers from the last response it handled
+    rate_limit = getattr(bigcommerce_client.connection, "rate_limit", None)
+    if not isinstance(rate_limit, dict) or "requests_remaining" not in rate_limit:
+        return
+
+    if rate_limit["requests_remaining"] > min_requests_remaining:
+        return
+
+    wait_secs = rate_limit["ms_until_reset"] / 1000
+    logger.debug(
+        f"Bigcommerce rate limit nearly exhausted ({rate_limit=}), pausing for {wait_secs=}..."
+    )
+    sleep(wait_secs)
+
+
+def get_order_products(bigcommerce_client, order_id, max_attempts=3):
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return [dict(p) for p in bigcommerce_client.OrderProducts.all(order_id)]
+        except RateLimitingException as err:
+            if attempt == max_attempts:
+                raise
+            wait_secs = int(err.retry_after) / 1000
+            logger.warning(
+                f"Rate limited retrieving products for {order_id=} ({attempt=}), retrying in {wait_secs=}..."
+            )
+            sleep(wait_secs)
+
+
+def fetch_order_products(
+    bigcommerce_client: BigcommerceApi,
+    orders: "Iterable[dict]",
+    max_workers: int = 8,
+    min_requests_remaining: int = 5,
+) -> "Iterator[tuple[dict, List[dict]]]":
+    """Yield (order, order_products) pairs with order products fetched via a bounded pool of threads.
+
+    At most `max_workers` requests are in flight at once and results are yielded in the same order as `orders`
+    """
+    pending = deque()
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="bigcommerce-order-products"
+    ) as executor:
+        for subscription_order in orders:
+            order = deepcopy(subscription_order)
+            if len(pending) >= max_workers:
+                pending_order, pending_future = pending.popleft()
+                yield pending_order, pending_future.result()
+
+            wait_for_rate_limit_reset(bigcommerce_client, min_requests_remaining)
+            pending.append(
+                (
+                    order,
+                    executor.submit(
+                        get_order_products, bigcommerce_client, order["id"]
+                    ),
+                )
+            )
+
+        while pending:
+            pending_order, pending_future = pending.popleft()
+            yield pending_order, pending_future.result()
+
+
+def parse_subscription_orders(
+    bigcommerce_client,
+    membership_skus,
+    subscription_orders,
+    before_batch_checkpoint: Optional[Callable[[List[tuple]], None]] = None,
+):
     # logger.info(f"{len(subscription_orders)=} retrieved from Bigcommerce...")
+    orders_with_products = fetch_order_products(
+        bigcommerce_client=bigcommerce_client,
+        orders=subscription_orders,
+        max_workers=current_app.config["BIGCOMMERCE_ORDER_PRODUCTS_MAX_WORKERS"],
+        min_requests_remaining=current_app.config["BIGCOMMERCE_MIN_REQUESTS_REMAINING"],
+    )
 
-    # Loop over all the raw order data and do the ETL bits
-    memberships = []
-    for subscription_order in subscription_orders:
-        # subscription_order['products'] = bigcommerce_client.OrderProducts.all(subscription_order['id'])
-        # order_product_names = [p["name"] for p in subscription_order['products']]
-        # if not any(p["sku"] in membership_skus for p in subscription_order['products']):
-        #     logger.debug(
-        #         f"{subscription_order['id']=} (#{subscription_order['orderNumber']}) DOES NOT INCLUDE {membership_skus=} in {order_product_names=}"
-        #     )
-        #     continue
-        # logger.debug(
-        #     f"#{order['orderNumber']} has no {membership_sku=} in {order_product_names=}"
-        # )
-        order = deepcopy(subscription_order)
-        order_products = [
-            dict(p) for p in bigcommerce_client.OrderProducts.all(order["id"])
-        ]
-        membership_orders = insert_order_as_membership(
-            order=order,
-            order_products=order_products,
-            membership_skus=membership_skus,
-        )
+    # Loop over all the raw order data and do the ETL bits, one upsert statement per batch of orders. Only counts
+    # are kept across batches, so memory use stays flat.
+    membership_counts: Counter = Counter()
+    with unit_of_work():
+        for orders_batch in chunked(
+            orders_with_products, current_app.config["ETL_BATCH_SIZE"]
+        ):
+            membership_orders, num_unchanged_memberships = upsert_orders_as_memberships(
+                orders_with_products=orders_batch,
+                membership_skus=membership_skus,
+            )
+            if before_batch_checkpoint is not None:
+                before_batch_checkpoint(orders_batch)
 
-        db.session.commit()
-        memberships += membership_orders
-    return memberships
+            membership_counts.update(count_memberships(membership_orders))
+            membership_counts["unchanged"] += num_unchanged_memberships
+            checkpoint(num_records=len(orders_batch))
+    return membership_counts
 
 
 def load_all_bigcommerce_orders(
@@ -311,9 +446,12 @@ def load_all_bigcommerce_orders(
         membership_skus=membership_skus,
     )
 
-    memberships = parse_subscription_orders(bigcommerce_client, membership_skus, orders)
+    with user_index():
+        membership_counts = parse_subscription_orders(
+            bigcommerce_client, membership_skus, orders
+        )
 
-    return memberships
+    return membership_counts
 
 
 def load_single_order(
@@ -321,39 +459,118 @@ def load_single_order(
 ):
     subscription_order = bigcommerce_client.Orders.get(order_id)
     logger.debug(f"API response for {order_id=}: {subscription_order=}")
-    memberships = parse_subscription_orders(
+    membership_counts = parse_subscription_orders(
         bigcommerce_client=bigcommerce_client,
         membership_skus=membership_skus,
         subscription_orders=[subscription_order],
     )
-    logger.debug(f"After parsing subscription orders: {memberships=}")
-    return memberships
+    logger.debug(f"After parsing subscription orders: {membership_counts=}")
+    return membership_counts
 
 
 def bigcommerce_orders_etl(
     bigcommerce_client: BigcommerceApi, membership_skus: List[str]
 ):
+    """Load orders created _or_ modified since the last run, resuming from the newest `date_modified` loaded.
+
+    Orders are requested oldest modification first and the `date_modified` cursor is committed along with each
+    batch of memberships, so a failed run picks up right where it left off.
+    """
     from member_card import models
 
     etl_start_time = datetime.now(tz=ZoneInfo("UTC"))
     membership_table_name = models.AnnualMembership.__tablename__
-    last_run_start_time = table_metadata.get_last_run_start_time(membership_table_name)
-    last_run_start_time = last_run_start_time - timedelta(hours=12)
-    modified_after = last_run_start_time.isoformat()
-    modified_before = etl_start_time.isoformat()
+    last_date_modified = table_metadata.get_last_date_modified(membership_table_name)
+    if last_date_modified is None:
+        # Bootstrap off the cursor from the prior date_created-based loads
+        last_run_start_time = table_metadata.get_last_run_start_time(
+            membership_table_name
+        )
+        last_date_modified = last_run_start_time - timedelta(hours=12)
+    log_extra = dict(last_date_modified=last_date_modified)
+    logger.info(
+        f"Loading Bigcommerce orders modified since {last_date_modified}",
+        extra=log_extra,
+    )
 
-    orders = load_orders(
+    def advance_date_modified_cursor(orders_batch):
+        batch_date_modified = max(
+            parse(order["date_modified"]).replace(tzinfo=timezone.utc)
+            for order, _ in orders_batch
+        )
+        table_metadata.set_last_date_modified(
+            membership_table_name, batch_date_modified
+        )
+
+    orders = iter_orders_by_date_modified(
         bigcommerce_client=bigcommerce_client,
-        membership_skus=membership_skus,
-        min_date_created=modified_after,
-        max_date_created=modified_before,
+        min_date_modified=last_date_modified,
     )
 
-    memberships = parse_subscription_orders(bigcommerce_client, membership_skus, orders)
+    with user_index():
+        membership_counts = parse_subscription_orders(
+            bigcommerce_client,
+            membership_skus,
+            orders,
+            before_batch_checkpoint=advance_date_modified_cursor,
+        )
 
     table_metadata.set_last_run_start_time(membership_table_name, etl_start_time)
 
-    return memberships
+    return membership_counts
+
+
+def iter_orders_by_date_modified(
+    bigcommerce_client: BigcommerceApi,
+    min_date_modified: datetime,
+    page_size: int = 250,
+):
+    """Yield orders modified since `min_date_modified`, oldest modification first.
+
+    Pages are requested by advancing `min_date_modified` to the last `date_modified` seen rather than by offset, as
+    an order modified mid-run moves to the end of the sort and would shift the later offsets. Orders tied at the
+    cursor are requested again with the next page, so those already yielded are skipped (re-processing them would
+    be harmless anyway since memberships are upserted).
+    """
+    cursor = min_date_modified
+    page = 1
+    yielded_at_cursor = set()
+    while True:
+        logger.debug(
+            f"Grabbing orders modified since {cursor} ({page=})",
+            extra=dict(min_date_modified=cursor, page=page, page_size=page_size),
+        )
+        orders = (
+            bigcommerce_client.Orders.all(
+                min_date_modified=cursor.isoformat(),
+                sort="date_modified:asc",
+                limit=page_size,
+                page=page,
+            )
+            or []
+        )
+        for order in orders:
+            if order["id"] not in yielded_at_cursor:
+                yield order
+
+        if len(orders) < page_size:
+            return
+
+        last_date_modified = parse(orders[-1]["date_modified"]).replace(
+            tzinfo=timezone.utc
+        )
+        if last_date_modified == cursor:
+            # A full page of ties can't move the cursor, so page through the ties at this timestamp instead
+            page += 1
+        else:
+            cursor = last_date_modified
+            page = 1
+            yielded_at_cursor.clear()
+        yielded_at_cursor.update(
+            order["id"]
+            for order in orders
+            if parse(order["date_modified"]).replace(tzinfo=timezone.utc) == cursor
+        )
 
 
 def load_orders(
@@ -361,6 +578,8 @@ def load_orders(
     membership_skus: List[str],
     min_date_created=None,
     max_date_created=None,
+    min_date_modified=None,
+    sort=None,
 ):
     # ) -> List[AnnualMembership]:
     # remove "None"s
@@ -370,6 +589,8 @@ def load_orders(
     get_orders_query_params = dict(
         min_date_created=min_date_created,
         max_date_created=max_date_created,
+        min_date_modified=min_date_modified,
+        sort=sort,
     )
     get_orders_query_params = {
         k: v for k, v in get_orders_query_params.items() if v is not None
@@ -396,8 +617,13 @@ def generate_webhook_token(api: BigcommerceApi):
 
 
 def map_customer_to_user_by_store_id(bigcommerce_id, customer_email):
-    extant_user_by_email = User.query.filter_by(email=customer_email).first()
-    extant_user_by_id = User.query.filter_by(bigcommerce_id=bigcommerce_id).first()
+    index = get_user_index()
+    if index is not None:
+        extant_user_by_email = index.get_by_email(customer_email)
+        extant_user_by_id = index.get_by_bigcommerce_id(bigcommerce_id)
+    else:
+        extant_user_by_email = User.query.filter_by(email=customer_email).first()
+        extant_user_by_id = User.query.filter_by(bigcommerce_id=bigcommerce_id).first()
     log_extra = dict(
         bigcommerce_id=bigcommerce_id,
         customer_email=customer_email,
@@ -433,8 +659,10 @@ def map_customer_to_user_by_store_id(bigcommerce_id, customer_email):
 
         setattr(extant_user_by_email, "email", f"MERGED.{customer_email}")
         setattr(extant_user_by_email, "active", False)
+        if index is not None:
+            index.reindex(extant_user_by_email)
         db.session.add(extant_user_by_email)
-        db.session.commit()
+        checkpoint(num_records=0)
         logger.debug(
             msg=f"[{bigcommerce_id=}] => {extant_user_by_email=}:: email de-duplicated and active set to False",
             extra=log_extra,
@@ -445,6 +673,8 @@ def map_customer_to_user_by_store_id(bigcommerce_id, customer_email):
             extra=log_extra,
         )
         setattr(extant_user_by_id, "email", customer_email)
+        if index is not None:
+            index.reindex(extant_user_by_id)
 
         return extant_user_by_id
 
@@ -454,6 +684,8 @@ def map_customer_to_user_by_store_id(bigcommerce_id, customer_email):
             extra=log_extra,
         )
         setattr(extant_user_by_email, "bigcommerce_id", bigcommerce_id)
+        if index is not None:
+            index.reindex(extant_user_by_email)
         return extant_user_by_email
 
     if extant_user_by_id and customer_email != extant_user_by_id.email:
@@ -462,6 +694,8 @@ def map_customer_to_user_by_store_id(bigcommerce_id, customer_email):
             extra=log_extra,
         )
         setattr(extant_user_by_id, "email", customer_email)
+        if index is not None:
+            index.reindex(extant_user_by_id)
         return extant_user_by_id
 
     logger.debug(
@@ -475,28 +709,29 @@ def customer_etl(bigcommerce_client: BigcommerceApi):
     # First retrieve all the customer entries from the configured store (paginated here via the upstream bigcommerce client)
     customers = bigcommerce_client.Customers.iterall()
 
-    for num, customer in enumerate(customers):
-        # Then we loop through our iterable of customers, parse out the relevant details, and then look for matching
-        # user entries from our app's database:
-        bigcommerce_id = customer["id"]
-        customer_email = customer["email"].lower()
-        log_extra = dict(
-            bigcommerce_id=bigcommerce_id,
-            customer_email=customer_email,
-        )
-        logger.debug(
-            msg=f"[{num}]: {bigcommerce_id=} => next customer up: {bigcommerce_id=} & {customer_email=}",
-            extra=log_extra,
-        )
-        user = map_customer_to_user_by_store_id(
-            bigcommerce_id=bigcommerce_id,
-            customer_email=customer_email,
-        )
-        log_extra.update(dict(user=user))
-        if user is not None:
+    with unit_of_work(session=db.session), user_index(session=db.session):
+        for num, customer in enumerate(customers):
+            # Then we loop through our iterable of customers, parse out the relevant details, and then look for matching
+            # user entries from our app's database:
+            bigcommerce_id = customer["id"]
+            customer_email = customer["email"].lower()
+            log_extra = dict(
+                bigcommerce_id=bigcommerce_id,
+                customer_email=customer_email,
+            )
             logger.debug(
-                msg=f"[{num}]: {bigcommerce_id=} => adding {user=} to database session and committing changes",
+                msg=f"[{num}]: {bigcommerce_id=} => next customer up: {bigcommerce_id=} & {customer_email=}",
                 extra=log_extra,
             )
-            db.session.add(user)
-            db.session.commit()
+            user = map_customer_to_user_by_store_id(
+                bigcommerce_id=bigcommerce_id,
+                customer_email=customer_email,
+            )
+            log_extra.update(dict(user=user))
+            if user is not None:
+                logger.debug(
+                    msg=f"[{num}]: {bigcommerce_id=} => adding {user=} to database session and committing changes",
+                    extra=log_extra,
+                )
+                db.session.add(user)
+                checkpoint()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import logging
+from concurrent import futures
 
 import click
 from sqlalchemy.exc import NoResultFound
@@ -11,9 +12,15 @@ from member_card import bigcommerce
 from member_card.app import app
 from member_card.db import db
 from member_card.gcp import get_bucket, publish_message
-from member_card.image import generate_card_image
+from member_card.jobs import resume_jobs
+from member_card.image import (
+    backfill_card_images,
+    find_cards_missing_images,
+    generate_card_image,
+    get_renderer_pool,
+)
 from member_card.minibc import Minibc, parse_subscriptions, find_missing_shipping
-from member_card.models import AnnualMembership, User
+from member_card.models import AnnualMembership, MembershipCard, User
 from member_card.models.membership_card import get_or_create_membership_card
 from member_card.models.user import add_role_to_user_by_email, edit_user_name
 from member_card.passes import gpay
@@ -29,36 +36,113 @@ def cards():
 
 @cards.command("detect-missing-card-images")
 def cards_detect_missing_card_images():
-    image_bucket = get_bucket()
-    users = User.query.all()
-    users_missing_card_image = []
-    users_with_card_image = []
-    for num, user in enumerate(users):
-        membership_card = get_or_create_membership_card(
-            user=user,
-        )
-        blob = image_bucket.blob(membership_card.remote_image_path)
-        if blob.exists():
-            users_with_card_image.append(user)
-        else:
-            users_missing_card_image.append(user)
-        if users_missing_card_image:
-            break
-    print(f"#{len(users_missing_card_image)} => {users_missing_card_image}")
-    print(f"#{len(users_with_card_image)}")
+    cards_missing_images = find_cards_missing_images(image_bucket=get_bucket())
+    emails_missing_card_image = sorted(
+        {c.user.email for c in cards_missing_images if c.user is not None}
+    )
+    print(
+        f"#{len(cards_missing_images)} cards missing images => {emails_missing_card_image}"
+    )
     topic_id = app.config["GCLOUD_PUBSUB_TOPIC_ID"]
-    for user_missing_card_image in users_missing_card_image:
+    publish_futures = []
+    for email_missing_card_image in emails_missing_card_image:
+        logger.info(
+            f"publishing ensure_uploaded_card_image_request message for {email_missing_card_image} to pubsub {topic_id=}"
+        )
+        publish_futures.append(
+            publish_message(
+                project_id=app.config["GCLOUD_PROJECT"],
+                topic_id=topic_id,
+                message_data=dict(
+                    type="ensure_uploaded_card_image_request",
+                    member_email_address=email_missing_card_image,
+                ),
+            )
+        )
+    futures.wait(publish_futures)
+
+
+@cards.command("backfill-card-images")
+@click.option(
+    "--concurrency",
+    type=int,
+    default=lambda: app.config["CARD_IMAGE_BACKFILL_CONCURRENCY"],
+    help="Maximum number of card images rendered / uploaded at once.",
+)
+@click.option(
+    "--limit",
+    type=int,
+    default=None,
+    help="Only backfill (up to) this many card images during this run.",
+)
+@click.option("--dry-run/--no-dry-run", default=False)
+def cards_backfill_card_images(concurrency, limit, dry_run):
+    # Already-uploaded images are skipped based on a listing of the bucket, so
+    # interrupted (or partially failed) runs pick up where they left off when re-run.
+    image_bucket = get_bucket()
+    cards_missing_images = find_cards_missing_images(image_bucket=image_bucket)
+    if limit is not None:
+        cards_missing_images = cards_missing_images[:limit]
+
+    num_cards = len(cards_missing_images)
+    if dry_run or not cards_missing_images:
+        print(f"#{num_cards} card images to backfill ({dry_run=})")
+        return
+
+    # Each worker thread needs its own headless browser to actually render concurrently
+    get_renderer_pool(
+        pool_size=max(concurrency, app.config["CARD_IMAGE_RENDERER_POOL_SIZE"])
+    )
+    logger.info(f"Backfilling {num_cards} card images with {concurrency=}")
+    failed_serials = []
+    backfill_results = backfill_card_images(
+        app=app,
+        image_bucket=image_bucket,
+        serial_numbers=[c.serial_number for c in cards_missing_images],
+        max_workers=concurrency,
+    )
+    for num_done, (serial_number, error) in enumerate(backfill_results, start=1):
+        if error is not None:
+            logger.error(f"Unable to backfill image for {serial_number=}: {error}")
+            failed_serials.append(serial_number.hex)
         logger.info(
-            f"publishing ensure_uploaded_card_image_request message for {user_missing_card_image} to pubsub {topic_id=}"
+            f"[{num_done}/{num_cards}] backfilled image for {serial_number=} ({len(failed_serials)} failures so far)"
+        )
+
+    print(f"#{num_cards - len(failed_serials)} of {num_cards} card images backfilled")
+    if failed_serials:
+        raise click.ClickException(
+            f"Unable to backfill {len(failed_serials)} card images (re-run to retry): {failed_serials}"
         )
+
+
+@cards.command("publish-google-pay-object-syncs")
+def cards_publish_google_pay_object_syncs():
+    # Cards whose pass object later changes get re-synced when their member next opens the GPay save link
+    unsynced_cards = (
+        MembershipCard.query.filter(
+            MembershipCard.google_pay_object_synced_at.is_(None)
+        )
+        .filter(MembershipCard.member_until > func.now())
+        .all()
+    )
+    emails_to_sync = sorted(
+        {c.user.email for c in unsynced_cards if c.user is not None}
+    )
+    print(f"#{len(unsynced_cards)} unsynced GPay pass objects => {emails_to_sync}")
+    topic_id = app.config["GCLOUD_PUBSUB_TOPIC_ID"]
+    publish_futures = [
         publish_message(
             project_id=app.config["GCLOUD_PROJECT"],
             topic_id=topic_id,
             message_data=dict(
-                type="ensure_uploaded_card_image_request",
-                member_email_address=user_missing_card_image.email,
+                type="sync_google_pay_object_request",
+                member_email_address=email_to_sync,
             ),
         )
+        for email_to_sync in emails_to_sync
+    ]
+    futures.wait(publish_futures)
 
 
 @app.cli.command("sync-subscriptions")
@@ -170,13 +254,14 @@ def apple_serial_num_to_hex(serial_num):
 def publish_sync_subscriptions_msg():
     topic_id = app.config["GCLOUD_PUBSUB_TOPIC_ID"]
     logger.info(f"publishing sync_subscriptions_etl message to pubsub {topic_id=}")
-    publish_message(
+    publish_future = publish_message(
         project_id=app.config["GCLOUD_PROJECT"],
         topic_id=topic_id,
         message_data=dict(
             type="sync_subscriptions_etl",
         ),
     )
+    logger.info(f"published sync_subscriptions_etl message: {publish_future.result()=}")
 
 
 @app.cli.command("add-memberships-to-user-email")
@@ -332,11 +417,12 @@ def sync_sub_by_order_email(email):
     # subscription_order, last_page_num = minibc.search_subscriptions()
     print(f"{subscriptions=}")
     if subscriptions is not None:
-        memberships = parse_subscriptions(
-            skus=app.config["MINIBC_MEMBERSHIP_SKUS"],
+        num_subscriptions_upserted = parse_subscriptions(
             subscriptions=subscriptions,
         )
-        print(f"After parsing {len(subscriptions)} subscription(s):\n{memberships=}")
+        print(
+            f"After parsing {len(subscriptions)} subscription(s): {num_subscriptions_upserted=}"
+        )
     else:
         print(f"no subscription found for {email=}")
     # breakpoint()
@@ -353,13 +439,13 @@ def bigcommerce_load_single_order(order_id):
     logger.debug(f"bigcommerce_load_single_order() called with {order_id=}")
     membership_skus = app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"]
     bigcommerce_client = bigcommerce.get_app_client_for_store()
-    memberships = bigcommerce.load_single_order(
+    membership_counts = bigcommerce.load_single_order(
         bigcommerce_client=bigcommerce_client,
         membership_skus=membership_skus,
         order_id=order_id,
     )
-    print(f"{memberships=}")
-    return memberships
+    print(f"{membership_counts=}")
+    return membership_counts
 
 
 @bigcomm.command("ensure-scripts")
@@ -534,3 +620,27 @@ def bigcomm_sync_customers():
         message=dict(type="cli-sync-customers"),
     )
     logger.info(f"bigcomm_sync_customers() => {etl_results=}")
+
+
+@app.cli.group()
+def jobs():
+    pass
+
+
+@jobs.command("resume")
+@click.option(
+    "--status",
+    "statuses",
+    multiple=True,
+    default=["pending", "failed"],
+    help="Resume jobs in these states (may be repeated).",
+)
+def jobs_resume(statuses):
+    # The worker retries failed / lost jobs on its own (see jobs.sweep_jobs()); this resumes them on demand
+    # and waits on their outcome
+    job_futures = resume_jobs(handlers=worker.MESSAGE_TYPE_HANDLERS, statuses=statuses)
+    futures.wait(job_futures)
+    failed_jobs = [f for f in job_futures if f.exception() is not None]
+    print(f"#{len(job_futures) - len(failed_jobs)} of {len(job_futures)} jobs resumed")
+    if failed_jobs:
+        raise click.ClickException(f"{len(failed_jobs)} resumed jobs failed")
@@ -1,19 +1,61 @@
 #!/usr/bin/env python
+import atexit
+import hashlib
+import json
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import partial
-from typing import TYPE_CHECKING
+from itertools import islice
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
 
+from flask import current_app
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from google.cloud.sql.connector import connector
+from opentelemetry import trace
+from sqlalchemy.dialects.postgresql import insert
 
 if TYPE_CHECKING:
     from pg8000 import dbapi
+    from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 migrate = Migrate(compare_type=True)
 logger = logging.getLogger(__name__)
 
+_current_unit_of_work: ContextVar[Optional["UnitOfWork"]] = ContextVar(
+    "current_unit_of_work", default=None
+)
+
+_connector: Optional[connector.Connector] = None
+_connector_lock = Lock()
+
+
+def get_connector() -> connector.Connector:
+    # The connector maintains its own background refresh of instance metadata and ephemeral certs,
+    # so we share a single instance across every connection the engine opens in this process.
+    global _connector
+    with _connector_lock:
+        if _connector is None:
+            logger.debug("Initializing process-wide GCP SQL cloud connector...")
+            _connector = connector.Connector()
+        return _connector
+
+
+def close_connector() -> None:
+    global _connector
+    with _connector_lock:
+        if _connector is not None:
+            logger.debug("Closing process-wide GCP SQL cloud connector...")
+            _connector.close()
+            _connector = None
+
+
+atexit.register(close_connector)
+
 
 def get_gcp_sql_engine_creator(
     instance_connection_string, db_name, db_user, db_pass=None
@@ -44,7 +86,7 @@ def get_gcp_sql_engine_creator(
             # enable_iam_auth=True,
         )
 
-        conn_obj = connector.Connector()
+        conn_obj = get_connector()
         if db_pass:
             conn_kwargs["password"] = db_pass
         else:
@@ -61,6 +103,25 @@ def get_gcp_sql_engine_creator(
     return engine_creator
 
 
+def get_pool_stats(engine: "Engine") -> Dict[str, int]:
+    pool = engine.pool
+    pool_stats = {}
+    for stat_name in ["size", "checkedin", "checkedout", "overflow"]:
+        # Not every pool implementation (e.g., NullPool, StaticPool) tracks these counts
+        if stat_method := getattr(pool, stat_name, None):
+            pool_stats[stat_name] = stat_method()
+    return pool_stats
+
+
+def record_pool_stats(engine: "Engine") -> Dict[str, int]:
+    pool_stats = get_pool_stats(engine)
+    logger.debug(f"Database connection pool stats: {pool_stats=}", extra=pool_stats)
+    trace.get_current_span().set_attributes(
+        {f"db.pool.{k}": v for k, v in pool_stats.items()}
+    )
+    return pool_stats
+
+
 def get_or_update(session, model, filters, kwargs):
     filters = {f: kwargs[f] for f in filters if f in kwargs}
     kwargs = {k: v for k, v in kwargs.items() if v is not None}
@@ -90,3 +151,207 @@ def get_or_create(session, model, **kwargs):
         logger.debug(f"Creating {model.__name__} with {kwargs=}")
         instance = model(**kwargs)
         return instance
+
+
+def chunked(iterable: Iterable, chunk_size: int) -> Iterable[List]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+
+def bulk_upsert(
+    session, model, rows: Iterable[Dict], conflict_keys: List[str], chunk_size=500
+) -> List[int]:
+    """Insert or update `rows` with one `INSERT ... ON CONFLICT DO UPDATE` statement per chunk.
+
+    Mirrors get_or_update(): `None` values never overwrite existing column values. `conflict_keys` must be covered
+    by a unique constraint on the model's table. Returns the primary key for each distinct conflict key, in the order
+    given.
+    """
+    table = model.__table__
+    (pk_column,) = table.primary_key.columns
+    column_names = set(table.columns.keys())
+
+    rows_by_conflict_key = {}
+    for row in rows:
+        unknown_keys = set(row) - column_names
+        if unknown_keys:
+            logger.debug(f"Ignoring {unknown_keys=} for {model.__name__} upsert")
+        row = {k: v for k, v in row.items() if k in column_names and v is not None}
+        # Postgres refuses to update the same row twice within a single statement, so last write wins here
+        rows_by_conflict_key[tuple(row.get(k) for k in conflict_keys)] = row
+
+    pks_by_conflict_key = {}
+    for chunk in chunked(rows_by_conflict_key.values(), chunk_size):
+        # A multi-row VALUES clause needs the same columns in every row; group 'em up accordingly
+        rows_by_columns = {}
+        for row in chunk:
+            rows_by_columns.setdefault(tuple(sorted(row)), []).append(row)
+
+        for columns, column_rows in rows_by_columns.items():
+            stmt = insert(table).values(column_rows)
+            update_columns = {
+                c: stmt.excluded[c] for c in columns if c not in conflict_keys
+            }
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=conflict_keys, set_=update_columns
+                )
+            else:
+                # Nothing to update, but we still want RETURNING to hand back the extant row's key
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=conflict_keys,
+                    set_={conflict_keys[0]: stmt.excluded[conflict_keys[0]]},
+                )
+            stmt = stmt.returning(pk_column, *[table.c[k] for k in conflict_keys])
+            logger.debug(
+                f"Upserting {len(column_rows)} {model.__name__} rows on {conflict_keys=}"
+            )
+            for returned_row in session.execute(stmt):
+                pks_by_conflict_key[tuple(returned_row[1:])] = returned_row[0]
+
+    return [pks_by_conflict_key[k] for k in rows_by_conflict_key]
+
+
+def get_source_fingerprint(*source_records) -> str:
+    """Stable hash of the upstream data (e.g., an order as returned by an API) a row is loaded from."""
+    source_json = json.dumps(
+        source_records, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(source_json.encode("utf-8")).hexdigest()
+
+
+def filter_unchanged_rows(
+    session,
+    model,
+    rows: List[Dict],
+    key: str,
+    fingerprint_column: str = "source_fingerprint",
+    criteria: Iterable = (),
+) -> List[Dict]:
+    """Drop any `rows` whose fingerprint matches that of the extant row with the same `key` (and `criteria`).
+
+    Lets ETL runs skip the upsert (and everything after it) for records that haven't changed upstream.
+    """
+    if not rows:
+        return []
+
+    key_column = getattr(model, key)
+    stored_fingerprints = dict(
+        session.query(key_column, getattr(model, fingerprint_column)).filter(
+            key_column.in_({row[key] for row in rows}), *criteria
+        )
+    )
+    changed_rows = [
+        row
+        for row in rows
+        if row[fingerprint_column] is None
+        or stored_fingerprints.get(row[key]) != row[fingerprint_column]
+    ]
+    if num_unchanged := len(rows) - len(changed_rows):
+        logger.debug(f"Skipping {num_unchanged} unchanged {model.__name__} rows")
+    return changed_rows
+
+
+def get_instances_by_pks(session, model, pks: List[int]) -> List:
+    if not pks:
+        return []
+
+    (pk_column,) = model.__table__.primary_key.columns
+    # Bulk upserts bypass the ORM, so refresh any stale copies we might already have in the session
+    instances = (
+        session.query(model).filter(pk_column.in_(pks)).populate_existing().all()
+    )
+    instances_by_pk = {getattr(i, pk_column.key): i for i in instances}
+    return [instances_by_pk[pk] for pk in pks]
+
+
+class UnitOfWork(object):
+    """Batches ETL commits, committing every `commit_every` records or `commit_interval_secs` seconds.
+
+    Everything written since the last commit is rolled back if the wrapped work fails. ETL loads are upserts keyed
+    on upstream IDs, so re-running a failed chunk is safe.
+    """
+
+    def __init__(self, session, commit_every=100, commit_interval_secs=10.0):
+        self.session = session
+        self.commit_every = commit_every
+        self.commit_interval_secs = commit_interval_secs
+        self.num_pending = 0
+        self.num_committed = 0
+        self.num_commits = 0
+        self.has_pending_changes = False
+        self._last_commit_at = monotonic()
+
+    def add(self, num_records=1, flush=False):
+        self.num_pending += num_records
+        self.has_pending_changes = True
+        commit_due = monotonic() - self._last_commit_at >= self.commit_interval_secs
+        if self.num_pending >= self.commit_every or commit_due:
+            self.commit()
+        elif flush:
+            self.session.flush()
+
+    def commit(self):
+        logger.debug(f"UnitOfWork committing {self.num_pending} pending record(s)...")
+        self.session.commit()
+        self.num_committed += self.num_pending
+        self.num_commits += 1
+        self.num_pending = 0
+        self.has_pending_changes = False
+        self._last_commit_at = monotonic()
+
+    def rollback(self):
+        logger.warning(
+            f"UnitOfWork rolling back {self.num_pending} uncommitted record(s) ({self.num_committed=})"
+        )
+        self.session.rollback()
+        self.num_pending = 0
+        self.has_pending_changes = False
+
+    def __repr__(self):
+        return f"<UnitOfWork {self.num_pending=} {self.num_committed=} {self.num_commits=}>"
+
+
+@contextmanager
+def unit_of_work(session=None, commit_every=None, commit_interval_secs=None):
+    """Run the enclosed ETL work within a UnitOfWork, joining the current one if already active."""
+    if (active_unit_of_work := _current_unit_of_work.get()) is not None:
+        yield active_unit_of_work
+        return
+
+    if session is None:
+        session = db.session
+    if commit_every is None:
+        commit_every = current_app.config["ETL_COMMIT_EVERY"]
+    if commit_interval_secs is None:
+        commit_interval_secs = current_app.config["ETL_COMMIT_INTERVAL_SECS"]
+
+    uow = UnitOfWork(
+        session=session,
+        commit_every=commit_every,
+        commit_interval_secs=commit_interval_secs,
+    )
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield uow
+    except Exception:
+        uow.rollback()
+        raise
+    else:
+        if uow.has_pending_changes:
+            uow.commit()
+    finally:
+        _current_unit_of_work.reset(token)
+    logger.debug(f"unit_of_work() completed: {uow=}")
+
+
+def checkpoint(num_records=1, flush=False, session=None):
+    """Commit now, or count `num_records` towards the next commit of the active unit_of_work()"""
+    if (uow := _current_unit_of_work.get()) is not None:
+        uow.add(num_records=num_records, flush=flush)
+        return
+
+    if session is None:
+        session = db.session
+    session.commit()
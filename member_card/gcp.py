@@ -1,8 +1,12 @@
 """Publishes multiple messages to a Pub/Sub topic with an error handler."""
+import atexit
 import json
 import logging
 import os
+from collections import Counter
 from concurrent import futures
+from threading import Lock
+from typing import Dict, Optional
 
 from flask import current_app
 from google.cloud.secretmanager import SecretManagerServiceClient
@@ -15,6 +19,14 @@ DEFAULT_GCP_SCOPES = [
     "https://www.googleapis.com/auth/cloud-platform",
 ]
 
+_publisher: Optional[pubsub_v1.PublisherClient] = None
+_publisher_lock = Lock()
+publish_failures: Counter = Counter()
+
+_gcs_client: Optional[storage.Client] = None
+_gcs_buckets: Dict[str, storage.Bucket] = {}
+_gcs_lock = Lock()
+
 DEFAULT_SECRET_PLACEHOLDERS = {
     "SLACK_SIGNING_SECRET": os.getenv("SLACK_SIGNING_SECRET"),
     "SECRET_KEY": os.getenv("SECRET_KEY"),
@@ -45,16 +57,62 @@ DEFAULT_SECRET_PLACEHOLDERS = {
 #     return credentials
 
 
-def publish_message(project_id, topic_id, message_data):
-    publisher = pubsub_v1.PublisherClient()
+def get_publisher() -> pubsub_v1.PublisherClient:
+    # PublisherClient setup (gRPC channel, auth, batching threads) is relatively expensive,
+    # so one client is shared by everything publishing from this process.
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            batch_settings = pubsub_v1.types.BatchSettings(
+                max_messages=current_app.config["GCLOUD_PUBSUB_BATCH_MAX_MESSAGES"],
+                max_bytes=current_app.config["GCLOUD_PUBSUB_BATCH_MAX_BYTES"],
+                max_latency=current_app.config["GCLOUD_PUBSUB_BATCH_MAX_LATENCY_SECS"],
+            )
+            logger.debug(f"Initializing Pub/Sub publisher with {batch_settings=}")
+            _publisher = pubsub_v1.PublisherClient(batch_settings=batch_settings)
+        return _publisher
+
+
+def shutdown_publisher() -> None:
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None:
+            logger.debug("Flushing pending messages and stopping Pub/Sub publisher...")
+            # Blocks until any batched (but not yet sent) messages are published
+            _publisher.stop()
+            _publisher = None
+
+
+atexit.register(shutdown_publisher)
+
+
+def publish_message(project_id, topic_id, message_data) -> futures.Future:
+    publisher = get_publisher()
     topic_path = publisher.topic_path(project_id, topic_id)
     data = json.dumps(message_data).encode("utf-8")
-    publish_future = publisher.publish(topic_path, data)
+    message_type = message_data.get("type", "unknown")
+
+    def log_publish_result(publish_future: futures.Future) -> None:
+        if publish_exception := publish_future.exception():
+            publish_failures[topic_path] += 1
+            logger.error(
+                f"Failed to publish {message_type=} message to {topic_path}: {publish_exception}",
+                extra=dict(
+                    topic_path=topic_path,
+                    message_data=message_data,
+                    publish_failures=publish_failures[topic_path],
+                ),
+            )
+            return
+        logger.debug(
+            f"Published {message_type=} message to {topic_path}: {publish_future.result()=}"
+        )
 
-    # Wait for all the publish futures to resolve before exiting.
-    futures.wait([publish_future], return_when=futures.ALL_COMPLETED)
+    publish_future = publisher.publish(topic_path, data)
+    publish_future.add_done_callback(log_publish_result)
 
-    logger.info(f"Published messages with error handler to {topic_path}.")
+    logger.info(f"Queued {message_type=} message for publishing to {topic_path}.")
+    return publish_future
 
 
 def retrieve_app_secrets(secret_name, defaults=DEFAULT_SECRET_PLACEHOLDERS):
@@ -74,13 +132,28 @@ def retrieve_app_secrets(secret_name, defaults=DEFAULT_SECRET_PLACEHOLDERS):
 def get_gcs_client(credentials=None):
     # if credentials is None:
     #     credentials = load_gcp_credentials()
-    return storage.Client(credentials=credentials)
+    if credentials is not None:
+        return storage.Client(credentials=credentials)
+
+    global _gcs_client
+    with _gcs_lock:
+        if _gcs_client is None:
+            logger.debug("Initializing process-wide GCS client...")
+            _gcs_client = storage.Client()
+        return _gcs_client
 
 
 def get_bucket(client=None):
-    if client is None:
-        client = get_gcs_client()
-    return client.get_bucket(current_app.config["GCS_BUCKET_ID"])
+    bucket_id = current_app.config["GCS_BUCKET_ID"]
+    if client is not None:
+        return client.bucket(bucket_id)
+
+    # Note: client.bucket() only builds a local handle (i.e., no bucket metadata GET request)
+    client = get_gcs_client()
+    with _gcs_lock:
+        if bucket_id not in _gcs_buckets:
+            _gcs_buckets[bucket_id] = client.bucket(bucket_id)
+        return _gcs_buckets[bucket_id]
 
 
 def upload_file_to_gcs(bucket, local_file, remote_path, content_type=None):
@@ -96,6 +169,17 @@ def upload_file_to_gcs(bucket, local_file, remote_path, content_type=None):
     return blob
 
 
+def upload_data_to_gcs(bucket, data, remote_path, content_type=None):
+    blob = bucket.blob(remote_path)
+    blob.cache_control = "no-cache"
+
+    logger.debug(f"Uploading {len(data)} bytes to {remote_path=}")
+
+    blob.upload_from_string(data, content_type=content_type)
+
+    return blob
+
+
 # from datetime import timedelta
 # def get_presigned_url(blob, expiration: "timedelta"):
 #     url = blob.generate_signed_url(
@@ -1,31 +1,79 @@
+import atexit
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
 from tempfile import TemporaryDirectory
+from threading import Lock
+from typing import TYPE_CHECKING, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
 
 from flask import current_app
 from html2image import Html2Image
 from PIL import Image, ImageChops
+from sqlalchemy.orm import joinedload
 
 from member_card.gcp import upload_file_to_gcs, get_bucket
+from member_card.models.membership_card import (
+    REMOTE_CARD_IMAGE_BASE_PATH,
+    MembershipCard,
+)
+from member_card.renderer import ChromeRendererPool
 from member_card.utils import get_jinja_template
 
+if TYPE_CHECKING:
+    from flask import Flask
+    from google.cloud.storage import Bucket
+
 logger = logging.getLogger(__name__)
 
+_renderer_pool: Optional[ChromeRendererPool] = None
+_renderer_pool_lock = Lock()
+
+
+def get_renderer_pool(pool_size: Optional[int] = None) -> Optional[ChromeRendererPool]:
+    # Note: pool_size (defaulting to CARD_IMAGE_RENDERER_POOL_SIZE) only applies to the call that creates the pool
+    global _renderer_pool
+    if pool_size is None:
+        pool_size = current_app.config["CARD_IMAGE_RENDERER_POOL_SIZE"]
+    if pool_size <= 0:
+        return None
+    with _renderer_pool_lock:
+        if _renderer_pool is None:
+            logger.debug(f"Initializing card image renderer pool with {pool_size=}")
+            _renderer_pool = ChromeRendererPool(
+                size=pool_size,
+                max_renders=current_app.config["CARD_IMAGE_RENDERER_MAX_RENDERS"],
+                timeout_secs=current_app.config["CARD_IMAGE_RENDERER_TIMEOUT_SECS"],
+                executable=current_app.config["CARD_IMAGE_RENDERER_CHROME_PATH"],
+            )
+        return _renderer_pool
+
+
+def close_renderer_pool() -> None:
+    global _renderer_pool
+    with _renderer_pool_lock:
+        if _renderer_pool is not None:
+            _renderer_pool.close()
+            _renderer_pool = None
 
-def remove_image_background(img):
-    img = img.convert("RGBA")
 
-    img_data = img.getdata()
+atexit.register(close_renderer_pool)
 
-    updated_img_data = []
 
-    for pixel in img_data:
-        if pixel[0] == 255 and pixel[1] == 255 and pixel[2] == 255:
-            updated_img_data.append((255, 255, 255, 0))
-        else:
-            updated_img_data.append(pixel)
+def remove_image_background(img):
+    img = img.convert("RGBA")
+    red, green, blue, alpha = img.split()
+
+    # Builds a mask that is 255 wherever a pixel is pure white and 0 everywhere else...
+    white_lut = [0] * 255 + [255]
+    white_mask = ImageChops.darker(
+        ImageChops.darker(red.point(white_lut), green.point(white_lut)),
+        blue.point(white_lut),
+    )
 
-    img.putdata(updated_img_data)
+    # ...which, when subtracted (clamped at 0), makes white pixels fully transparent
+    img.putalpha(ImageChops.subtract(alpha, white_mask))
     return img
 
 
@@ -55,6 +103,62 @@ def ensure_uploaded_card_image(membership_card):
     return f"{image_bucket.id}/{membership_card.remote_image_path}"
 
 
+def list_uploaded_card_image_serials(image_bucket: "Bucket") -> Set[str]:
+    prefix = f"{REMOTE_CARD_IMAGE_BASE_PATH}/"
+    uploaded_serials = set()
+    for blob in image_bucket.list_blobs(prefix=prefix):
+        filename = blob.name[len(prefix) :]
+        serial_hex, extension = os.path.splitext(filename)
+        if extension == ".png" and "/" not in serial_hex:
+            uploaded_serials.add(serial_hex)
+    logger.info(f"Found {len(uploaded_serials)} uploaded card images under {prefix}")
+    return uploaded_serials
+
+
+def find_cards_missing_images(image_bucket: "Bucket") -> List[MembershipCard]:
+    uploaded_serials = list_uploaded_card_image_serials(image_bucket)
+    membership_cards = (
+        MembershipCard.query.options(joinedload(MembershipCard.user))
+        .order_by(MembershipCard.id)
+        .all()
+    )
+    cards_missing_images = [
+        c for c in membership_cards if c.serial_number.hex not in uploaded_serials
+    ]
+    logger.info(
+        f"{len(cards_missing_images)} of {len(membership_cards)} membership cards are missing images"
+    )
+    return cards_missing_images
+
+
+def backfill_card_images(
+    app: "Flask",
+    image_bucket: "Bucket",
+    serial_numbers: List[UUID],
+    max_workers: int,
+) -> Iterator[Tuple[UUID, Optional[Exception]]]:
+    # Each worker thread loads its card within its own app context (and thus its own DB session)
+    # rather than sharing ORM instances attached to the caller's session.
+    def generate_and_upload(serial_number):
+        with app.app_context():
+            membership_card = (
+                MembershipCard.query.options(joinedload(MembershipCard.user))
+                .filter_by(serial_number=serial_number)
+                .one()
+            )
+            return generate_and_upload_card_image(
+                image_bucket=image_bucket,
+                membership_card=membership_card,
+            )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures_to_serials = {
+            executor.submit(generate_and_upload, s): s for s in serial_numbers
+        }
+        for future in as_completed(futures_to_serials):
+            yield futures_to_serials[future], future.exception()
+
+
 def generate_and_upload_card_image(image_bucket, membership_card):
     with TemporaryDirectory() as image_output_path:
         image_path = generate_card_image(
@@ -86,13 +190,34 @@ def generate_card_image(membership_card, output_path, card_image_filename):
         static_base_url=current_app.config["STATIC_ASSET_BASE_URL"],
     )
 
-    screenshot_filename = f"screenshot_{card_image_filename}"
+    if renderer_pool := get_renderer_pool():
+        screenshot = renderer_pool.render(
+            html_content=html_content,
+            size=(img_width, img_height),
+        )
+        img = Image.open(BytesIO(screenshot))
+    else:
+        img = screenshot_with_html2image(
+            html_content=html_content,
+            output_path=output_path,
+            screenshot_filename=f"screenshot_{card_image_filename}",
+            size=(img_width, img_height),
+        )
 
+    img = remove_image_background(img)
+    image_path = os.path.join(output_path, card_image_filename)
+    img = trim(img)
+    img.save(image_path)
+    return image_path
+
+
+def screenshot_with_html2image(html_content, output_path, screenshot_filename, size):
+    # Launches a fresh Chrome process per screenshot; used when the renderer pool is disabled
     with TemporaryDirectory() as td:
         hti = Html2Image(
             output_path=output_path,
             temp_path=td,
-            size=(img_width, img_height),
+            size=size,
             custom_flags=[
                 "--no-sandbox",
                 "--hide-scrollbars",
@@ -104,8 +229,5 @@ def generate_card_image(membership_card, output_path, card_image_filename):
         )
         screenshot_path = os.path.join(output_path, screenshot_filename)
         img = Image.open(screenshot_path)
-        img = remove_image_background(img)
-        image_path = os.path.join(output_path, card_image_filename)
-        img = trim(img)
-        img.save(image_path)
-    return image_path
+        img.load()
+    return img
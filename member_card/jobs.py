@@ -0,0 +1,411 @@
+"""Background execution of Pub/Sub messages persisted to the pubsub_jobs table, one thread pool per message type."""
+import atexit
+import logging
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from threading import Lock, Timer
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set
+
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from member_card.db import db
+from member_card.models.pubsub_job import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_PENDING,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+    JOB_STATUS_SUPERSEDED,
+    PubsubJob,
+)
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+logger = logging.getLogger(__name__)
+
+_job_runner: Optional["JobRunner"] = None
+_job_runner_lock = Lock()
+skipped_duplicate_jobs: Counter = Counter()
+superseded_jobs: Counter = Counter()
+
+
+def get_lease_expired_before() -> datetime:
+    # Jobs still "running" past this point are assumed to have been lost along with their worker instance
+    lease = timedelta(seconds=current_app.config["WORKER_JOB_LEASE_SECS"])
+    return datetime.now(tz=timezone.utc) - lease
+
+
+def find_duplicate_job(
+    message_id: Optional[str] = None, dedup_key: Optional[str] = None
+) -> Optional[PubsubJob]:
+    # Only jobs that finished (or were superseded), or are pending / running within their lease, count. So
+    # redelivered messages still get to retry failed jobs and those lost along with a worker instance.
+    conditions = []
+    if message_id:
+        conditions.append(PubsubJob.message_id == message_id)
+    if dedup_key:
+        conditions.append(PubsubJob.dedup_key == dedup_key)
+    if not conditions:
+        return None
+
+    ttl = timedelta(seconds=current_app.config["WORKER_JOB_DEDUP_TTL_SECS"])
+    lease_expired_before = get_lease_expired_before()
+    return (
+        PubsubJob.query.filter(or_(*conditions))
+        .filter(
+            or_(
+                PubsubJob.status.in_([JOB_STATUS_SUCCEEDED, JOB_STATUS_SUPERSEDED]),
+                and_(
+                    PubsubJob.status == JOB_STATUS_PENDING,
+                    PubsubJob.time_created >= lease_expired_before,
+                ),
+                and_(
+                    PubsubJob.status == JOB_STATUS_RUNNING,
+                    PubsubJob.time_started >= lease_expired_before,
+                ),
+            )
+        )
+        .filter(PubsubJob.time_created >= datetime.now(tz=timezone.utc) - ttl)
+        .order_by(PubsubJob.id.desc())
+        .first()
+    )
+
+
+def record_skipped_duplicate_job(message: dict, duplicate_job: PubsubJob) -> None:
+    message_type = message["type"]
+    skipped_duplicate_jobs[message_type] += 1
+    logger.info(
+        f"Skipping {message_type=} message already handled by {duplicate_job=}",
+        extra=dict(
+            pubsub_message=message,
+            duplicate_job=duplicate_job.to_dict(),
+            skipped_duplicate_jobs=skipped_duplicate_jobs[message_type],
+            skipped_duplicate_jobs_total=sum(skipped_duplicate_jobs.values()),
+        ),
+    )
+
+
+def supersede_pending_jobs(
+    message_type: str, coalesce_key: str, before_job_id: Optional[int] = None
+) -> int:
+    # With before_job_id, only jobs enqueued ahead of that one are superseded, so concurrently enqueued jobs for
+    # the same key can't supersede each other
+    query = PubsubJob.query.filter_by(
+        status=JOB_STATUS_PENDING,
+        coalesce_key=coalesce_key,
+    )
+    if before_job_id is not None:
+        query = query.filter(PubsubJob.id < before_job_id)
+    num_superseded = query.update(
+        dict(status=JOB_STATUS_SUPERSEDED), synchronize_session=False
+    )
+    db.session.commit()
+    if num_superseded:
+        superseded_jobs[message_type] += num_superseded
+        logger.info(
+            f"Superseded {num_superseded} pending jobs for {coalesce_key=}",
+            extra=dict(
+                message_type=message_type,
+                coalesce_key=coalesce_key,
+                superseded_jobs=superseded_jobs[message_type],
+            ),
+        )
+    return num_superseded
+
+
+def enqueue_job(
+    message: dict,
+    message_id: Optional[str] = None,
+    dedup_key: Optional[str] = None,
+    coalesce_key: Optional[str] = None,
+    run_after: Optional[datetime] = None,
+) -> Optional[PubsubJob]:
+    """Persist a pending job for `message`; returns None if a job for `message_id` already exists.
+
+    Inserted with `ON CONFLICT DO NOTHING` against the unique message_id index, so only one of any concurrent
+    redeliveries of a message gets a job.
+    """
+    stmt = (
+        insert(PubsubJob)
+        .values(
+            message_id=message_id,
+            dedup_key=dedup_key,
+            coalesce_key=coalesce_key,
+            run_after=run_after,
+            message_type=message["type"],
+            message=message,
+            status=JOB_STATUS_PENDING,
+            attempts=0,
+        )
+        .on_conflict_do_nothing(
+            index_elements=[PubsubJob.message_id],
+            index_where=PubsubJob.message_id.isnot(None),
+        )
+        .returning(PubsubJob.id)
+    )
+    job_id = db.session.execute(stmt).scalar()
+    db.session.commit()
+    if job_id is None:
+        logger.debug(f"Job for {message_id=} already enqueued")
+        return None
+    job = PubsubJob.query.filter_by(id=job_id).one()
+    logger.debug(f"Enqueued {job=}", extra=dict(job=job.to_dict()))
+    return job
+
+
+def run_job(job_id: int, handlers: Dict[str, Callable]):
+    # Claimed with a conditional UPDATE, so superseded (or already running / finished) jobs are left be
+    num_claimed = (
+        PubsubJob.query.filter(PubsubJob.id == job_id)
+        .filter(
+            or_(
+                PubsubJob.status.in_([JOB_STATUS_PENDING, JOB_STATUS_FAILED]),
+                and_(
+                    PubsubJob.status == JOB_STATUS_RUNNING,
+                    PubsubJob.time_started < get_lease_expired_before(),
+                ),
+            )
+        )
+        .update(
+            dict(
+                status=JOB_STATUS_RUNNING,
+                attempts=PubsubJob.attempts + 1,
+                time_started=datetime.now(tz=timezone.utc),
+            ),
+            synchronize_session=False,
+        )
+    )
+    db.session.commit()
+    job = PubsubJob.query.filter_by(id=job_id).one()
+    log_extra = dict(job_id=job_id, message_type=job.message_type)
+    if not num_claimed:
+        logger.info(f"Not running {job=} (status: {job.status})", extra=log_extra)
+        return None
+
+    logger.info(f"Running {job=} (attempt #{job.attempts})", extra=log_extra)
+    try:
+        result = handlers[job.message_type](job.message)
+    except Exception as err:
+        db.session.rollback()
+        job.status = JOB_STATUS_FAILED
+        job.error = repr(err)
+        job.time_finished = datetime.now(tz=timezone.utc)
+        db.session.commit()
+        logger.exception(f"{job=} failed: {err}", extra=log_extra)
+        raise
+
+    job.status = JOB_STATUS_SUCCEEDED
+    job.error = None
+    job.time_finished = datetime.now(tz=timezone.utc)
+    db.session.commit()
+    log_extra.update(dict(duration=job.time_finished - job.time_started))
+    logger.info(f"Finished {job=} in {log_extra['duration']}", extra=log_extra)
+    return result
+
+
+class JobRunner(object):
+    def __init__(
+        self,
+        app: "Flask",
+        handlers: Dict[str, Callable],
+        concurrency: Dict[str, int],
+        default_concurrency: int = 4,
+    ) -> None:
+        self.app = app
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.default_concurrency = default_concurrency
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._executors_lock = Lock()
+        self._timers: Set[Timer] = set()
+        self._active_job_ids: Set[int] = set()
+
+    def get_executor(self, message_type: str) -> ThreadPoolExecutor:
+        with self._executors_lock:
+            if message_type not in self._executors:
+                max_workers = self.concurrency.get(
+                    message_type, self.default_concurrency
+                )
+                logger.debug(
+                    f"Initializing job executor for {message_type=} with {max_workers=}"
+                )
+                self._executors[message_type] = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix=f"job-{message_type}",
+                )
+            return self._executors[message_type]
+
+    def is_active(self, job_id: int) -> bool:
+        with self._executors_lock:
+            return job_id in self._active_job_ids
+
+    def _discard_active(self, job_id: int) -> None:
+        with self._executors_lock:
+            self._active_job_ids.discard(job_id)
+
+    def _run_in_app_context(self, job_id: int):
+        with self.app.app_context():
+            return run_job(job_id=job_id, handlers=self.handlers)
+
+    def _submit(self, job_id: int, message_type: str) -> Future:
+        executor = self.get_executor(message_type)
+        job_future = executor.submit(self._run_in_app_context, job_id)
+        job_future.add_done_callback(lambda _: self._discard_active(job_id))
+        return job_future
+
+    def submit(self, job: PubsubJob) -> Future:
+        # Jobs with a run_after deadline are held back until then; if this process goes away in the meantime,
+        # the job is left pending for sweep_jobs() to pick up
+        job_id, message_type = job.id, job.message_type
+        delay_secs = 0.0
+        if job.run_after is not None:
+            delay_secs = (job.run_after - datetime.now(tz=timezone.utc)).total_seconds()
+        with self._executors_lock:
+            self._active_job_ids.add(job_id)
+        if delay_secs <= 0:
+            return self._submit(job_id, message_type)
+
+        delayed_future: Future = Future()
+
+        def copy_job_outcome(job_future: Future) -> None:
+            if job_exception := job_future.exception():
+                delayed_future.set_exception(job_exception)
+            else:
+                delayed_future.set_result(job_future.result())
+
+        def submit_after_delay():
+            with self._executors_lock:
+                self._timers.discard(timer)
+            self._submit(job_id, message_type).add_done_callback(copy_job_outcome)
+
+        timer = Timer(delay_secs, submit_after_delay)
+        timer.daemon = True
+        with self._executors_lock:
+            self._timers.add(timer)
+        timer.start()
+        return delayed_future
+
+    def shutdown(self, wait: bool = False) -> None:
+        # Jobs that haven't started yet stay "pending" in the job table; see sweep_jobs()
+        with self._executors_lock:
+            for timer in self._timers:
+                timer.cancel()
+            self._timers = set()
+            self._active_job_ids = set()
+            for executor in self._executors.values():
+                executor.shutdown(wait=wait, cancel_futures=True)
+            self._executors = {}
+
+
+def get_job_runner(handlers: Dict[str, Callable]) -> JobRunner:
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = JobRunner(
+                app=current_app._get_current_object(),
+                handlers=handlers,
+                concurrency=current_app.config["WORKER_JOB_CONCURRENCY"],
+                default_concurrency=current_app.config[
+                    "WORKER_JOB_DEFAULT_CONCURRENCY"
+                ],
+            )
+        return _job_runner
+
+
+def shutdown_job_runner() -> None:
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is not None:
+            _job_runner.shutdown()
+            _job_runner = None
+
+
+atexit.register(shutdown_job_runner)
+
+
+def resume_jobs(
+    handlers: Dict[str, Callable],
+    statuses: Iterable[str] = (JOB_STATUS_PENDING, JOB_STATUS_FAILED),
+) -> List[Future]:
+    max_attempts = current_app.config["WORKER_JOB_MAX_ATTEMPTS"]
+    jobs = (
+        PubsubJob.query.filter(PubsubJob.status.in_(list(statuses)))
+        .filter(PubsubJob.attempts < max_attempts)
+        .order_by(PubsubJob.id)
+        .all()
+    )
+    logger.info(f"Resuming {len(jobs)} jobs with {statuses=} and {max_attempts=}")
+    job_runner = get_job_runner(handlers)
+    return [job_runner.submit(job) for job in jobs]
+
+
+def prune_jobs() -> int:
+    # Finished jobs only matter for deduplication, and only within WORKER_JOB_DEDUP_TTL_SECS of their creation
+    ttl = timedelta(seconds=current_app.config["WORKER_JOB_DEDUP_TTL_SECS"])
+    num_pruned = (
+        PubsubJob.query.filter(
+            PubsubJob.status.in_(
+                [JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED, JOB_STATUS_SUPERSEDED]
+            )
+        )
+        .filter(PubsubJob.time_created < datetime.now(tz=timezone.utc) - ttl)
+        .delete(synchronize_session=False)
+    )
+    db.session.commit()
+    logger.info(f"Pruned {num_pruned} finished jobs older than {ttl}")
+    return num_pruned
+
+
+def sweep_jobs(handlers: Dict[str, Callable]) -> List[Future]:
+    # Pub/Sub messages are acked once their job is persisted, so this is what retries failed jobs and picks back
+    # up those lost along with the worker instance that was running (or about to run) them
+    max_attempts = current_app.config["WORKER_JOB_MAX_ATTEMPTS"]
+    lease_expired_before = get_lease_expired_before()
+    now = datetime.now(tz=timezone.utc)
+    stale_running_job = and_(
+        PubsubJob.status == JOB_STATUS_RUNNING,
+        PubsubJob.time_started < lease_expired_before,
+    )
+
+    prune_jobs()
+    num_expired = (
+        PubsubJob.query.filter(stale_running_job)
+        .filter(PubsubJob.attempts >= max_attempts)
+        .update(
+            dict(
+                status=JOB_STATUS_FAILED,
+                error=f"Lease expired after {max_attempts} attempts",
+                time_finished=now,
+            ),
+            synchronize_session=False,
+        )
+    )
+    db.session.commit()
+
+    job_runner = get_job_runner(handlers)
+    jobs = [
+        job
+        for job in PubsubJob.query.filter(
+            or_(
+                PubsubJob.status.in_([JOB_STATUS_PENDING, JOB_STATUS_FAILED]),
+                stale_running_job,
+            )
+        )
+        .filter(PubsubJob.attempts < max_attempts)
+        .filter(or_(PubsubJob.run_after.is_(None), PubsubJob.run_after <= now))
+        .order_by(PubsubJob.id)
+        .all()
+        if not job_runner.is_active(job.id)
+    ]
+    logger.info(
+        f"Sweeping up {len(jobs)} jobs ({num_expired} exhausted jobs with expired leases marked failed)",
+        extra=dict(
+            job_ids=[j.id for j in jobs],
+            num_expired=num_expired,
+            max_attempts=max_attempts,
+        ),
+    )
+    return [job_runner.submit(job) for job in jobs]
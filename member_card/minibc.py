@@ -1,13 +1,25 @@
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timezone
-from time import sleep
-from typing import TYPE_CHECKING
+from itertools import islice
+from threading import Lock
+from time import monotonic, sleep
+from typing import TYPE_CHECKING, Iterator, List, Tuple
 
-import requests
 from dateutil.parser import ParserError, parse
-
-from member_card.db import db, get_or_update
+from flask import current_app
+
+from member_card.db import (
+    bulk_upsert,
+    checkpoint,
+    db,
+    filter_unchanged_rows,
+    get_source_fingerprint,
+    unit_of_work,
+)
 from member_card.models import table_metadata
+from member_card.transport import ResilientSession, get_http_session
 
 # from member_card.models import MinibcWebhook, table_metadata
 
@@ -64,12 +76,15 @@ class Minibc(object):
         self.api_key = api_key
         self.api_baseurl = api_baseurl
 
-        # Setup our HTTP session
-        self.http = requests.Session()
-        self.http.headers.update({"X-MBC-TOKEN": self.api_key})
+        # Requests go out via the shared HTTP session, with our headers added per request
+        self.headers = {"X-MBC-TOKEN": self.api_key}
         self.useragent = "Minibc python API by Los Verdes"
         self._next_page = None
 
+    @property
+    def http(self) -> ResilientSession:
+        return get_http_session()
+
     @property
     def useragent(self):
         """Get the current useragent."""
@@ -79,12 +94,14 @@ class Minibc(object):
     def useragent(self, agent_string):
         """Set the User-Agent that will be used."""
         self._useragent = agent_string
-        self.http.headers.update({"User-Agent": self._useragent})
+        self.headers.update({"User-Agent": self._useragent})
 
     def perform_request(self, method, path, **kwargs) -> "Response":
         """Retrieve an endpoint from the Minibc API."""
         url = f"{self.api_baseurl}/{path}"
-        response = getattr(self.http, method)(url=url, **kwargs)
+        response = self.http.request(
+            method=method.upper(), url=url, headers=self.headers, **kwargs
+        )
 
         # response.raise_for_status()
         # if 'application/json' == response.headers['Content-Type'].lower():
@@ -122,20 +139,18 @@ class Minibc(object):
             json=search_payload,
         )
         logger.debug(f"{page_num=}:: {response=}")
-        subscriptions += response.json()
-        logger.debug(f"{len(subscriptions)=}")
-        # breakpoint()
         if response.status_code == 404:
             logger.warning(
                 "No subscriptions returned from Minibc... this is probably unexpected!"
             )
-            # breakpoint()
             return None
         try:
             response.raise_for_status()
         except Exception as err:
             logger.error(f"{err=}")
             return None
+        subscriptions += response.json()
+        logger.debug(f"{len(subscriptions)=}")
         return subscriptions
 
     def search_products(self):
@@ -161,14 +176,15 @@ class Minibc(object):
         return self.get(path="profiles/", args=dict(filter=f"email,{email}"))
 
 
-def parse_subscriptions(subscriptions):
+def parse_subscriptions(subscriptions) -> int:
+    """Upsert the given raw subscriptions, returning the number of (new or changed) subscriptions written."""
     logger.info(f"{len(subscriptions)=} retrieved from Minibc...")
 
     # Insert oldest orders first (so our internal membership ID generally aligns with order IDs...)
     subscriptions.reverse()
 
     # Loop over all the raw order data and do the ETL bits
-    subscription_objs = []
+    subscription_rows = []
     from member_card.models import Subscription
 
     for subscription in subscriptions:
@@ -190,19 +206,82 @@ def parse_subscriptions(subscriptions):
             next_payment_date=parse_weird_dates(subscription["next_payment_date"]),
             created_time=parse_weird_dates(subscription["created_time"]),
             last_modified=parse_weird_dates(subscription["last_modified"]),
+            source_fingerprint=get_source_fingerprint(subscription),
         )
-        subscription_obj = get_or_update(
-            session=db.session,
-            model=Subscription,
-            filters=["subscription_id"],
-            kwargs=subscription_kwargs,
-        )
-        subscription_objs.append(subscription_obj)
+        subscription_rows.append(subscription_kwargs)
+
+    subscription_rows = filter_unchanged_rows(
+        session=db.session,
+        model=Subscription,
+        rows=subscription_rows,
+        key="subscription_id",
+    )
+    subscription_ids = bulk_upsert(
+        session=db.session,
+        model=Subscription,
+        rows=subscription_rows,
+        conflict_keys=["subscription_id"],
+    )
+    checkpoint(num_records=len(subscriptions))
+    return len(subscription_ids)
+
+
+class RequestRateLimiter(object):
+    """Spaces out request start times (across threads) so no more than `max_requests_per_sec` are sent per second."""
+
+    def __init__(self, max_requests_per_sec: float) -> None:
+        self.interval_secs = 1 / max_requests_per_sec
+        self._next_request_time = monotonic()
+        self._lock = Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = monotonic()
+            request_time = max(now, self._next_request_time)
+            self._next_request_time = request_time + self.interval_secs
+        sleep(request_time - now)
+
+
+def fetch_subscription_pages(
+    minibc_client: Minibc,
+    sku: str,
+    start_page_num: int,
+    end_page_num: int,
+    max_workers: int = 4,
+    max_requests_per_sec: float = 2,
+) -> Iterator[Tuple[int, List[dict]]]:
+    """Yield (page_num, subscriptions) pairs with subscription search pages fetched via a bounded pool of threads.
 
-    for subscription_obj in subscription_objs:
-        db.session.add(subscription_obj)
-    db.session.commit()
-    return subscription_objs
+    Pages are yielded in order, stopping at the first page that comes back empty (or 404s / errors out)
+    """
+    rate_limiter = RequestRateLimiter(max_requests_per_sec)
+
+    def fetch_page(page_num: int):
+        rate_limiter.wait()
+        logger.info(f"Sync at {page_num=}")
+        return minibc_client.search_subscriptions(product_sku=sku, page_num=page_num)
+
+    page_nums = iter(range(start_page_num, end_page_num))
+    pending = deque()
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="minibc-subscription-pages"
+    )
+    try:
+        while True:
+            for page_num in islice(page_nums, max_workers - len(pending)):
+                pending.append((page_num, executor.submit(fetch_page, page_num)))
+            if not pending:
+                return
+
+            page_num, page_future = pending.popleft()
+            subscriptions = page_future.result()
+            if not subscriptions:
+                logger.debug(f"{page_num=} returned no results, done paginating")
+                return
+            yield page_num, subscriptions
+    finally:
+        # Any requests for pages past the last one are moot at this point
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def find_missing_shipping(minibc_client: Minibc, skus):
@@ -212,7 +291,6 @@ def find_missing_shipping(minibc_client: Minibc, skus):
     missing_shipping_subs = list()
     inactive_missing_shipping_subs = list()
 
-    last_page_num = start_page_num
     end_page_num = start_page_num + max_pages + 1
 
     logger.debug(
@@ -221,20 +299,15 @@ def find_missing_shipping(minibc_client: Minibc, skus):
     total_subs_num = 0
     total_subs_missing_shipping = 0
     total_inactive_subs_missing_shipping = 0
-    for page_num in range(start_page_num, end_page_num):
-        logger.info(f"Sync at {page_num=}")
-        subscriptions = minibc_client.search_subscriptions(
-            product_sku=skus[0],
-            page_num=page_num,
-        )
-        if subscriptions is None:
-            logger.debug(
-                f"find_missing_shipping() => {last_page_num=} returned no results!. Setting `last_page_num` back to 1"
-            )
-            last_page_num = 1
-            break
-
-        last_page_num = page_num
+    subscription_pages = fetch_subscription_pages(
+        minibc_client=minibc_client,
+        sku=skus[0],
+        start_page_num=start_page_num,
+        end_page_num=end_page_num,
+        max_workers=current_app.config["MINIBC_PAGE_FETCH_MAX_WORKERS"],
+        max_requests_per_sec=current_app.config["MINIBC_MAX_REQUESTS_PER_SEC"],
+    )
+    for page_num, subscriptions in subscription_pages:
         for subscription in subscriptions:
             if subscription["shipping_address"]["street_1"] == "":
                 logger.debug(
@@ -244,16 +317,12 @@ def find_missing_shipping(minibc_client: Minibc, skus):
                     inactive_missing_shipping_subs.append(subscriptions)
                 missing_shipping_subs.append(subscription)
 
-        logger.debug(
-            f"find_missing_shipping() => after {page_num=} sleeping for 1 second..."
-        )
         total_subs_num += len(subscriptions)
         total_subs_missing_shipping = len(missing_shipping_subs)
         total_inactive_subs_missing_shipping = len(inactive_missing_shipping_subs)
         logger.debug(
-            f"{total_subs_num=}:: {total_subs_missing_shipping=} ({total_inactive_subs_missing_shipping=})"
+            f"after {page_num=}: {total_subs_num=}:: {total_subs_missing_shipping=} ({total_inactive_subs_missing_shipping=})"
         )
-        sleep(1)
 
     logger.debug(
         f"{total_subs_num=}:: {total_subs_missing_shipping=} ({total_inactive_subs_missing_shipping=})"
@@ -287,32 +356,29 @@ def minibc_subscriptions_etl(minibc_client: Minibc, skus, load_all=False):
         )
         max_pages = 20
 
-    subscription_objs = list()
+    num_subscriptions_upserted = 0
 
-    last_page_num = start_page_num
     end_page_num = start_page_num + max_pages + 1
 
     logger.debug(
         f"search_subscriptions() => starting to paginate subscriptions and such: {start_page_num=} {end_page_num=}"
     )
 
-    for page_num in range(start_page_num, end_page_num):
-        logger.info(f"Sync at {page_num=}")
-        subscriptions = minibc_client.search_subscriptions(
-            product_sku=skus[0],
-            page_num=page_num,
-        )
-        if subscriptions is None:
-            logger.debug(
-                f"{last_page_num=} returned no results!. Setting `last_page_num` back to 1"
-            )
-            last_page_num = 1
-            break
-
-        last_page_num = page_num
-        subscription_objs += parse_subscriptions(subscriptions)
-        logger.debug(f"after {page_num=} sleeping for 1 second...")
-        sleep(1)
+    # Reset back to the first page next time around unless we stopped short of the last page
+    last_page_num = 1
+    subscription_pages = fetch_subscription_pages(
+        minibc_client=minibc_client,
+        sku=skus[0],
+        start_page_num=start_page_num,
+        end_page_num=end_page_num,
+        max_workers=current_app.config["MINIBC_PAGE_FETCH_MAX_WORKERS"],
+        max_requests_per_sec=current_app.config["MINIBC_MAX_REQUESTS_PER_SEC"],
+    )
+    with unit_of_work():
+        for page_num, subscriptions in subscription_pages:
+            num_subscriptions_upserted += parse_subscriptions(subscriptions)
+            if page_num == end_page_num - 1:
+                last_page_num = page_num
 
     if not load_all:
         logger.debug(
@@ -322,18 +388,17 @@ def minibc_subscriptions_etl(minibc_client: Minibc, skus, load_all=False):
             subscriptions_table_name, max(1, last_page_num - 1)
         )
 
-    return subscription_objs
+    return num_subscriptions_upserted
 
 
 def load_single_subscription(minibc_client: Minibc, skus, order_id):
     subscription_order = minibc_client.search_subscriptions(order_id=order_id)
     logger.debug(f"API response for {order_id=}: {subscription_order=}")
-    memberships = parse_subscriptions(
-        skus=skus,
+    num_subscriptions_upserted = parse_subscriptions(
         subscriptions=[subscription_order],
     )
-    logger.debug(f"After parsing subscription orders: {memberships=}")
-    return memberships
+    logger.debug(f"After parsing subscription orders: {num_subscriptions_upserted=}")
+    return num_subscriptions_upserted
 
 
 class MinibcError(Exception):
@@ -4,6 +4,7 @@ from social_flask_sqlalchemy import models
 from member_card.models.annual_membership import AnnualMembership
 from member_card.models.apple_device_registration import AppleDeviceRegistration
 from member_card.models.membership_card import MembershipCard
+from member_card.models.pubsub_job import PubsubJob
 from member_card.models.slack_user import SlackUser
 from member_card.models.squarespace_webhook import SquarespaceWebhook
 from member_card.models.store import Store
@@ -16,6 +17,7 @@ __all__ = (
     "AnnualMembership",
     "AppleDeviceRegistration",
     "MembershipCard",
+    "PubsubJob",
     "User",
     "Role",
     "SlackUser",
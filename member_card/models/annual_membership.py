@@ -1,6 +1,6 @@
 import logging
 import re
-from collections import OrderedDict
+from collections import Counter, OrderedDict
 from datetime import datetime, timedelta, timezone
 
 from dateutil.parser import parse
@@ -65,6 +65,8 @@ class AnnualMembership(db.Model):
     product_name = db.Column(db.String(200))
     test_mode = db.Column(db.Boolean, default=False)
     fulfillment_status = db.Column(db.String(32))
+    # Hash of the source order this membership was last loaded from; see db.get_source_fingerprint()
+    source_fingerprint = db.Column(db.String, nullable=True)
 
     def to_dict(self):
         return OrderedDict(
@@ -127,3 +129,8 @@ class AnnualMembership(db.Model):
             return False
 
         return True
+
+
+def count_memberships(memberships) -> Counter:
+    # Tallied before memberships are committed (and expired), so is_active doesn't reload each of them
+    return Counter("active" if m.is_active else "inactive" for m in memberships)
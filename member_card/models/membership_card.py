@@ -8,7 +8,7 @@ from io import BytesIO, StringIO
 import flask
 import qrcode
 from member_card.db import db, get_or_create
-from member_card.passes.gpay import generate_pass_jwt
+from member_card.passes.gpay import get_pass_jwt
 from member_card.models.annual_membership import (
     membership_card_to_membership_assoc_table,
 )
@@ -102,6 +102,15 @@ class MembershipCard(db.Model):
     # Display related attributes:
     logo_text = db.Column(db.String, default="Los Verdes")
 
+    # Google Pay object sync state (see gpay.sync_pass_object()):
+    google_pay_object_synced_at = db.Column(db.DateTime(timezone=True))
+    google_pay_object_hash = db.Column(db.String)
+
+    # Signed GPay save link JWT (see gpay.save_pass_jwt()):
+    google_pay_jwt_value = db.Column(db.Text)
+    google_pay_jwt_key = db.Column(db.String)
+    google_pay_jwt_signed_at = db.Column(db.DateTime(timezone=True))
+
     @property
     def google_pass_save_url(self):
         return f"https://pay.google.com/gp/v/save/{self.google_pay_jwt}"
@@ -122,8 +131,7 @@ class MembershipCard(db.Model):
         if self._google_pay_jwt is not None:
             return self._google_pay_jwt
 
-        google_pay_jwt = generate_pass_jwt(self)
-        self._google_pay_jwt = google_pay_jwt.decode("UTF-8")
+        self._google_pay_jwt = get_pass_jwt(self)
         return self._google_pay_jwt
 
     @property
@@ -0,0 +1,60 @@
+from member_card.db import db
+from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.sql import func
+
+JOB_STATUS_PENDING = "pending"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+JOB_STATUS_SUPERSEDED = "superseded"
+
+
+class PubsubJob(db.Model):
+    __tablename__ = "pubsub_jobs"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # Unique (when present) so concurrent redeliveries of a message can't both be enqueued; see jobs.enqueue_job()
+    message_id = db.Column(db.String)
+    # Semantic key for recognizing repeats of the same work under different Pub/Sub message IDs
+    dedup_key = db.Column(db.String, index=True)
+    # Pending jobs sharing a coalesce key are superseded by the latest one (e.g. a burst of webhooks for one order)
+    coalesce_key = db.Column(db.String, index=True)
+    # Not to be run before this point (e.g. to wait out a coalescing window); see jobs.sweep_jobs()
+    run_after = db.Column(db.DateTime(timezone=True))
+    message_type = db.Column(db.String, index=True)
+    message = db.Column(JSON)
+    status = db.Column(db.String, index=True, default=JOB_STATUS_PENDING)
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+
+    time_created = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    time_started = db.Column(db.DateTime(timezone=True))
+    time_finished = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.Index(
+            "ix_pubsub_jobs_message_id",
+            message_id,
+            unique=True,
+            postgresql_where=message_id.isnot(None),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<PubsubJob {self.id=} {self.message_type=} {self.status=}>"
+
+    def to_dict(self):
+        return dict(
+            id=self.id,
+            message_id=self.message_id,
+            dedup_key=self.dedup_key,
+            coalesce_key=self.coalesce_key,
+            run_after=self.run_after,
+            message_type=self.message_type,
+            status=self.status,
+            attempts=self.attempts,
+            error=self.error,
+            time_created=self.time_created,
+            time_started=self.time_started,
+            time_finished=self.time_finished,
+        )
@@ -6,7 +6,7 @@ from sqlalchemy.orm import relationship
 class SlackUser(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
-    slack_id = db.Column(db.String)
+    slack_id = db.Column(db.String, unique=True)
     team_id = db.Column(db.String)
     name = db.Column(db.String)
     email = db.Column(db.String, nullable=True)
@@ -18,6 +18,8 @@ class SlackUser(db.Model):
     tz_offset = db.Column(db.String)
 
     profile = db.Column(db.String)
+    # Hash of the member as last retrieved from Slack; see db.get_source_fingerprint()
+    profile_hash = db.Column(db.String, nullable=True)
 
     is_admin = db.Column(db.Boolean, nullable=False, default=False)
     is_owner = db.Column(db.Boolean, nullable=False, default=False)
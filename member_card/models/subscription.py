@@ -9,7 +9,7 @@ class Subscription(db.Model):
     __tablename__ = "subscription"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    subscription_id = db.Column(db.Integer)
+    subscription_id = db.Column(db.Integer, unique=True)
     order_id = db.Column(db.Integer)
     customer_id = db.Column(db.String(32))
     customer_first_name = db.Column(db.String(64))
@@ -24,3 +24,5 @@ class Subscription(db.Model):
     next_payment_date = db.Column(db.DateTime)
     created_time = db.Column(db.DateTime)
     last_modified = db.Column(db.DateTime)
+    # Hash of the source subscription this row was last loaded from; see db.get_source_fingerprint()
+    source_fingerprint = db.Column(db.String, nullable=True)
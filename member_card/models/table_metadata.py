@@ -1,5 +1,5 @@
 from member_card.db import db, get_or_create
-from datetime import datetime
+from datetime import datetime, timezone
 
 
 def get_last_run_start_time(table_name):
@@ -68,6 +68,39 @@ def set_last_run_start_page(table_name, last_run_start_page):
     db.session.commit()
 
 
+def get_last_date_modified(table_name):
+    from member_card.models import TableMetadata
+
+    instance = (
+        db.session.query(TableMetadata)
+        .filter_by(
+            table_name=table_name,
+            attribute_name="last_date_modified",
+        )
+        .first()
+    )
+    if instance:
+        return datetime.fromtimestamp(float(instance.attribute_value), tz=timezone.utc)
+
+    return None
+
+
+def set_last_date_modified(table_name, last_date_modified):
+    from member_card.models import TableMetadata
+
+    cursor_metadata = get_or_create(
+        session=db.session,
+        model=TableMetadata,
+        **dict(
+            table_name=table_name,
+            attribute_name="last_date_modified",
+        ),
+    )
+    setattr(cursor_metadata, "attribute_value", str(last_date_modified.timestamp()))
+    # Left for the caller to commit, so the cursor only ever moves along with the records it covers
+    db.session.add(cursor_metadata)
+
+
 class TableMetadata(db.Model):
     __tablename__ = "table_metadata"
     table_name = db.Column(db.String, primary_key=True)
@@ -1,6 +1,9 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import timedelta
 import logging
-from member_card.db import db, get_or_create
+from typing import Optional
+from member_card.db import checkpoint, db, get_or_create
 from sqlalchemy.orm import relationship, backref
 from flask_security import UserMixin, RoleMixin
 
@@ -8,6 +11,10 @@ from flask_security import SQLAlchemySessionUserDatastore
 
 logger = logging.getLogger(__name__)
 
+_current_user_index: ContextVar[Optional["UserIndex"]] = ContextVar(
+    "current_user_index", default=None
+)
+
 
 def edit_user_name(user, new_first_name, new_last_name):
     logger.info(
@@ -22,6 +29,103 @@ def edit_user_name(user, new_first_name, new_last_name):
     return user
 
 
+class UserIndex(object):
+    """ETL-scoped lookup of users by lowercased email address and bigcommerce_id.
+
+    Loaded with a single query on first use; callers that create users or change either key must add() / reindex()
+    them.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._users_by_email = None
+        self._users_by_bigcommerce_id = None
+        self._keys_by_user = None
+        self._expire_on_commit = None
+
+    def load(self):
+        users = self.session.query(User).order_by(User.id).all()
+        logger.debug(f"UserIndex loaded {len(users)} users")
+        self._users_by_email = {}
+        self._users_by_bigcommerce_id = {}
+        self._keys_by_user = {}
+        for user in users:
+            self.add(user)
+
+        # Indexed users would otherwise be expired (and individually re-SELECTed) after every commit
+        session = self.session() if callable(self.session) else self.session
+        self._expire_on_commit = session.expire_on_commit
+        session.expire_on_commit = False
+
+    def close(self):
+        if self._expire_on_commit is not None:
+            session = self.session() if callable(self.session) else self.session
+            session.expire_on_commit = self._expire_on_commit
+
+    @property
+    def is_loaded(self):
+        return self._keys_by_user is not None
+
+    def get_by_email(self, email):
+        if not self.is_loaded:
+            self.load()
+        if email is None:
+            return None
+        return self._users_by_email.get(email.lower())
+
+    def get_by_bigcommerce_id(self, bigcommerce_id):
+        if not self.is_loaded:
+            self.load()
+        if bigcommerce_id is None:
+            return None
+        return self._users_by_bigcommerce_id.get(bigcommerce_id)
+
+    def add(self, user):
+        if not self.is_loaded:
+            self.load()
+        email_key = None if user.email is None else user.email.lower()
+        bigcommerce_id_key = user.bigcommerce_id
+        # Like the `.first()` queries this replaces, the earliest matching user wins
+        if email_key is not None:
+            self._users_by_email.setdefault(email_key, user)
+        if bigcommerce_id_key is not None:
+            self._users_by_bigcommerce_id.setdefault(bigcommerce_id_key, user)
+        self._keys_by_user[id(user)] = (email_key, bigcommerce_id_key)
+
+    def reindex(self, user):
+        if not self.is_loaded:
+            self.load()
+        email_key, bigcommerce_id_key = self._keys_by_user.pop(id(user), (None, None))
+        if self._users_by_email.get(email_key) is user:
+            del self._users_by_email[email_key]
+        if self._users_by_bigcommerce_id.get(bigcommerce_id_key) is user:
+            del self._users_by_bigcommerce_id[bigcommerce_id_key]
+        self.add(user)
+
+    def __len__(self):
+        return len(self._keys_by_user or {})
+
+
+def get_user_index() -> Optional[UserIndex]:
+    return _current_user_index.get()
+
+
+@contextmanager
+def user_index(session=None):
+    """Resolve users from an in-memory UserIndex for the duration of an ETL run, joining the current one if active."""
+    if (active_user_index := _current_user_index.get()) is not None:
+        yield active_user_index
+        return
+
+    index = UserIndex(session=db.session if session is None else session)
+    token = _current_user_index.set(index)
+    try:
+        yield index
+    finally:
+        _current_user_index.reset(token)
+        index.close()
+
+
 def ensure_user(
     email,
     first_name=None,
@@ -30,11 +134,19 @@ def ensure_user(
     password=None,
     bigcommerce_id=None,
 ):
-    user = get_or_create(
-        session=db.session,
-        model=User,
-        email=email,
-    )
+    index = get_user_index()
+    if index is not None and email is not None:
+        user = index.get_by_email(email)
+        if user is None:
+            logger.debug(f"Creating User with {email=}")
+            user = User(email=email)
+            index.add(user)
+    else:
+        user = get_or_create(
+            session=db.session,
+            model=User,
+            email=email,
+        )
 
     log_extra = dict(
         email=email,
@@ -75,9 +187,12 @@ def ensure_user(
     if bigcommerce_id is not None:
         logger.debug(f"Setting bigcommerce_id for {user=} => {bigcommerce_id=}")
         setattr(user, "bigcommerce_id", bigcommerce_id)
+        if index is not None:
+            index.reindex(user)
 
     db.session.add(user)
-    db.session.commit()
+    # When running within an ETL's unit of work, this only flushes (so `user.id` is populated) rather than committing
+    checkpoint(num_records=0, flush=True)
     return user
 
 
@@ -1,17 +1,31 @@
+import hashlib
+import json
 import logging
-import tempfile
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
 from os.path import join
+from threading import Lock
+from typing import Dict, Optional, Tuple
 
 import flask
 from flask import current_app
+from google.api_core.exceptions import NotFound
 from member_card.db import db
-from member_card.passes.apple_wallet import tmp_apple_developer_key
-from member_card.gcp import upload_file_to_gcs, get_bucket
+from member_card.passes.apple_wallet import get_apple_developer_key_filepath
+from member_card.gcp import upload_data_to_gcs, get_bucket
 from member_card.utils import sign
 from wallet.models import Barcode, BarcodeFormat, Generic, Pass
 
 logger = logging.getLogger(__name__)
 
+REMOTE_APPLE_PASS_CACHE_BASE_PATH = "membership-cards/apple-pass-cache"
+# Bump this to invalidate all previously cached pkpass files (e.g., when create_passfile() output changes)
+APPLE_PASS_CACHE_VERSION = 1
+
+_apple_pass_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_apple_pass_cache_lock = Lock()
+
 
 class MemberCardPass(object):
     header = "Los Verdes Membership Card"
@@ -268,6 +282,15 @@ class GooglePayPassObject(object):
         return payload
 
 
+@lru_cache()
+def load_passfile_files(static_dir: str) -> Dict[str, bytes]:
+    passfile_files = {}
+    for passfile_filename, local_filename in AppleWalletPass.passfile_files.items():
+        with open(join(static_dir, local_filename), "rb") as f:
+            passfile_files[passfile_filename] = f.read()
+    return passfile_files
+
+
 def create_passfile(membership_card):
     pass_info = Generic()
     pass_info.addPrimaryField("name", membership_card.user.fullname, "Member Name")
@@ -324,12 +347,9 @@ def create_passfile(membership_card):
 
     # Including the icon and logo is necessary for the passbook to be valid.
     static_dir = join(current_app.config["BASE_DIR"], "static")
-    for passfile_filename, local_filename in AppleWalletPass.passfile_files.items():
-        file_path = join(static_dir, local_filename)
-        logger.debug(
-            f"adding {file_path} as pass file: {passfile_filename}", extra=log_extra
-        )
-        passfile.addFile(passfile_filename, open(file_path, "rb"))
+    for passfile_filename, file_data in load_passfile_files(static_dir).items():
+        logger.debug(f"adding pass file: {passfile_filename}", extra=log_extra)
+        passfile.addFile(passfile_filename, BytesIO(file_data))
 
     logger.debug(
         f"Pass() for {membership_card.apple_pass_serial_number} ({str(membership_card.serial_number)}) successfully created!",
@@ -338,7 +358,7 @@ def create_passfile(membership_card):
     return passfile
 
 
-def create_pkpass(membership_card, key_filepath, key_password, pkpass_out_path=None):
+def create_pkpass(membership_card, key_filepath, key_password):
     serial_number = membership_card.id
     cert_dir = join(current_app.config["BASE_DIR"], "certificates")
     cert_filepath = join(cert_dir, "certificate.pem")
@@ -358,46 +378,147 @@ def create_pkpass(membership_card, key_filepath, key_password, pkpass_out_path=N
         extra=log_extra,
     )
     passfile = create_passfile(membership_card)
-    pkpass_string_buffer = passfile.create(
+    pkpass_buffer = passfile.create(
         certificate=cert_filepath,
         key=key_filepath,
         wwdr_certificate=wwdr_cert_filepath,
         password=key_password,
-        zip_file=pkpass_out_path,
+        zip_file=BytesIO(),
+    )
+    return pkpass_buffer
+
+
+@lru_cache()
+def hash_files(file_paths: Tuple[str, ...]) -> str:
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_apple_pass_cache_key(membership_card) -> str:
+    cert_dir = join(current_app.config["BASE_DIR"], "certificates")
+    static_dir = join(current_app.config["BASE_DIR"], "static")
+    pass_fields = dict(
+        cache_version=APPLE_PASS_CACHE_VERSION,
+        signing_cert_version=hash_files(
+            (join(cert_dir, "certificate.pem"), join(cert_dir, "wwdr.pem"))
+        ),
+        static_files_version=hashlib.sha256(
+            b"".join(load_passfile_files(static_dir).values())
+        ).hexdigest(),
+        fullname=membership_card.user.fullname,
+        membership_expiry=membership_card.user.membership_expiry,
+        serial_number=membership_card.serial_number_hex,
+        apple_pass_serial_number=membership_card.apple_pass_serial_number,
+        pass_type_identifier=membership_card.apple_pass_type_identifier,
+        organization_name=membership_card.apple_organization_name,
+        team_identifier=membership_card.apple_team_identifier,
+        logo_text=membership_card.logo_text,
+        qr_code_message=membership_card.qr_code_message,
+        web_service_url=membership_card.web_service_url,
+        authentication_token=sign(membership_card.authentication_token_hex),
+        expiration_date=membership_card.apple_pass_expiry_timestamp,
+        voided=membership_card.is_voided,
+        user_info=membership_card.user.to_dict(),
     )
-    return pkpass_string_buffer
+    pass_fields_json = json.dumps(pass_fields, sort_keys=True, default=str)
+    return hashlib.sha256(pass_fields_json.encode("utf-8")).hexdigest()
+
+
+def get_locally_cached_apple_pass(cache_key: str) -> Optional[bytes]:
+    with _apple_pass_cache_lock:
+        if cache_key not in _apple_pass_cache:
+            return None
+        _apple_pass_cache.move_to_end(cache_key)
+        return _apple_pass_cache[cache_key]
+
+
+def cache_apple_pass_locally(cache_key: str, pkpass_data: bytes) -> None:
+    max_entries = current_app.config["APPLE_PASS_CACHE_MAX_ENTRIES"]
+    with _apple_pass_cache_lock:
+        _apple_pass_cache[cache_key] = pkpass_data
+        _apple_pass_cache.move_to_end(cache_key)
+        while len(_apple_pass_cache) > max_entries:
+            _apple_pass_cache.popitem(last=False)
+
+
+def download_cached_apple_pass(remote_path) -> Optional[bytes]:
+    try:
+        return get_bucket().blob(remote_path).download_as_bytes()
+    except NotFound:
+        return None
+    except Exception as err:
+        logger.warning(f"Unable to retrieve cached pkpass from {remote_path=}: {err}")
+        return None
+
+
+def upload_cached_apple_pass(pkpass_data, remote_path) -> None:
+    try:
+        upload_data_to_gcs(
+            bucket=get_bucket(),
+            data=pkpass_data,
+            remote_path=remote_path,
+            content_type="application/vnd.apple.pkpass",
+        )
+    except Exception as err:
+        logger.warning(f"Unable to upload cached pkpass to {remote_path=}: {err}")
 
 
-def get_apple_pass_from_card(membership_card):
+def get_apple_pass_from_card(membership_card) -> bytes:
     db.session.add(membership_card)
     db.session.commit()
 
-    _, pkpass_out_path = tempfile.mkstemp()
-    with tmp_apple_developer_key() as key_filepath:
-        create_pkpass(
+    # Passes are cached by a hash of everything that goes into them; thus we only sign a new pass
+    # when the card (or our signing certificate) has actually changed.
+    cache_key = get_apple_pass_cache_key(membership_card)
+    remote_pkpass_path = f"{REMOTE_APPLE_PASS_CACHE_BASE_PATH}/{membership_card.apple_pass_serial_number}-{cache_key}.pkpass"
+    log_extra = dict(
+        cache_key=cache_key,
+        remote_pkpass_path=remote_pkpass_path,
+    )
+
+    if (pkpass_data := get_locally_cached_apple_pass(cache_key)) is not None:
+        logger.debug(f"Using locally cached pkpass: {cache_key=}", extra=log_extra)
+        return pkpass_data
+
+    gcs_cache_enabled = current_app.config["APPLE_PASS_CACHE_GCS_ENABLED"]
+    if gcs_cache_enabled:
+        pkpass_data = download_cached_apple_pass(remote_path=remote_pkpass_path)
+
+    if pkpass_data is not None:
+        logger.debug(f"Using GCS-cached pkpass: {remote_pkpass_path}", extra=log_extra)
+    else:
+        logger.info(f"Generating new pkpass: {cache_key=}", extra=log_extra)
+        pkpass_data = create_pkpass(
             membership_card=membership_card,
-            key_filepath=key_filepath,
+            key_filepath=get_apple_developer_key_filepath(),
             key_password=flask.current_app.config["APPLE_PASS_PRIVATE_KEY_PASSWORD"],
-            pkpass_out_path=pkpass_out_path,
-        )
-    return pkpass_out_path
+        ).getvalue()
+        if gcs_cache_enabled:
+            upload_cached_apple_pass(
+                pkpass_data=pkpass_data, remote_path=remote_pkpass_path
+            )
+
+    cache_apple_pass_locally(cache_key, pkpass_data)
+    return pkpass_data
 
 
 def generate_and_upload_apple_pass(membership_card):
-    local_apple_pass_path = get_apple_pass_from_card(membership_card)
+    apple_pass_data = get_apple_pass_from_card(membership_card)
     remote_apple_pass_path = f"membership-cards/apple-passes/{membership_card.apple_pass_serial_number}.pkpass"
-    blob = upload_file_to_gcs(
+    blob = upload_data_to_gcs(
         bucket=get_bucket(),
-        local_file=local_apple_pass_path,
+        data=apple_pass_data,
         remote_path=remote_apple_pass_path,
         content_type="application/vnd.apple.pkpass",
     )
     apple_pass_url = f"{blob.bucket.id}/{remote_apple_pass_path}"
     logger.info(
-        f"{local_apple_pass_path=} uploaded for {membership_card.apple_pass_serial_number} ({str(membership_card.serial_number)})",
+        f"pkpass uploaded for {membership_card.apple_pass_serial_number} ({str(membership_card.serial_number)})",
         extra=dict(
             bucket=str(blob.bucket),
-            local_apple_pass_path=local_apple_pass_path,
             remote_apple_pass_path=remote_apple_pass_path,
             apple_pass_url=apple_pass_url,
             blob=str(blob),
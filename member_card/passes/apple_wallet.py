@@ -1,27 +1,50 @@
+import atexit
 import logging
 import os
 import tempfile
 from contextlib import contextmanager
+from threading import Lock
+from typing import Optional
 
 from flask import current_app
 
 logger = logging.getLogger(__name__)
 
+_stashed_key_filepath: Optional[str] = None
+_stashed_key_lock = Lock()
 
-@contextmanager
-def tmp_apple_developer_key():
+
+def remove_stashed_apple_developer_key() -> None:
+    global _stashed_key_filepath
+    with _stashed_key_lock:
+        if _stashed_key_filepath is not None:
+            os.remove(_stashed_key_filepath)
+            _stashed_key_filepath = None
+
+
+def get_apple_developer_key_filepath() -> str:
     key_filepath = current_app.config["APPLE_KEY_FILEPATH"]
     if os.path.exists(key_filepath):
-        yield key_filepath
-        return
-
-    unformatted_key = current_app.config.get("APPLE_DEVELOPER_PRIVATE_KEY")
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".key") as key_fp:
-        logger.info(
-            f"Stashing Apple developer key under a temporary file {key_fp.name=}"
-        )
-        formatted_key = "\n".join(unformatted_key.split("\\n"))
-        key_fp.write(formatted_key)
-        key_fp.seek(0)
-        yield key_fp.name
-        return
+        return key_filepath
+
+    # openssl wants the signing key as a file, so we stash it under a temporary file once per process
+    global _stashed_key_filepath
+    with _stashed_key_lock:
+        if _stashed_key_filepath is None:
+            unformatted_key = current_app.config.get("APPLE_DEVELOPER_PRIVATE_KEY")
+            key_fd, stashed_key_filepath = tempfile.mkstemp(suffix=".key")
+            logger.info(
+                f"Stashing Apple developer key under a temporary file {stashed_key_filepath=}"
+            )
+            with os.fdopen(key_fd, "w") as key_fp:
+                key_fp.write("\n".join(unformatted_key.split("\\n")))
+            _stashed_key_filepath = stashed_key_filepath
+        return _stashed_key_filepath
+
+
+atexit.register(remove_stashed_apple_developer_key)
+
+
+@contextmanager
+def tmp_apple_developer_key():
+    yield get_apple_developer_key_filepath()
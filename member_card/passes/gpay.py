@@ -1,5 +1,10 @@
+import hashlib
+import json
 import logging
 import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Tuple
 
 from flask import current_app
 from google.auth import crypt as crypt_google
@@ -7,6 +12,7 @@ from google.auth import jwt as jwt_google
 from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
 
+from member_card.db import db
 from member_card.passes import GooglePayPassClass, GooglePayPassObject
 
 logger = logging.getLogger(__name__)
@@ -18,6 +24,32 @@ For an example, see https://developers.google.com/pay/passes/guides/get-started/
 NOT_EXIST_MESSAGE = "Will be inserted when user saves by link/button for first time\n"
 
 
+@lru_cache()
+def get_signer(service_account_file: str) -> crypt_google.RSASigner:
+    logger.debug(f"Loading GPay JWT signer from {service_account_file=}")
+    return crypt_google.RSASigner.from_service_account_file(service_account_file)
+
+
+@lru_cache()
+def get_credentials(
+    service_account_file: str, scopes: Tuple[str, ...]
+) -> service_account.Credentials:
+    logger.debug(f"Loading GPay API credentials from {service_account_file=}")
+    return service_account.Credentials.from_service_account_file(
+        service_account_file,
+        scopes=scopes,
+    )
+
+
+@lru_cache()
+def get_authorized_session(
+    service_account_file: str, scopes: Tuple[str, ...]
+) -> AuthorizedSession:
+    # AuthorizedSession refreshes its credentials' access token as needed and, being a
+    # requests.Session, keeps a pool of connections to the Wallet API around between calls
+    return AuthorizedSession(get_credentials(service_account_file, scopes))
+
+
 class GooglePassJwt(object):
     def __init__(
         self,
@@ -35,9 +67,7 @@ class GooglePassJwt(object):
         self.payload = {}
 
         # signer for rsa-sha256. uses same private key used in o_auth2.0
-        self.signer = crypt_google.RSASigner.from_service_account_file(
-            service_account_file
-        )
+        self.signer = get_signer(service_account_file)
 
     def add_loyalty_class(self, resource_payload):
         self.payload.setdefault("loyaltyClasses", [])
@@ -74,11 +104,8 @@ class GooglePayApiClient(object):
     }
 
     def __init__(self, service_account_file, scopes):
-        self._credentials = service_account.Credentials.from_service_account_file(
-            service_account_file,
-            scopes=scopes,
-        )
-        self._session = AuthorizedSession(self._credentials)
+        self._credentials = get_credentials(service_account_file, tuple(scopes))
+        self._session = get_authorized_session(service_account_file, tuple(scopes))
 
     ###############################
     #
@@ -265,6 +292,22 @@ class GooglePayApiClient(object):
             vertical_type=vertical_type,
         )
 
+    def patch_object(self, object_id, payload, vertical_type="loyalty"):
+        logger.debug(
+            f"Making REST call to patch object {object_id=}",
+            extra=dict(
+                object_id=object_id, payload=payload, vertical_type=vertical_type
+            ),
+        )
+
+        return self.request(
+            method="patch",
+            resource_type="object",
+            resource_id=object_id,
+            json_payload=payload,
+            vertical_type=vertical_type,
+        )
+
 
 def modify_pass_class(pass_class=GooglePayPassClass, operation="patch"):
     class_id = current_app.config["GOOGLE_PAY_PASS_CLASS_ID"]
@@ -298,9 +341,78 @@ def new_google_pass_jwt():
     )
 
 
-def generate_pass_jwt(membership_card):
+def get_pass_object_payload(membership_card):
+    class_id = current_app.config["GOOGLE_PAY_PASS_CLASS_ID"]
+    return GooglePayPassObject(class_id, membership_card).to_dict()
+
+
+def hash_pass_object_payload(pass_object_payload):
+    payload_json = json.dumps(pass_object_payload, sort_keys=True)
+    return hashlib.sha256(payload_json.encode("utf-8")).hexdigest()
+
+
+def pass_object_needs_sync(membership_card):
+    pass_object_payload = get_pass_object_payload(membership_card)
+    payload_hash = hash_pass_object_payload(pass_object_payload)
+    return membership_card.google_pay_object_hash != payload_hash
+
+
+def sync_pass_object(membership_card):
+    """Insert (or patch, if it already exists) the card's pass object via the Wallet API.
+
+    Safe to call repeatedly: cards whose pass object matches what was last synced are skipped.
+    """
+    pass_object_payload = get_pass_object_payload(membership_card)
+    object_id = pass_object_payload["id"]
+    payload_hash = hash_pass_object_payload(pass_object_payload)
+    log_extra = dict(
+        object_id=object_id,
+        payload_hash=payload_hash,
+        serial_number=str(membership_card.serial_number),
+        user_email=membership_card.user.email,
+    )
+    if membership_card.google_pay_object_hash == payload_hash:
+        logger.debug(
+            f"GPay pass object {object_id=} already in sync, skipping...",
+            extra=log_extra,
+        )
+        return None
+
     gpay_client = new_client()
+    response = gpay_client.insert_object(
+        object_id=object_id,
+        payload=pass_object_payload,
+    )
+    if response.status_code == 409:
+        logger.debug(
+            f"GPay pass object {object_id=} already exists, patching instead...",
+            extra=log_extra,
+        )
+        response = gpay_client.patch_object(
+            object_id=object_id,
+            payload=pass_object_payload,
+        )
+    log_extra.update(
+        dict(status_code=response.status_code, response_body=response.text)
+    )
+    logger.debug(
+        f"Sync object response {response.status_code}: {response.text}",
+        extra=log_extra,
+    )
+    response.raise_for_status()
+
+    setattr(membership_card, "google_pay_object_hash", payload_hash)
+    setattr(
+        membership_card, "google_pay_object_synced_at", datetime.now(tz=timezone.utc)
+    )
+    db.session.add(membership_card)
+    db.session.commit()
+    logger.info(f"GPay pass object {object_id=} synced", extra=log_extra)
+    return response
 
+
+def generate_pass_jwt(membership_card):
+    # Only signs locally; the Wallet API pass object itself is kept up to date by the worker (see sync_pass_object())
     class_id = current_app.config["GOOGLE_PAY_PASS_CLASS_ID"]
 
     pass_class_payload = GooglePayPassClass(class_id).to_dict()
@@ -316,23 +428,6 @@ def generate_pass_jwt(membership_card):
         user_email=membership_card.user.email,
     )
     logger.debug(f"pass_object_payload => {object_id=}", extra=log_extra)
-    # TODO: if this insert returns a 409, do we need to do a patch/update request in response?
-    insert_object_response = gpay_client.insert_object(
-        object_id=object_id,
-        payload=pass_object_payload,
-    )
-    response_body = insert_object_response.text
-    log_extra.update(
-        dict(
-            insert_object_response=insert_object_response,
-            response_body=response_body,
-        )
-    )
-
-    logger.debug(
-        f"Insert object response {insert_object_response.status_code}: {response_body}",
-        extra=log_extra,
-    )
 
     logger.debug(
         f"Generating 'skinny' GPay pass JWT for {pass_object.account_id}...",
@@ -352,3 +447,70 @@ def generate_pass_jwt(membership_card):
 
     # See https://developers.google.com/pay/passes/guides/get-started/implementing-the-api/save-to-google-pay#add-link-to-email
     return signed_jwt
+
+
+def get_pass_jwt_cache_key(membership_card):
+    class_id = current_app.config["GOOGLE_PAY_PASS_CLASS_ID"]
+    key_parts = dict(
+        audience=current_app.config["GOOGLE_PAY_AUDIENCE"],
+        jwt_type=current_app.config["GOOGLE_PAY_JWT_TYPE"],
+        iss=current_app.config["GOOGLE_PAY_SERVICE_ACCOUNT_EMAIL_ADDRESS"],
+        origins=current_app.config["GOOGLE_PAY_ORIGINS"],
+        pass_class=GooglePayPassClass(class_id).to_dict(),
+        pass_object=get_pass_object_payload(membership_card),
+    )
+    key_parts_json = json.dumps(key_parts, sort_keys=True)
+    return hashlib.sha256(key_parts_json.encode("utf-8")).hexdigest()
+
+
+def get_current_pass_jwt(membership_card, cache_key):
+    max_age = timedelta(seconds=current_app.config["GOOGLE_PAY_JWT_MAX_AGE_SECS"])
+    signed_at = membership_card.google_pay_jwt_signed_at
+    if (
+        membership_card.google_pay_jwt_value
+        and membership_card.google_pay_jwt_key == cache_key
+        and signed_at is not None
+        and datetime.now(tz=timezone.utc) - signed_at < max_age
+    ):
+        logger.debug(
+            f"Reusing GPay pass JWT signed at {signed_at} ({cache_key=})",
+            extra=dict(
+                cache_key=cache_key,
+                signed_at=signed_at,
+                serial_number=str(membership_card.serial_number),
+            ),
+        )
+        return membership_card.google_pay_jwt_value
+    return None
+
+
+def get_pass_jwt(membership_card):
+    """Return a signed save link JWT for this card, reusing the card's persisted JWT when still current.
+
+    Nothing is persisted here (this is reached while rendering); see save_pass_jwt().
+    """
+    cache_key = get_pass_jwt_cache_key(membership_card)
+    if current_jwt := get_current_pass_jwt(membership_card, cache_key):
+        return current_jwt
+    return generate_pass_jwt(membership_card).decode("UTF-8")
+
+
+def save_pass_jwt(membership_card):
+    """Sign (only if needed) and persist this card's save link JWT so later requests can reuse it."""
+    cache_key = get_pass_jwt_cache_key(membership_card)
+    if current_jwt := get_current_pass_jwt(membership_card, cache_key):
+        return current_jwt
+
+    signed_jwt = generate_pass_jwt(membership_card).decode("UTF-8")
+    setattr(membership_card, "google_pay_jwt_value", signed_jwt)
+    setattr(membership_card, "google_pay_jwt_key", cache_key)
+    setattr(membership_card, "google_pay_jwt_signed_at", datetime.now(tz=timezone.utc))
+    db.session.add(membership_card)
+    db.session.commit()
+    logger.debug(
+        f"Persisted newly signed GPay pass JWT ({cache_key=})",
+        extra=dict(
+            cache_key=cache_key, serial_number=str(membership_card.serial_number)
+        ),
+    )
+    return signed_jwt
@@ -0,0 +1,279 @@
+"""Long-lived headless Chrome instances that render HTML via the Chrome DevTools Protocol (CDP)."""
+import base64
+import json
+import logging
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from itertools import count
+from queue import Empty, LifoQueue
+from tempfile import mkdtemp
+from threading import BoundedSemaphore
+from time import monotonic, sleep
+from typing import Iterator, List, Optional, Tuple
+
+import requests
+from websocket import create_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHROME_FLAGS = [
+    "--no-sandbox",
+    "--hide-scrollbars",
+    "--no-first-run",
+    "--no-default-browser-check",
+]
+# Searched for on the PATH (in order) when no Chrome executable is configured
+CHROME_EXECUTABLE_NAMES = [
+    "google-chrome",
+    "google-chrome-stable",
+    "chromium",
+    "chromium-browser",
+    "chrome",
+]
+
+
+class ChromeRendererError(Exception):
+    pass
+
+
+def find_chrome_executable(executable: Optional[str] = None) -> str:
+    """Returns the configured Chrome executable, else the first of CHROME_EXECUTABLE_NAMES found on the PATH."""
+    if executable:
+        return executable
+    for executable_name in CHROME_EXECUTABLE_NAMES:
+        if executable_path := shutil.which(executable_name):
+            return executable_path
+    raise ChromeRendererError(
+        f"No Chrome executable configured or found on the PATH (tried {CHROME_EXECUTABLE_NAMES})"
+    )
+
+
+class ChromeRenderer(object):
+    # ref: https://chromedevtools.github.io/devtools-protocol/
+
+    def __init__(
+        self,
+        executable: Optional[str] = None,
+        flags: Optional[List[str]] = None,
+        max_renders: int = 100,
+        timeout_secs: float = 30.0,
+    ) -> None:
+        self.executable = executable
+        self.flags = flags if flags is not None else DEFAULT_CHROME_FLAGS
+        self.max_renders = max_renders
+        self.timeout_secs = timeout_secs
+        self.num_renders = 0
+
+        self._proc: Optional[subprocess.Popen] = None
+        self._ws = None
+        self._work_dir: Optional[str] = None
+        self._message_ids = count(1)
+        self._load_event_fired = False
+
+    def __repr__(self) -> str:
+        pid = self._proc.pid if self._proc is not None else None
+        return f"<ChromeRenderer {pid=} num_renders={self.num_renders}>"
+
+    @property
+    def is_running(self) -> bool:
+        return (
+            self._proc is not None
+            and self._proc.poll() is None
+            and self._ws is not None
+            and self._ws.connected
+        )
+
+    @property
+    def needs_recycling(self) -> bool:
+        return self.num_renders >= self.max_renders
+
+    def start(self) -> None:
+        self._work_dir = mkdtemp(prefix="chrome-renderer-")
+        user_data_dir = os.path.join(self._work_dir, "user-data")
+        command = [
+            find_chrome_executable(self.executable),
+            "--headless",
+            # Port 0 => Chrome picks a free port and reports it via DevToolsActivePort
+            "--remote-debugging-port=0",
+            "--remote-allow-origins=*",
+            f"--user-data-dir={user_data_dir}",
+            *self.flags,
+            "about:blank",
+        ]
+        logger.info(f"Starting headless Chrome renderer: {command=}")
+        self._proc = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self._ws = create_connection(
+            self._get_page_ws_url(user_data_dir),
+            timeout=self.timeout_secs,
+        )
+        self.num_renders = 0
+        # "Enabling" the page domain gets us Page.loadEventFired events
+        self.send("Page.enable")
+        logger.info(f"Started headless Chrome renderer: {self}")
+
+    def _get_page_ws_url(self, user_data_dir: str) -> str:
+        active_port_path = os.path.join(user_data_dir, "DevToolsActivePort")
+        deadline = monotonic() + self.timeout_secs
+        while monotonic() < deadline:
+            if self._proc.poll() is not None:
+                raise ChromeRendererError(
+                    f"Chrome exited during startup ({self._proc.returncode=})"
+                )
+            if os.path.exists(active_port_path):
+                with open(active_port_path) as f:
+                    cdp_port = f.readline().strip()
+                if cdp_port:
+                    targets = requests.get(
+                        f"http://127.0.0.1:{cdp_port}/json/list", timeout=5
+                    ).json()
+                    for target in targets:
+                        if target.get("type") == "page":
+                            return target["webSocketDebuggerUrl"]
+            sleep(0.1)
+        raise ChromeRendererError(
+            f"Timed out after {self.timeout_secs}s waiting on Chrome DevTools endpoint"
+        )
+
+    def _recv(self, deadline: float) -> dict:
+        if monotonic() > deadline:
+            raise ChromeRendererError(
+                f"Timed out after {self.timeout_secs}s waiting on Chrome DevTools response"
+            )
+        message = json.loads(self._ws.recv())
+        if message.get("method") == "Page.loadEventFired":
+            self._load_event_fired = True
+        return message
+
+    def send(self, method: str, **params) -> dict:
+        message_id = next(self._message_ids)
+        self._ws.send(json.dumps(dict(id=message_id, method=method, params=params)))
+        deadline = monotonic() + self.timeout_secs
+        while (message := self._recv(deadline)).get("id") != message_id:
+            continue
+        if "error" in message:
+            raise ChromeRendererError(f"{method} failed: {message['error']}")
+        return message.get("result", {})
+
+    def is_healthy(self) -> bool:
+        if not self.is_running:
+            return False
+        try:
+            result = self.send("Runtime.evaluate", expression="1 + 1")
+            return result["result"]["value"] == 2
+        except Exception as err:
+            logger.warning(f"Health check failed for {self}: {err}")
+            return False
+
+    def render(self, html_content: str, size: Tuple[int, int]) -> bytes:
+        width, height = size
+        html_path = os.path.join(self._work_dir, "render.html")
+        with open(html_path, "w") as f:
+            f.write(html_content)
+
+        self.send(
+            "Emulation.setDeviceMetricsOverride",
+            width=width,
+            height=height,
+            deviceScaleFactor=1,
+            mobile=False,
+        )
+
+        self._load_event_fired = False
+        navigate_result = self.send("Page.navigate", url=f"file://{html_path}")
+        if error_text := navigate_result.get("errorText"):
+            raise ChromeRendererError(f"Unable to load {html_path=}: {error_text}")
+        deadline = monotonic() + self.timeout_secs
+        while not self._load_event_fired:
+            self._recv(deadline)
+
+        screenshot = self.send("Page.captureScreenshot", format="png")
+        self.num_renders += 1
+        return base64.b64decode(screenshot["data"])
+
+    def close(self) -> None:
+        logger.info(f"Closing headless Chrome renderer: {self}")
+        if self._ws is not None:
+            try:
+                if self.is_running:
+                    self.send("Browser.close")
+                self._ws.close()
+            except Exception as err:
+                logger.debug(
+                    f"Unable to cleanly close CDP connection for {self}: {err}"
+                )
+            self._ws = None
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+
+
+class ChromeRendererPool(object):
+    def __init__(
+        self,
+        size: int = 1,
+        max_renders: int = 100,
+        timeout_secs: float = 30.0,
+        executable: Optional[str] = None,
+        flags: Optional[List[str]] = None,
+    ) -> None:
+        self.size = size
+        self.renderer_kwargs = dict(
+            executable=executable,
+            flags=flags,
+            max_renders=max_renders,
+            timeout_secs=timeout_secs,
+        )
+        self._slots = BoundedSemaphore(size)
+        self._idle_renderers: LifoQueue = LifoQueue()
+
+    @contextmanager
+    def renderer(self) -> Iterator[ChromeRenderer]:
+        with self._slots:
+            try:
+                renderer = self._idle_renderers.get_nowait()
+            except Empty:
+                renderer = None
+
+            if renderer is not None and (
+                renderer.needs_recycling or not renderer.is_healthy()
+            ):
+                logger.info(f"Recycling headless Chrome renderer: {renderer}")
+                renderer.close()
+                renderer = None
+
+            try:
+                if renderer is None:
+                    renderer = ChromeRenderer(**self.renderer_kwargs)
+                    renderer.start()
+                yield renderer
+            except Exception:
+                # Whatever state the browser is in at this point, we don't want to hand it out again
+                if renderer is not None:
+                    renderer.close()
+                raise
+
+            self._idle_renderers.put(renderer)
+
+    def render(self, html_content: str, size: Tuple[int, int]) -> bytes:
+        with self.renderer() as renderer:
+            return renderer.render(html_content=html_content, size=size)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle_renderers.get_nowait().close()
+            except Empty:
+                break
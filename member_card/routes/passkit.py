@@ -2,6 +2,7 @@ import logging
 import re
 from datetime import timezone
 from functools import wraps
+from io import BytesIO
 from uuid import UUID
 
 from dateutil.parser import parse
@@ -293,7 +294,7 @@ def passkit_get_latest_version_of_pass(membership_card_pass, device_library_iden
         extra=log_extra,
     )
 
-    pkpass_out_path = get_apple_pass_from_card(
+    pkpass_data = get_apple_pass_from_card(
         membership_card=membership_card_pass,
     )
     logger.info(
@@ -301,7 +302,7 @@ def passkit_get_latest_version_of_pass(membership_card_pass, device_library_iden
         extra=log_extra,
     )
     return send_file(
-        pkpass_out_path,
+        BytesIO(pkpass_data),
         attachment_filename=attachment_filename,
         mimetype="application/vnd.apple.pkpass",
         as_attachment=True,
@@ -1,14 +1,24 @@
 import json
 import logging
 from time import sleep
+from typing import Iterator, List
 
 # from codetiming import Timer
 from flask import current_app
 from slack_sdk import WebClient
-
-from member_card.db import db, get_or_update
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+
+from member_card.db import (
+    bulk_upsert,
+    checkpoint,
+    db,
+    filter_unchanged_rows,
+    get_instances_by_pks,
+    get_source_fingerprint,
+    unit_of_work,
+)
 from member_card.models import SlackUser
-from member_card.models.user import ensure_user
+from member_card.models.user import ensure_user, user_index
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +26,18 @@ logger = logging.getLogger(__name__)
 def get_web_client() -> WebClient:
     slack_bot_token = current_app.config["SLACK_BOT_TOKEN"]
     client = WebClient(token=slack_bot_token)
+    # Rate limited (HTTP 429) requests are retried after however long Slack's Retry-After header asks for
+    client.retry_handlers.append(
+        RateLimitErrorRetryHandler(
+            max_retry_count=current_app.config["SLACK_RATE_LIMIT_MAX_RETRIES"]
+        )
+    )
     return client
 
 
-# @Timer(name="slack_members_generator", logger=logger.debug)
-def slack_members_generator(client: WebClient, chunk_size=100, polling_interval_secs=1):
+def slack_member_pages_generator(
+    client: WebClient, chunk_size=1000, polling_interval_secs=0
+) -> Iterator[List[dict]]:
     next_cursor = None
     while next_cursor != "":
         logger.debug(f"Sending users_lists request with: {next_cursor=}")
@@ -38,62 +55,114 @@ def slack_members_generator(client: WebClient, chunk_size=100, polling_interval_
         next_cursor = response.data["response_metadata"]["next_cursor"]
         logger.debug(f"Meta-response bits: [next_]next_cursor={next_cursor}")
         logger.debug(f"# slack users load thus far: {len(slack_members)=}")
-        for slack_member in slack_members:
-            # logger.debug(f"yielding {slack_member=}...")
-            yield slack_member
+        yield slack_members
 
-        logger.debug(f"Pausing for {polling_interval_secs=} before proceeding...")
-        sleep(polling_interval_secs)
+        if next_cursor and polling_interval_secs:
+            logger.debug(f"Pausing for {polling_interval_secs=} before proceeding...")
+            sleep(polling_interval_secs)
 
 
-# @Timer(name="upsert_slack_member", logger=logger.debug)
-def upsert_slack_member(slack_member):
+# @Timer(name="slack_members_generator", logger=logger.debug)
+def slack_members_generator(
+    client: WebClient, chunk_size=1000, polling_interval_secs=0
+):
+    for slack_members in slack_member_pages_generator(
+        client=client,
+        chunk_size=chunk_size,
+        polling_interval_secs=polling_interval_secs,
+    ):
+        yield from slack_members
+
+
+def filter_changed_slack_members(slack_members: List[dict]) -> List[dict]:
+    # Members not yet linked to a user are always (re-)processed
+    changed_rows = filter_unchanged_rows(
+        session=db.session,
+        model=SlackUser,
+        rows=[get_slack_user_kwargs(m) for m in slack_members],
+        key="slack_id",
+        fingerprint_column="profile_hash",
+        criteria=[SlackUser.user_id.isnot(None)],
+    )
+    changed_slack_ids = {row["slack_id"] for row in changed_rows}
+    return [m for m in slack_members if m["id"] in changed_slack_ids]
+
+
+def get_slack_user_kwargs(slack_member):
+    slack_user_kwargs = dict(slack_member)
     profile_dict = slack_member["profile"]
-    slack_member["profile"] = json.dumps(profile_dict)
+    slack_user_kwargs["profile"] = json.dumps(profile_dict)
+
+    slack_user_kwargs["slack_id"] = slack_member["id"]
+    del slack_user_kwargs["id"]
+
+    if "email" not in slack_user_kwargs:
+        slack_user_kwargs["email"] = profile_dict.get("email")
 
-    email = profile_dict.get("email")
-    first_name = profile_dict.get("first_name")
-    last_name = profile_dict.get("last_name")
+    slack_user_kwargs["profile_hash"] = get_source_fingerprint(slack_member)
 
-    slack_member["slack_id"] = slack_member["id"]
-    del slack_member["id"]
+    return slack_user_kwargs
 
-    if "email" not in slack_member:
-        slack_member["email"] = email
 
-    slack_user = get_or_update(
+# @Timer(name="upsert_slack_members", logger=logger.debug)
+def upsert_slack_members(slack_members):
+    profiles_by_slack_id = {m["id"]: m["profile"] for m in slack_members}
+    slack_user_ids = bulk_upsert(
         session=db.session,
         model=SlackUser,
-        filters=["slack_id"],
-        kwargs=slack_member,
+        rows=[get_slack_user_kwargs(m) for m in slack_members],
+        conflict_keys=["slack_id"],
+        chunk_size=max(len(slack_members), 1),
     )
-
-    app_user = ensure_user(
-        email=email,
-        first_name=first_name,
-        last_name=last_name,
+    slack_users = get_instances_by_pks(
+        session=db.session,
+        model=SlackUser,
+        pks=slack_user_ids,
     )
-    app_user_id = app_user.id
-    if not slack_user.user_id:
-        logger.debug(f"No user_id set for {slack_user=}! Setting to: {app_user_id=}")
-        setattr(slack_user, "user_id", app_user_id)
 
+    for slack_user in slack_users:
+        profile_dict = profiles_by_slack_id[slack_user.slack_id]
+        app_user = ensure_user(
+            email=profile_dict.get("email"),
+            first_name=profile_dict.get("first_name"),
+            last_name=profile_dict.get("last_name"),
+        )
+        app_user_id = app_user.id
+        if not slack_user.user_id:
+            logger.debug(
+                f"No user_id set for {slack_user=}! Setting to: {app_user_id=}"
+            )
+            setattr(slack_user, "user_id", app_user_id)
+
+    return slack_users
+
+
+def upsert_slack_member(slack_member):
+    (slack_user,) = upsert_slack_members([slack_member])
     return slack_user
 
 
 # @Timer(name="slack_members_etl", logger=logger.debug)
 def slack_members_etl(client: WebClient):
     slack_users = list()
-
-    for slack_member in slack_members_generator(client):
-        # logger.debug(f"slack_members_etl(): {slack_member}")
-        slack_user = upsert_slack_member(slack_member)
-        slack_users.append(slack_user)
-        db.session.add(slack_user)
-
-        db.session.commit()
-
-    logger.info(f"Total number of slack members processed: {len(slack_users)}")
+    num_unchanged_members = 0
+
+    with unit_of_work(), user_index():
+        for slack_members in slack_member_pages_generator(
+            client, chunk_size=current_app.config["SLACK_MEMBERS_PAGE_SIZE"]
+        ):
+            changed_slack_members = filter_changed_slack_members(slack_members)
+            num_unchanged_members += len(slack_members) - len(changed_slack_members)
+            if changed_slack_members:
+                slack_users_batch = upsert_slack_members(changed_slack_members)
+                for slack_user in slack_users_batch:
+                    db.session.add(slack_user)
+                slack_users += slack_users_batch
+                checkpoint(num_records=len(changed_slack_members))
+
+    logger.info(
+        f"Total number of slack members processed: {len(slack_users)} ({num_unchanged_members} unchanged members skipped)"
+    )
 
     return slack_users
 
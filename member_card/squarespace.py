@@ -1,8 +1,12 @@
 import binascii
 import logging
 import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import TYPE_CHECKING
+from queue import Full, Queue
+from threading import Event
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 
 import requests
@@ -11,13 +15,25 @@ from flask import current_app, request, session
 from requests.auth import HTTPBasicAuth
 
 from member_card import utils
-from member_card.db import db, get_or_create, get_or_update
+from member_card.db import (
+    bulk_upsert,
+    checkpoint,
+    chunked,
+    db,
+    filter_unchanged_rows,
+    get_instances_by_pks,
+    get_or_create,
+    get_source_fingerprint,
+    unit_of_work,
+)
 from member_card.models import SquarespaceWebhook, table_metadata
-from member_card.models.user import ensure_user
+from member_card.models.annual_membership import count_memberships
+from member_card.models.user import ensure_user, user_index
 from member_card.gcp import publish_message
+from member_card.transport import ResilientSession, get_http_session
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Iterable, Iterator
 
 __VERSION__ = "0.0.4"
 api_baseurl = "https://api.squarespace.com"
@@ -154,10 +170,8 @@ def generate_oauth_authorize_url():
     return authorize_url
 
 
-def insert_order_as_membership(order, membership_skus):
-    from member_card.models import AnnualMembership
-
-    membership_orders = []
+def get_membership_kwargs(order, membership_skus):
+    membership_kwargs_list = []
     line_items = order.get("lineItems", [])
     subscription_line_items = [i for i in line_items if i["sku"] in membership_skus]
     ignored_line_items = [i for i in line_items if i["sku"] not in membership_skus]
@@ -189,14 +203,44 @@ def insert_order_as_membership(order, membership_skus):
             product_id=subscription_line_item["productId"],
             product_name=subscription_line_item["productName"],
         )
-        membership = get_or_update(
-            session=db.session,
-            model=AnnualMembership,
-            filters=["order_id", "order_number"],
-            kwargs=membership_kwargs,
-        )
-        membership_orders.append(membership)
+        membership_kwargs_list.append(membership_kwargs)
+
+    return membership_kwargs_list
+
+
+def upsert_orders_as_memberships(orders, membership_skus) -> Tuple[List, int]:
+    """Upsert memberships for the given orders, returning the new or changed memberships and the number skipped as
+    unchanged."""
+    from member_card.models import AnnualMembership
+
+    membership_rows = []
+    for order in orders:
+        source_fingerprint = get_source_fingerprint(order)
+        for membership_kwargs in get_membership_kwargs(order, membership_skus):
+            membership_kwargs["source_fingerprint"] = source_fingerprint
+            membership_rows.append(membership_kwargs)
 
+    changed_membership_rows = filter_unchanged_rows(
+        session=db.session,
+        model=AnnualMembership,
+        rows=membership_rows,
+        key="order_id",
+        criteria=[AnnualMembership.user_id.isnot(None)],
+    )
+    num_unchanged_memberships = len(membership_rows) - len(changed_membership_rows)
+    membership_ids = bulk_upsert(
+        session=db.session,
+        model=AnnualMembership,
+        rows=changed_membership_rows,
+        conflict_keys=["order_id"],
+    )
+    membership_orders = get_instances_by_pks(
+        session=db.session,
+        model=AnnualMembership,
+        pks=membership_ids,
+    )
+
+    for membership in membership_orders:
         membership_user = ensure_user(
             email=membership.customer_email,
             first_name=membership.billing_address_first_name,
@@ -208,27 +252,48 @@ def insert_order_as_membership(order, membership_skus):
                 f"No user_id set for {membership=}! Setting to: {membership_user_id=}"
             )
             setattr(membership, "user_id", membership_user_id)
+    return membership_orders, num_unchanged_memberships
+
+
+def insert_orders_as_memberships(orders, membership_skus):
+    membership_orders, _ = upsert_orders_as_memberships(
+        orders=orders,
+        membership_skus=membership_skus,
+    )
     return membership_orders
 
 
-def parse_subscription_orders(membership_skus, subscription_orders):
-    logger.info(f"{len(subscription_orders)=} retrieved from Squarespace...")
+def insert_order_as_membership(order, membership_skus):
+    return insert_orders_as_memberships(
+        orders=[order],
+        membership_skus=membership_skus,
+    )
 
-    # Insert oldest orders first (so our internal membership ID generally aligns with order IDs...)
-    subscription_orders.reverse()
 
-    # Loop over all the raw order data and do the ETL bits
-    memberships = []
-    for subscription_order in subscription_orders:
-        membership_orders = insert_order_as_membership(
-            order=subscription_order,
-            membership_skus=membership_skus,
-        )
-        for membership_order in membership_orders:
-            db.session.add(membership_order)
-        db.session.commit()
-        memberships += membership_orders
-    return memberships
+def parse_subscription_orders(
+    membership_skus, subscription_orders: "Iterable[dict]"
+) -> Counter:
+    # Orders are consumed as they're yielded (i.e., as each page comes back from Squarespace), one upsert statement
+    # and checkpoint per batch of orders. Only counts are kept across batches, so memory use stays flat.
+    membership_counts: Counter = Counter()
+    num_orders = 0
+    with unit_of_work():
+        for orders_batch in chunked(
+            subscription_orders, current_app.config["ETL_BATCH_SIZE"]
+        ):
+            membership_orders, num_unchanged_memberships = upsert_orders_as_memberships(
+                orders=orders_batch,
+                membership_skus=membership_skus,
+            )
+            for membership_order in membership_orders:
+                db.session.add(membership_order)
+            membership_counts.update(count_memberships(membership_orders))
+            membership_counts["unchanged"] += num_unchanged_memberships
+            checkpoint(num_records=len(orders_batch))
+            num_orders += len(orders_batch)
+            logger.debug(f"{num_orders=} from Squarespace parsed so far...")
+    logger.info(f"{num_orders=} retrieved from Squarespace ({membership_counts=})")
+    return membership_counts
 
 
 def squarespace_orders_etl(squarespace_client, membership_skus, load_all):
@@ -251,26 +316,35 @@ def squarespace_orders_etl(squarespace_client, membership_skus, load_all):
 
     else:
         logger.info("Loading ALL orders now...")
-        subscription_orders = squarespace_client.load_all_membership_orders(
+        subscription_orders = squarespace_client.load_all_membership_orders_sharded(
             membership_skus=membership_skus,
+            modified_after=parse(
+                current_app.config["SQUARESPACE_BACKFILL_START_DATE"]
+            ).replace(tzinfo=timezone.utc),
+            modified_before=etl_start_time,
+            num_shards=current_app.config["SQUARESPACE_BACKFILL_SHARDS"],
+            max_workers=current_app.config["SQUARESPACE_BACKFILL_MAX_WORKERS"],
         )
 
-    memberships = parse_subscription_orders(membership_skus, subscription_orders)
+    with user_index():
+        membership_counts = parse_subscription_orders(
+            membership_skus, subscription_orders
+        )
 
     table_metadata.set_last_run_start_time(membership_table_name, etl_start_time)
 
-    return memberships
+    return membership_counts
 
 
 def load_single_order(squarespace_client, membership_skus, order_id):
     subscription_order = squarespace_client.order(order_id)
     logger.debug(f"API response for {order_id=}: {subscription_order=}")
-    memberships = parse_subscription_orders(
+    membership_counts = parse_subscription_orders(
         membership_skus=membership_skus,
         subscription_orders=[subscription_order],
     )
-    logger.debug(f"After parsing subscription orders: {memberships=}")
-    return memberships
+    logger.debug(f"After parsing subscription orders: {membership_counts=}")
+    return membership_counts
 
 
 def validate_oauth_connect_request():
@@ -515,6 +589,42 @@ def refresh_oauth_token(client_id, client_secret, refresh_token):
     )
 
 
+def format_datetime_param(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def split_datetime_window(
+    start: datetime, end: datetime, num_shards: int
+) -> "List[Tuple[datetime, datetime]]":
+    shard_length = (end - start) / num_shards
+    shard_starts = [start + shard_length * i for i in range(num_shards)]
+    # Squarespace only takes whole seconds, so neighbouring shards overlap by one to avoid dropping orders at the seams
+    return [
+        (shard_start - timedelta(seconds=1), shard_start + shard_length)
+        for shard_start in shard_starts
+    ]
+
+
+def filter_membership_orders(
+    orders: "Iterable[dict]", membership_skus
+) -> "Iterator[dict]":
+    num_orders = 0
+    num_membership_orders = 0
+
+    for order in orders:
+        num_orders += 1
+
+        order_product_names = [i["productName"] for i in order["lineItems"]]
+        if any(i["sku"] in membership_skus for i in order["lineItems"]):
+            logger.debug(
+                f"{order['id']=} (#{order['orderNumber']}) includes {membership_skus=} in {order_product_names=}"
+            )
+            num_membership_orders += 1
+            yield order
+
+    logger.debug(f"{num_orders=} loaded with {num_membership_orders=} and whatnot")
+
+
 class SquarespaceError(Exception):
     pass
 
@@ -546,11 +656,13 @@ class Squarespace(object):
         self.api_version = api_version
         self.account_id = account_id
 
-        # Setup our HTTP session
-        self.http = requests.Session()
-        self.http.headers.update({"Authorization": "Bearer " + self.api_key})
+        # Requests go out via the shared HTTP session, with our headers added per request
+        self.headers = {"Authorization": "Bearer " + self.api_key}
         self.useragent = "Squarespace python API v%s by Zach White." % __VERSION__
-        self._next_page = None
+
+    @property
+    def http(self) -> ResilientSession:
+        return get_http_session()
 
     @property
     def useragent(self):
@@ -561,7 +673,7 @@ class Squarespace(object):
     def useragent(self, agent_string):
         """Set the User-Agent that will be used."""
         self._useragent = agent_string
-        self.http.headers.update({"User-Agent": self._useragent})
+        self.headers.update({"User-Agent": self._useragent})
 
     def post(self, path, object):
         """Post an `object` to the Squarespace API.
@@ -571,7 +683,9 @@ class Squarespace(object):
         """
         url = "%s/%s/%s" % (self.api_baseurl, self.api_version, path)
         # logger.debug("url:%s object:%s", url, object)
-        return self.process_request(self.http.post(url, json=object))
+        return self.process_request(
+            self.http.post(url, json=object, headers=self.headers)
+        )
 
     def get(self, path, args=None) -> dict:
         """Retrieve an endpoint from the Squarespace API."""
@@ -580,12 +694,14 @@ class Squarespace(object):
 
         url = "%s/%s/%s" % (self.api_baseurl, self.api_version, path)
         # logger.debug("url:%s args:%s", url, args)
-        return self.process_request(self.http.get(url, params=args))
+        return self.process_request(
+            self.http.get(url, params=args, headers=self.headers)
+        )
 
     def delete(self, path):
         url = "%s/%s/%s" % (self.api_baseurl, self.api_version, path)
         # logger.debug("url:%s object:%s", url, object)
-        return self.process_request(self.http.delete(url))
+        return self.process_request(self.http.delete(url, headers=self.headers))
 
     def process_request(self, request) -> dict:
         """Process a request and return the data."""
@@ -629,33 +745,94 @@ class Squarespace(object):
                 "You must specify one of `order_id` or `order_number`"
             )
 
-    def orders(self, **args):
-        """Retrieve the 20 latest orders, by modification date."""
+    def get_orders_page(
+        self, cursor: Optional[str] = None, **args
+    ) -> "Tuple[List[dict], Optional[str]]":
+        """Retrieve a page of orders (by modification date), along with the cursor for the next page (if any)."""
         uri = "commerce/orders"
 
-        result = self.get(uri, args)
-        self._next_page = (
-            result["pagination"]["nextPageCursor"]
-            if "nextPageCursor" in result["pagination"]
-            else None
-        )
-        # breakpoint()
-        return result["result"]
+        # Squarespace doesn't allow filters alongside a cursor; the cursor carries those along itself
+        result = self.get(uri, dict(cursor=cursor) if cursor else args)
+        return result["result"], result["pagination"].get("nextPageCursor")
+
+    def orders(self, **args):
+        """Retrieve the 20 latest orders, by modification date."""
+        orders, _ = self.get_orders_page(**args)
+        return orders
 
-    def next_page(self) -> "Iterable":
-        """Retrieve the next 20 orders, or None if there are no more orders."""
-        return self.orders(cursor=self._next_page) if self._next_page else iter([])
+    def iter_order_pages(self, **args) -> "Iterator[List[dict]]":
+        """Yield pages of orders; each iteration keeps its own cursor, so a client can be shared across threads."""
+        orders, cursor = self.get_orders_page(**args)
+        yield orders
+        while cursor:
+            orders, cursor = self.get_orders_page(cursor=cursor)
+            yield orders
 
     def all_orders(self, **args):
-        orders = self.orders(**args)
-        for order in orders:
-            yield order
+        for orders in self.iter_order_pages(**args):
+            yield from orders
 
-        count = 0
-        while self._next_page:
-            count += 1
-            for order in self.next_page():
-                yield order
+    def all_orders_sharded(
+        self,
+        modified_after: datetime,
+        modified_before: datetime,
+        num_shards: int = 8,
+        max_workers: int = 4,
+    ) -> "Iterator[dict]":
+        """Yield all orders modified within the given window, paginating `num_shards` sub-windows concurrently.
+
+        Orders are yielded as pages arrive from any shard (i.e., in no particular order).
+        """
+        shard_windows = split_datetime_window(
+            start=modified_after, end=modified_before, num_shards=num_shards
+        )
+        pages: Queue = Queue(maxsize=max_workers * 2)
+        shard_done = object()
+        stop = Event()
+
+        def put_page(page) -> None:
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return
+                except Full:
+                    continue
+
+        def load_shard(shard_modified_after, shard_modified_before) -> None:
+            try:
+                for orders in self.iter_order_pages(
+                    modifiedAfter=format_datetime_param(shard_modified_after),
+                    modifiedBefore=format_datetime_param(shard_modified_before),
+                ):
+                    if stop.is_set():
+                        return
+                    put_page(orders)
+            finally:
+                put_page(shard_done)
+
+        logger.debug(f"Loading orders in {len(shard_windows)} shards: {shard_windows=}")
+        executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="squarespace-order-shards"
+        )
+        try:
+            shard_futures = [
+                executor.submit(load_shard, *shard_window)
+                for shard_window in shard_windows
+            ]
+            num_shards_done = 0
+            while num_shards_done < len(shard_futures):
+                page = pages.get()
+                if page is shard_done:
+                    num_shards_done += 1
+                    continue
+                yield from page
+
+            for shard_future in shard_futures:
+                # Surface any exceptions raised while loading a shard
+                shard_future.result()
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
 
     def load_membership_orders_datetime_window(
         self,
@@ -666,44 +843,49 @@ class Squarespace(object):
         order_params = dict()
         if modified_after is not None:
             order_params = dict(
-                modifiedAfter=modified_after.strftime("%Y-%m-%dT%H:%M:%SZ"),
-                modifiedBefore=modified_before.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                modifiedAfter=format_datetime_param(modified_after),
+                modifiedBefore=format_datetime_param(modified_before),
             )
 
         return self.load_all_membership_orders(
             membership_skus, order_params=order_params
         )
 
-    def load_all_membership_orders(self, membership_skus, order_params=None):
-        # ) -> List[AnnualMembership]:
+    def load_all_membership_orders(
+        self, membership_skus, order_params=None
+    ) -> "Iterator[dict]":
+        """Yield orders including any of `membership_skus`, page by page as they're retrieved."""
         # remove "None"s
         if order_params is None:
             order_params = {}
         order_params = {k: v for k, v in order_params.items() if v is not None}
 
-        all_orders = []
-        membership_orders = []
-
         logger.debug(f"Grabbing all orders with {order_params=}")
+        return filter_membership_orders(
+            orders=self.all_orders(**order_params),
+            membership_skus=membership_skus,
+        )
 
-        for order in self.all_orders(**order_params):
-            all_orders.append(order)
-
-            order_product_names = [i["productName"] for i in order["lineItems"]]
-            if any(i["sku"] in membership_skus for i in order["lineItems"]):
-                logger.debug(
-                    f"{order['id']=} (#{order['orderNumber']}) includes {membership_skus=} in {order_product_names=}"
-                )
-                membership_orders.append(order)
-                continue
-            # logger.debug(
-            #     f"#{order['orderNumber']} has no {membership_sku=} in {order_product_names=}"
-            # )
-
+    def load_all_membership_orders_sharded(
+        self,
+        membership_skus,
+        modified_after: datetime,
+        modified_before: datetime,
+        num_shards: int = 8,
+        max_workers: int = 4,
+    ) -> "Iterator[dict]":
         logger.debug(
-            f"{len(all_orders)=} loaded with {len(membership_orders)=} and whatnot"
+            f"Grabbing all orders modified between {modified_after=} and {modified_before=} ({num_shards=})"
+        )
+        return filter_membership_orders(
+            orders=self.all_orders_sharded(
+                modified_after=modified_after,
+                modified_before=modified_before,
+                num_shards=num_shards,
+                max_workers=max_workers,
+            ),
+            membership_skus=membership_skus,
         )
-        return membership_orders
 
     def list_webhook_subscriptions(
         self,
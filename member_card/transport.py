@@ -0,0 +1,206 @@
+"""Shared HTTP session for our third-party API clients (BigCommerce, Squarespace, MiniBC)."""
+import atexit
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import BoundedSemaphore, Lock
+from time import monotonic, sleep
+from typing import TYPE_CHECKING, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+# Only 429s are retried for other methods; a 5xx may well mean the POST went through regardless
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+_http_session: Optional["ResilientSession"] = None
+_http_session_lock = Lock()
+# Guards the timing counters below, which are updated from every thread sharing the session
+_request_metrics_lock = Lock()
+request_counts: Counter = Counter()
+request_retries: Counter = Counter()
+request_duration_secs: Counter = Counter()
+
+
+def get_retry_after_secs(response: requests.Response) -> Optional[float]:
+    if retry_after := response.headers.get("Retry-After"):
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(tz=timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            logger.warning(f"Unable to parse {retry_after=} header")
+    # BigCommerce sends its own rate limit headers instead
+    if reset_ms := response.headers.get("X-Rate-Limit-Time-Reset-Ms"):
+        try:
+            return max(0.0, int(reset_ms) / 1000)
+        except ValueError:
+            logger.warning(f"Unable to parse X-Rate-Limit-Time-Reset-Ms {reset_ms=}")
+    return None
+
+
+def get_request_timings() -> Dict[str, dict]:
+    with _request_metrics_lock:
+        return {
+            host: dict(
+                requests=num_requests,
+                retries=request_retries[host],
+                total_secs=request_duration_secs[host],
+                avg_secs=request_duration_secs[host] / num_requests,
+            )
+            for host, num_requests in request_counts.items()
+        }
+
+
+class ResilientSession(requests.Session):
+    """A requests.Session that retries throttled / failed requests and caps concurrent requests per host.
+
+    Connections are pooled (and kept alive) per host by the mounted HTTPAdapter.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        backoff_base_secs: float = 0.5,
+        backoff_max_secs: float = 60,
+        timeout_secs: float = 30,
+        max_requests_per_host: int = 8,
+    ) -> None:
+        super().__init__()
+        self.max_attempts = max_attempts
+        self.backoff_base_secs = backoff_base_secs
+        self.backoff_max_secs = backoff_max_secs
+        self.timeout_secs = timeout_secs
+        self.max_requests_per_host = max_requests_per_host
+        self._host_slots: Dict[str, BoundedSemaphore] = {}
+        self._host_slots_lock = Lock()
+
+        adapter = HTTPAdapter(pool_maxsize=max_requests_per_host)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def get_host_slots(self, host: str) -> BoundedSemaphore:
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = BoundedSemaphore(self.max_requests_per_host)
+            return self._host_slots[host]
+
+    def get_backoff_secs(self, attempt: int, response=None) -> float:
+        backoff_secs = None
+        if response is not None:
+            backoff_secs = get_retry_after_secs(response)
+        if backoff_secs is None:
+            backoff_secs = self.backoff_base_secs * 2 ** (attempt - 1)
+        return min(backoff_secs, self.backoff_max_secs)
+
+    def should_retry(self, method: str, response: requests.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        return (
+            response.status_code in RETRYABLE_STATUS_CODES
+            and method.upper() in IDEMPOTENT_METHODS
+        )
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout_secs)
+        host = urlparse(url).netloc
+        log_extra = dict(http_method=method, http_host=host)
+
+        for attempt in range(1, self.max_attempts + 1):
+            response = None
+            start_time = monotonic()
+            try:
+                with self.get_host_slots(host):
+                    response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning(
+                    f"{method} request to {host} failed ({attempt=}): {err}",
+                    extra=log_extra,
+                )
+            finally:
+                duration_secs = monotonic() - start_time
+                with _request_metrics_lock:
+                    request_counts[host] += 1
+                    request_duration_secs[host] += duration_secs
+
+            log_extra.update(dict(attempt=attempt, duration_secs=duration_secs))
+            if response is not None:
+                log_extra["http_status"] = response.status_code
+                logger.debug(
+                    f"{method} request to {host} returned {response.status_code} in {duration_secs:.3f}s",
+                    extra=log_extra,
+                )
+                if attempt == self.max_attempts or not self.should_retry(
+                    method, response
+                ):
+                    return response
+
+            backoff_secs = self.get_backoff_secs(attempt=attempt, response=response)
+            with _request_metrics_lock:
+                request_retries[host] += 1
+            logger.warning(
+                f"Retrying {method} request to {host} in {backoff_secs=} ({attempt=})",
+                extra=log_extra,
+            )
+            if response is not None:
+                response.close()
+            sleep(backoff_secs)
+
+
+def get_http_session() -> ResilientSession:
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            # Outside of an app context (e.g., a client used from a shell), the session defaults apply. Apps create
+            # the session up front (see init_http_session()) so client pool threads never end up doing so.
+            session_kwargs = {}
+            if not has_app_context():
+                logger.warning(
+                    "Initializing shared HTTP session outside of an app context; using default settings"
+                )
+            else:
+                session_kwargs = dict(
+                    max_attempts=current_app.config["HTTP_MAX_ATTEMPTS"],
+                    backoff_base_secs=current_app.config["HTTP_BACKOFF_BASE_SECS"],
+                    backoff_max_secs=current_app.config["HTTP_BACKOFF_MAX_SECS"],
+                    timeout_secs=current_app.config["HTTP_TIMEOUT_SECS"],
+                    max_requests_per_host=current_app.config[
+                        "HTTP_MAX_REQUESTS_PER_HOST"
+                    ],
+                )
+            logger.debug(f"Initializing shared HTTP session with {session_kwargs=}")
+            _http_session = ResilientSession(**session_kwargs)
+        return _http_session
+
+
+def init_http_session(app: "Flask") -> ResilientSession:
+    with app.app_context():
+        return get_http_session()
+
+
+def close_http_session() -> None:
+    global _http_session
+    with _http_session_lock:
+        if _http_session is not None:
+            logger.debug(
+                f"Closing shared HTTP session; request timings: {get_request_timings()}"
+            )
+            _http_session.close()
+            _http_session = None
+
+
+atexit.register(close_http_session)
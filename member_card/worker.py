@@ -1,17 +1,27 @@
 import base64
 import json
 import logging
+from datetime import datetime, timedelta, timezone
 
 from flask import Blueprint, current_app, request
 
 from member_card import minibc
 from member_card import bigcommerce, slack
 from member_card.db import db
+from member_card.jobs import (
+    enqueue_job,
+    find_duplicate_job,
+    get_job_runner,
+    record_skipped_duplicate_job,
+    run_job,
+    supersede_pending_jobs,
+    sweep_jobs,
+)
 from member_card.image import ensure_uploaded_card_image
-from member_card.models import AnnualMembership
+from member_card.models import AnnualMembership, PubsubJob
 from member_card.models.membership_card import get_or_create_membership_card
 from member_card.models.user import get_user_or_none
-from member_card.passes import generate_and_upload_apple_pass
+from member_card.passes import generate_and_upload_apple_pass, gpay
 from member_card.sendgrid import generate_email_message, send_email_message
 
 logger = logging.getLogger(__name__)
@@ -76,6 +86,16 @@ def process_email_distribution_request(message):
 
     apple_pass_url = generate_and_upload_apple_pass(membership_card)
 
+    try:
+        gpay.sync_pass_object(membership_card)
+    except Exception as err:
+        # The emailed save link carries the full pass object, so this shouldn't hold up the email itself
+        logger.exception(
+            f"Unable to sync GPay pass object for {membership_card=}: {err}",
+            extra=log_extra,
+        )
+
+    gpay.save_pass_jwt(membership_card)
     email_message = generate_email_message(
         membership_card=membership_card,
         card_image_url=card_image_url,
@@ -119,6 +139,36 @@ def process_ensure_uploaded_card_image_request(message):
     return card_image_url
 
 
+def process_sync_google_pay_object_request(message):
+    logger.debug(f"Processing sync_google_pay_object message: {message}")
+    member_email_address = message["member_email_address"]
+    log_extra = dict(
+        pubsub_message=message,
+        member_email_address=member_email_address,
+    )
+    user = get_user_or_none(
+        email_address=member_email_address,
+        log_extra=log_extra,
+    )
+    if user is None:
+        logger.warning(
+            "process_sync_google_pay_object_request() :: no user found, returning early..."
+        )
+        return
+    if not user.has_active_memberships:
+        logger.warning(
+            f"{user=} has not active memberships! Exiting early...",
+            extra=log_extra,
+        )
+        return
+
+    membership_card = get_or_create_membership_card(user)
+
+    sync_response = gpay.sync_pass_object(membership_card)
+    logger.debug(f"sync_pass_object(): {sync_response=}")
+    return sync_response
+
+
 def sync_subscriptions_etl(message, load_all=False):
     log_extra = dict(pubsub_message=message)
     logger.debug(
@@ -132,13 +182,13 @@ def sync_subscriptions_etl(message, load_all=False):
     bigcommerce_client = bigcommerce.get_app_client_for_store()
 
     if load_all:
-        memberships = bigcommerce.load_all_bigcommerce_orders(
+        membership_counts = bigcommerce.load_all_bigcommerce_orders(
             bigcommerce_client=bigcommerce_client,
             membership_skus=membership_skus,
         )
 
     else:
-        memberships = bigcommerce.bigcommerce_orders_etl(
+        membership_counts = bigcommerce.bigcommerce_orders_etl(
             bigcommerce_client=bigcommerce_client,
             membership_skus=membership_skus,
         )
@@ -146,8 +196,9 @@ def sync_subscriptions_etl(message, load_all=False):
     total_num_memberships_end = db.session.query(AnnualMembership.id).count()
     log_extra.update(
         dict(
-            active_memberships=[m for m in memberships if m.is_active],
-            inactive_memberships=[m for m in memberships if not m.is_active],
+            num_active_memberships=membership_counts["active"],
+            num_inactive_memberships=membership_counts["inactive"],
+            num_unchanged_memberships=membership_counts["unchanged"],
             total_num_memberships_end=total_num_memberships_end,
             total_num_memberships_added=(
                 total_num_memberships_end - total_num_memberships_start
@@ -160,9 +211,10 @@ def sync_subscriptions_etl(message, load_all=False):
     )
     return {
         "stats": dict(
-            num_membership=len(memberships),
-            num_active_membership=len(log_extra["active_memberships"]),
-            num_inactive_membership=len(log_extra["inactive_memberships"]),
+            num_membership=membership_counts["active"] + membership_counts["inactive"],
+            num_active_membership=membership_counts["active"],
+            num_inactive_membership=membership_counts["inactive"],
+            num_unchanged_membership=membership_counts["unchanged"],
             total_num_memberships_start=total_num_memberships_start,
             total_num_memberships_end=total_num_memberships_end,
             total_num_memberships_added=log_extra["total_num_memberships_added"],
@@ -235,16 +287,72 @@ def sync_minibc_subscriptions_etl(message):
     minibc_client = minibc.Minibc(api_key=current_app.config["MINIBC_API_KEY"])
     membership_skus = current_app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"]
 
-    etl_result = minibc.minibc_subscriptions_etl(
+    num_subscriptions_upserted = minibc.minibc_subscriptions_etl(
         minibc_client=minibc_client,
         skus=membership_skus,
     )
     logger.debug(
-        f"sync_minibc_subscriptions_etl(): {len(etl_result)=}",
+        f"sync_minibc_subscriptions_etl(): {num_subscriptions_upserted=}",
         extra=log_extra,
     )
 
 
+def sweep_pubsub_jobs(message):
+    logger.debug(f"Processing sweep_pubsub_jobs message: {message}")
+    job_futures = sweep_jobs(handlers=MESSAGE_TYPE_HANDLERS)
+    return len(job_futures)
+
+
+MESSAGE_TYPE_HANDLERS = {
+    "email_distribution_request": process_email_distribution_request,
+    "sync_subscriptions_etl": sync_subscriptions_etl,
+    "sync_minibc_subscriptions_etl": sync_minibc_subscriptions_etl,
+    "sync_customers_etl": sync_customers_etl,
+    "sync_squarespace_order": sync_squarespace_order,
+    "sync_bigcommerce_order": sync_bigcommerce_order,
+    "run_slack_members_etl": run_slack_members_etl,
+    "ensure_uploaded_card_image_request": process_ensure_uploaded_card_image_request,
+    "sync_google_pay_object_request": process_sync_google_pay_object_request,
+    "sweep_pubsub_jobs": sweep_pubsub_jobs,
+}
+
+
+def get_message_dedup_key(message):
+    # Pub/Sub delivers at-least-once (and users double-submit forms), so this identifies repeats of the same unit
+    # of work even when they arrive as distinct messages: one card email per recipient per day. Other types are
+    # deduplicated by message ID alone; e.g. BigCommerce webhooks for later updates to an order share a payload,
+    # and are coalesced instead.
+    message_type = message["type"]
+    if message_type == "email_distribution_request" and message.get("submitted_on"):
+        key_parts = [
+            message["email_distribution_recipient"].lower(),
+            message["submitted_on"][:10],
+        ]
+    else:
+        return None
+    return ":".join([message_type, *[str(p) for p in key_parts]])
+
+
+def get_message_coalesce_key(message):
+    # BigCommerce sends a flurry of store/order/* webhooks per order, but each sync re-fetches the order as a
+    # whole, so only the latest of these needs to be processed
+    message_type = message["type"]
+    if message_type == "sync_bigcommerce_order":
+        return f"{message_type}:{message['store_hash']}:{message['data']['id']}"
+    return None
+
+
+@worker_bp.before_app_first_request
+def sweep_jobs_on_startup():
+    # Retries / resumes whatever jobs earlier worker instances left behind; scheduled sweeps take it from here
+    if current_app.config["WORKER_RUN_JOBS_INLINE"]:
+        return
+    try:
+        sweep_jobs(handlers=MESSAGE_TYPE_HANDLERS)
+    except Exception as err:
+        logger.exception(f"Unable to sweep jobs on startup: {err}")
+
+
 @worker_bp.route("/pubsub", methods=["POST"])
 def pubsub_ingress():
     try:
@@ -252,20 +360,47 @@ def pubsub_ingress():
     except Exception as err:
         return str(err), 400
 
-    MESSAGE_TYPE_HANDLERS = {
-        "email_distribution_request": process_email_distribution_request,
-        "sync_subscriptions_etl": sync_subscriptions_etl,
-        "sync_minibc_subscriptions_etl": sync_minibc_subscriptions_etl,
-        "sync_customers_etl": sync_customers_etl,
-        "sync_squarespace_order": sync_squarespace_order,
-        "sync_bigcommerce_order": sync_bigcommerce_order,
-        "run_slack_members_etl": run_slack_members_etl,
-        "ensure_uploaded_card_image_request": process_ensure_uploaded_card_image_request,
-    }
-
     message_type = message["type"]
     if message_type not in MESSAGE_TYPE_HANDLERS:
         return f"Message type {message_type} is unsupported", 400
 
-    MESSAGE_TYPE_HANDLERS[message["type"]](message)
+    message_id = request.get_json()["message"].get("messageId")
+    dedup_key = get_message_dedup_key(message)
+    if duplicate_job := find_duplicate_job(message_id=message_id, dedup_key=dedup_key):
+        record_skipped_duplicate_job(message=message, duplicate_job=duplicate_job)
+        return ("", 204)
+
+    coalesce_key = get_message_coalesce_key(message)
+    run_after = None
+    if coalesce_key is not None:
+        run_after = datetime.now(tz=timezone.utc) + timedelta(
+            seconds=current_app.config["WORKER_JOB_COALESCE_WINDOW_SECS"]
+        )
+
+    job = enqueue_job(
+        message=message,
+        message_id=message_id,
+        dedup_key=dedup_key,
+        coalesce_key=coalesce_key,
+        run_after=run_after,
+    )
+    if job is None:
+        # Lost the race to a concurrent redelivery of this same message (failed jobs are retried by sweep_jobs())
+        duplicate_job = PubsubJob.query.filter_by(message_id=message_id).one()
+        record_skipped_duplicate_job(message=message, duplicate_job=duplicate_job)
+        return ("", 204)
+
+    if coalesce_key is not None:
+        supersede_pending_jobs(
+            message_type=message_type,
+            coalesce_key=coalesce_key,
+            before_job_id=job.id,
+        )
+
+    if current_app.config["WORKER_RUN_JOBS_INLINE"]:
+        run_job(job_id=job.id, handlers=MESSAGE_TYPE_HANDLERS)
+    else:
+        # Ack right away; the job's outcome is tracked in the pubsub_jobs table from here on out (and
+        # failed / lost jobs are retried by sweep_jobs())
+        get_job_runner(handlers=MESSAGE_TYPE_HANDLERS).submit(job)
     return ("", 204)
@@ -11,6 +11,11 @@ locals {
       max_scale               = "1"
       invokers                = ["allUsers"]
       timeout_seconds         = 60 * 5 # 5 minutes
+      # Pub/Sub messages are published in the background (batched) after handlers respond, so CPU needs to stay
+      # allocated between requests
+      cpu_throttling          = "false"
+      db_pool_size            = 8
+      db_pool_max_overflow    = 2
     }
     "worker" = {
       image                   = var.worker_image
@@ -21,6 +26,10 @@ locals {
       memory_mb               = "1Gi"
       invokers                = ["serviceAccount:${google_service_account.digital_membership["worker-pubsub-invoker"].email}"]
       timeout_seconds         = 60 * 30 # 30 minutes
+      # /pubsub messages are acked before their jobs run, so CPU needs to stay allocated between requests
+      cpu_throttling          = "false"
+      db_pool_size            = 4
+      db_pool_max_overflow    = 8
     }
   }
 
@@ -56,6 +65,7 @@ resource "google_cloud_run_service" "digital_membership" {
         "autoscaling.knative.dev/maxScale"         = each.value.max_scale
         "run.googleapis.com/cloudsql-instances"    = google_sql_database_instance.digital_membership.connection_name
         "run.googleapis.com/client-name"           = each.key
+        "run.googleapis.com/cpu-throttling"        = each.value.cpu_throttling
         "run.googleapis.com/execution-environment" = "gen2"
         "run.googleapis.com/launch-stage"          = "BETA"
       }
@@ -99,6 +109,14 @@ resource "google_cloud_run_service" "digital_membership" {
           name  = "DIGITAL_MEMBERSHIP_DB_DATABASE_NAME"
           value = google_sql_database.database.name
         }
+        env {
+          name  = "DB_POOL_SIZE"
+          value = each.value.db_pool_size
+        }
+        env {
+          name  = "DB_POOL_MAX_OVERFLOW"
+          value = each.value.db_pool_max_overflow
+        }
         env {
           name  = "DIGITAL_MEMBERSHIP_BASE_URL"
           value = local.cloud_run_domain_name
@@ -7,6 +7,13 @@ locals {
         type = "run_slack_members_etl",
       }
     }
+    sweep_pubsub_jobs = {
+      description = "Retry failed worker jobs and resume any lost along with a worker instance"
+      schedule    = "*/10 * * * *"
+      data = {
+        type = "sweep_pubsub_jobs",
+      }
+    }
     sync_customers_etl = {
       description = "Sync E-commerce customer / user data into local digital membership database"
       schedule    = "30 * * * *"
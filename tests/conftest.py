@@ -12,7 +12,13 @@ from member_card import create_worker_app
 from member_card.db import db
 from member_card.models.annual_membership import AnnualMembership
 from member_card.models.membership_card import MembershipCard
-from member_card.models import AppleDeviceRegistration, SlackUser, StoreUser
+from member_card.models import (
+    AppleDeviceRegistration,
+    PubsubJob,
+    SlackUser,
+    StoreUser,
+    Subscription,
+)
 from member_card.models.user import Role, User
 from mock import Mock, patch
 from PIL import Image
@@ -40,6 +46,8 @@ def app() -> "Flask":
         AnnualMembership.query.delete()
         SlackUser.query.delete()
         StoreUser.query.delete()
+        PubsubJob.query.delete()
+        Subscription.query.delete()
 
         user_datastore = SQLAlchemySessionUserDatastore(db.session, User, Role)
         for user in User.query.all():
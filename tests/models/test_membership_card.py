@@ -8,15 +8,15 @@ if TYPE_CHECKING:
 
 
 def test_google_pay_jwt_cached_locally(mocker: "MockerFixture"):
-    mock_gen_jwt = mocker.patch("member_card.models.membership_card.generate_pass_jwt")
+    mock_get_jwt = mocker.patch("member_card.models.membership_card.get_pass_jwt")
     fake_card = MembershipCard()
     assert fake_card.google_pay_jwt
     assert fake_card.google_pay_jwt
-    mock_gen_jwt.assert_called_once()
+    mock_get_jwt.assert_called_once()
 
 
 def test_google_pass_save_url(fake_card: "MembershipCard", mocker: "MockerFixture"):
-    mocker.patch("member_card.models.membership_card.generate_pass_jwt")
+    mocker.patch("member_card.models.membership_card.get_pass_jwt")
     assert fake_card.google_pass_save_url.startswith(
         "https://pay.google.com/gp/v/save/"
     )
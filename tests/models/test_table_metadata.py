@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import TYPE_CHECKING
 
 from member_card.db import db
@@ -33,3 +33,21 @@ def test_get_last_run_start_time(app: "Flask"):
             table_name=table_name,
         )
     assert test_last_run_dt == last_run_start_time
+
+
+def test_get_last_date_modified(app: "Flask"):
+    table_name = "test_last_date_modified_table"
+    test_date_modified = datetime(2022, 2, 22, 12, 34, 56, tzinfo=timezone.utc)
+
+    with app.app_context():
+        assert table_metadata.get_last_date_modified(table_name) is None
+
+        table_metadata.set_last_date_modified(table_name, test_date_modified)
+        db.session.commit()
+
+        assert table_metadata.get_last_date_modified(table_name) == test_date_modified
+
+        db.session.query(table_metadata.TableMetadata).filter_by(
+            table_name=table_name
+        ).delete()
+        db.session.commit()
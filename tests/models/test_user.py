@@ -1,7 +1,14 @@
 from typing import TYPE_CHECKING
 from datetime import datetime
 from member_card.models import MembershipCard
-from member_card.models.user import User, edit_user_name, ensure_user
+from member_card.db import db
+from member_card.models.user import (
+    User,
+    edit_user_name,
+    ensure_user,
+    get_user_index,
+    user_index,
+)
 
 if TYPE_CHECKING:
     from flask import Flask
@@ -133,3 +140,44 @@ def test_ensure_user_sets_password(fake_user: "User"):
         password="new-password?",
     )
     assert user.password
+
+
+def test_user_index_lookups(fake_user: "User"):
+    with user_index() as index:
+        assert get_user_index() is index
+        assert index.get_by_email(fake_user.email.upper()) == fake_user
+        assert index.get_by_bigcommerce_id(fake_user.bigcommerce_id) == fake_user
+        assert index.get_by_email("nobody@example.com") is None
+
+    assert get_user_index() is None
+
+
+def test_user_index_reindex(fake_user: "User"):
+    original_email = fake_user.email
+    with user_index() as index:
+        setattr(fake_user, "email", "reindexed@example.com")
+        index.reindex(fake_user)
+
+        assert index.get_by_email(original_email) is None
+        assert index.get_by_email("reindexed@example.com") == fake_user
+
+    setattr(fake_user, "email", original_email)
+
+
+def test_ensure_user_with_user_index(app: "Flask", fake_user: "User"):
+    new_email = "user-index-tester@example.com"
+    with user_index() as index:
+        user = ensure_user(
+            email=fake_user.email,
+            first_name=fake_user.first_name,
+            last_name=fake_user.last_name,
+        )
+        assert user == fake_user
+
+        new_user = ensure_user(email=new_email, bigcommerce_id=1234)
+        assert new_user.id is not None
+        assert index.get_by_email(new_email) is new_user
+        assert index.get_by_bigcommerce_id(1234) is new_user
+
+    db.session.delete(new_user)
+    db.session.commit()
@@ -1,9 +1,11 @@
+import os
 from typing import TYPE_CHECKING
 from member_card.passes import apple_wallet
 
 if TYPE_CHECKING:
     from flask import Flask
     from pathlib import Path
+    from pytest_mock.plugin import MockerFixture
 
 
 def test_tmp_apple_developer_key(app: "Flask", tmpdir: "Path"):
@@ -20,3 +22,26 @@ def test_tmp_apple_developer_key(app: "Flask", tmpdir: "Path"):
                 assert fp.read() == test_filepath_content
 
     app.config["APPLE_KEY_FILEPATH"] = ""
+
+
+def test_get_apple_developer_key_filepath_stashes_key_once(
+    app: "Flask", mocker: "MockerFixture"
+):
+    mocker.patch("member_card.passes.apple_wallet._stashed_key_filepath", None)
+    mocker.patch.dict(
+        app.config,
+        {
+            "APPLE_KEY_FILEPATH": "/this/path/does/not/exist.key",
+            "APPLE_DEVELOPER_PRIVATE_KEY": "line one\\nline two",
+        },
+    )
+
+    with app.app_context():
+        key_filepath = apple_wallet.get_apple_developer_key_filepath()
+        assert apple_wallet.get_apple_developer_key_filepath() == key_filepath
+
+    with open(key_filepath, "r") as fp:
+        assert fp.read() == "line one\nline two"
+
+    apple_wallet.remove_stashed_apple_developer_key()
+    assert not os.path.exists(key_filepath)
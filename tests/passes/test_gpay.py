@@ -1,3 +1,4 @@
+from datetime import timedelta
 from typing import TYPE_CHECKING
 
 import pytest
@@ -12,6 +13,7 @@ if TYPE_CHECKING:
 @pytest.fixture()
 def google_pay_jwt(app: "Flask", mocker: "MockerFixture") -> gpay.GooglePassJwt:
     mock_crypt = mocker.patch("member_card.passes.gpay.crypt_google")
+    gpay.get_signer.cache_clear()
     with app.app_context():
         p = gpay.new_google_pass_jwt()
     mock_crypt.RSASigner.from_service_account_file.assert_called_once()
@@ -22,6 +24,12 @@ class TestGooglePassJwt:
     def test_init(self, google_pay_jwt: gpay.GooglePassJwt):
         assert google_pay_jwt
 
+    def test_signer_reused(self, app: "Flask", google_pay_jwt: gpay.GooglePassJwt):
+        with app.app_context():
+            another_jwt = gpay.new_google_pass_jwt()
+
+        assert another_jwt.signer is google_pay_jwt.signer
+
     def test_add_loyalty_class(self, google_pay_jwt: gpay.GooglePassJwt):
         test_loyalty_class = dict(loyalty_class="testing")
         google_pay_jwt.add_loyalty_class(test_loyalty_class)
@@ -50,6 +58,8 @@ class TestGooglePassJwt:
 def pay_client_mock(app: "Flask", mocker: "MockerFixture") -> gpay.GooglePayApiClient:
     mock_service_account = mocker.patch("member_card.passes.gpay.service_account")
     mock_auth_session = mocker.patch("member_card.passes.gpay.AuthorizedSession")
+    gpay.get_credentials.cache_clear()
+    gpay.get_authorized_session.cache_clear()
     with app.app_context():
         client = gpay.new_client()
     mock_service_account.Credentials.from_service_account_file.assert_called_once()
@@ -64,6 +74,16 @@ class TestGooglePayApiClient:
     def test_init(self, pay_client_mock: gpay.GooglePayApiClient):
         assert pay_client_mock["client"]
 
+    def test_session_reused(self, app: "Flask", pay_client_mock):
+        with app.app_context():
+            another_client = gpay.new_client()
+
+        assert another_client._session is pay_client_mock["client"]._session
+        pay_client_mock["mock_auth_session"].assert_called_once()
+        pay_client_mock[
+            "mock_service_account"
+        ].Credentials.from_service_account_file.assert_called_once()
+
     def test_request(self, pay_client_mock: gpay.GooglePayApiClient):
         response = pay_client_mock["client"].request(
             method="GET",
@@ -128,12 +148,12 @@ class TestGooglePayApiClient:
         assert response
         mock_new_client.return_value.insert_class.assert_called_once()
 
-    # def test_patch_object(self, pay_client_mock: gpay.GooglePayApiClient):
-    #     response = pay_client_mock["client"].patch_object(
-    #         object_id="test-object_id",
-    #         payload=dict(),
-    #     )
-    #     assert response
+    def test_patch_object(self, pay_client_mock: gpay.GooglePayApiClient):
+        response = pay_client_mock["client"].patch_object(
+            object_id="test-object_id",
+            payload=dict(),
+        )
+        assert response
 
 
 class TestGeneratePassJwt:
@@ -152,4 +172,113 @@ class TestGeneratePassJwt:
         assert result
 
         mock_new_google_pass_jwt.assert_called_once()
-        mock_gpay_client.insert_object.assert_called_once()
+        mock_gpay_client.insert_object.assert_not_called()
+
+
+class TestSyncPassObject:
+    def test_sync_inserts_new_object(
+        self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
+    ):
+        mock_new_client = mocker.patch("member_card.passes.gpay.new_client")
+        mock_gpay_client = mock_new_client.return_value
+        mock_gpay_client.insert_object.return_value.status_code = 200
+
+        with app.app_context():
+            response = gpay.sync_pass_object(membership_card=fake_card)
+            assert not gpay.pass_object_needs_sync(fake_card)
+
+        assert response is mock_gpay_client.insert_object.return_value
+        mock_gpay_client.patch_object.assert_not_called()
+        assert fake_card.google_pay_object_hash
+        assert fake_card.google_pay_object_synced_at
+
+    def test_sync_patches_existing_object(
+        self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
+    ):
+        mock_new_client = mocker.patch("member_card.passes.gpay.new_client")
+        mock_gpay_client = mock_new_client.return_value
+        mock_gpay_client.insert_object.return_value.status_code = 409
+        mock_gpay_client.patch_object.return_value.status_code = 200
+
+        with app.app_context():
+            response = gpay.sync_pass_object(membership_card=fake_card)
+
+        assert response is mock_gpay_client.patch_object.return_value
+        mock_gpay_client.patch_object.return_value.raise_for_status.assert_called_once()
+
+    def test_sync_skips_unchanged_object(
+        self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
+    ):
+        mock_new_client = mocker.patch("member_card.passes.gpay.new_client")
+        with app.app_context():
+            payload_hash = gpay.hash_pass_object_payload(
+                gpay.get_pass_object_payload(fake_card)
+            )
+            fake_card.google_pay_object_hash = payload_hash
+
+            assert gpay.sync_pass_object(membership_card=fake_card) is None
+
+        mock_new_client.assert_not_called()
+
+
+class TestGetPassJwt:
+    @pytest.fixture()
+    def mock_generate_pass_jwt(self, mocker: "MockerFixture"):
+        mock_generate_pass_jwt = mocker.patch(
+            "member_card.passes.gpay.generate_pass_jwt"
+        )
+        mock_generate_pass_jwt.return_value = b"test-signed-jwt"
+        return mock_generate_pass_jwt
+
+    def test_signed_jwt_reused(
+        self, app: "Flask", fake_card: "MembershipCard", mock_generate_pass_jwt
+    ):
+        with app.app_context():
+            first_jwt = gpay.save_pass_jwt(membership_card=fake_card)
+            second_jwt = gpay.save_pass_jwt(membership_card=fake_card)
+            third_jwt = gpay.get_pass_jwt(membership_card=fake_card)
+
+        assert first_jwt == second_jwt == third_jwt == "test-signed-jwt"
+        assert fake_card.google_pay_jwt_value == "test-signed-jwt"
+        mock_generate_pass_jwt.assert_called_once()
+
+    def test_get_pass_jwt_not_persisted(
+        self,
+        app: "Flask",
+        fake_card: "MembershipCard",
+        mock_generate_pass_jwt,
+        mocker: "MockerFixture",
+    ):
+        mock_generate_pass_jwt.return_value = b"test-unsaved-jwt"
+        fake_card.google_pay_jwt_signed_at = None
+        with app.app_context():
+            mock_commit = mocker.patch("member_card.passes.gpay.db.session.commit")
+            assert gpay.get_pass_jwt(membership_card=fake_card) == "test-unsaved-jwt"
+            assert fake_card.google_pay_jwt_value != "test-unsaved-jwt"
+            mock_commit.assert_not_called()
+
+    def test_resigned_when_pass_class_changes(
+        self, app: "Flask", fake_card: "MembershipCard", mock_generate_pass_jwt
+    ):
+        with app.app_context():
+            gpay.save_pass_jwt(membership_card=fake_card)
+            original_class_id = app.config["GOOGLE_PAY_PASS_CLASS_ID"]
+            app.config["GOOGLE_PAY_PASS_CLASS_ID"] = f"{original_class_id}-v2"
+            try:
+                gpay.save_pass_jwt(membership_card=fake_card)
+            finally:
+                app.config["GOOGLE_PAY_PASS_CLASS_ID"] = original_class_id
+
+        assert mock_generate_pass_jwt.call_count == 2
+
+    def test_resigned_when_expired(
+        self, app: "Flask", fake_card: "MembershipCard", mock_generate_pass_jwt
+    ):
+        with app.app_context():
+            gpay.save_pass_jwt(membership_card=fake_card)
+            fake_card.google_pay_jwt_signed_at -= timedelta(
+                seconds=app.config["GOOGLE_PAY_JWT_MAX_AGE_SECS"] + 1
+            )
+            gpay.save_pass_jwt(membership_card=fake_card)
+
+        assert mock_generate_pass_jwt.call_count == 2
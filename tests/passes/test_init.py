@@ -2,6 +2,8 @@ from member_card import passes
 from urllib.parse import urlparse
 from typing import TYPE_CHECKING
 
+from google.api_core.exceptions import NotFound
+
 if TYPE_CHECKING:
     from flask import Flask
     from member_card.models import MembershipCard
@@ -55,18 +57,88 @@ class TestPkPass:
         assert pkpass_buffer
         mock_create_passfile().create.assert_called_once()
 
+    def test_load_passfile_files(self, app: "Flask"):
+        static_dir = f"{app.config['BASE_DIR']}/static"
+        passfile_files = passes.load_passfile_files(static_dir)
+        assert set(passfile_files) == set(passes.AppleWalletPass.passfile_files)
+        assert passes.load_passfile_files(static_dir) is passfile_files
+
     def test_get_apple_pass_from_card(
         self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
     ):
+        mocker.patch.dict("member_card.passes._apple_pass_cache", clear=True)
+        mock_create_pkpass = mocker.patch("member_card.passes.create_pkpass")
+        mock_create_pkpass.return_value.getvalue.return_value = b"fake-pkpass"
+        pkpass_data = passes.get_apple_pass_from_card(membership_card=fake_card)
+        mock_create_pkpass.assert_called_once()
+        assert pkpass_data == b"fake-pkpass"
+
+        # Unchanged card => pkpass served from the cache without being re-signed
+        assert passes.get_apple_pass_from_card(membership_card=fake_card) == pkpass_data
+        mock_create_pkpass.assert_called_once()
+
+    def test_get_apple_pass_from_card_changed_card(
+        self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
+    ):
+        mocker.patch.dict("member_card.passes._apple_pass_cache", clear=True)
         mock_create_pkpass = mocker.patch("member_card.passes.create_pkpass")
         passes.get_apple_pass_from_card(membership_card=fake_card)
+
+        fake_card.logo_text = "Los Verdes (Updated)"
+        passes.get_apple_pass_from_card(membership_card=fake_card)
+
+        assert mock_create_pkpass.call_count == 2
+
+    def test_get_apple_pass_from_card_cache_eviction(
+        self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
+    ):
+        mocker.patch.dict("member_card.passes._apple_pass_cache", clear=True)
+        mocker.patch.dict(app.config, {"APPLE_PASS_CACHE_MAX_ENTRIES": 1})
+        with app.app_context():
+            passes.cache_apple_pass_locally("first", b"first-pkpass")
+            passes.cache_apple_pass_locally("second", b"second-pkpass")
+
+        assert passes.get_locally_cached_apple_pass("first") is None
+        assert passes.get_locally_cached_apple_pass("second") == b"second-pkpass"
+
+    def test_get_apple_pass_from_card_gcs_cache(
+        self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
+    ):
+        mocker.patch.dict("member_card.passes._apple_pass_cache", clear=True)
+        mocker.patch.dict(app.config, {"APPLE_PASS_CACHE_GCS_ENABLED": True})
+        mock_get_bucket = mocker.patch("member_card.passes.get_bucket")
+        mock_blob = mock_get_bucket.return_value.blob.return_value
+        mock_blob.download_as_bytes.return_value = b"gcs-cached-pkpass"
+        mock_create_pkpass = mocker.patch("member_card.passes.create_pkpass")
+
+        pkpass_data = passes.get_apple_pass_from_card(membership_card=fake_card)
+
+        assert pkpass_data == b"gcs-cached-pkpass"
+        mock_create_pkpass.assert_not_called()
+        remote_path = mock_get_bucket.return_value.blob.call_args.args[0]
+        assert remote_path.startswith(passes.REMOTE_APPLE_PASS_CACHE_BASE_PATH)
+
+    def test_get_apple_pass_from_card_gcs_cache_miss(
+        self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
+    ):
+        mocker.patch.dict("member_card.passes._apple_pass_cache", clear=True)
+        mocker.patch.dict(app.config, {"APPLE_PASS_CACHE_GCS_ENABLED": True})
+        mock_get_bucket = mocker.patch("member_card.passes.get_bucket")
+        mock_blob = mock_get_bucket.return_value.blob.return_value
+        mock_blob.download_as_bytes.side_effect = NotFound("nope")
+        mock_upload = mocker.patch("member_card.passes.upload_data_to_gcs")
+        mock_create_pkpass = mocker.patch("member_card.passes.create_pkpass")
+
+        passes.get_apple_pass_from_card(membership_card=fake_card)
+
         mock_create_pkpass.assert_called_once()
+        mock_upload.assert_called_once()
 
     def test_generate_and_upload_apple_pass(
         self, app: "Flask", fake_card: "MembershipCard", mocker: "MockerFixture"
     ):
         mock_get_pass = mocker.patch("member_card.passes.get_apple_pass_from_card")
-        mock_upload = mocker.patch("member_card.passes.upload_file_to_gcs")
+        mock_upload = mocker.patch("member_card.passes.upload_data_to_gcs")
         mock_get_bucket = mocker.patch("member_card.passes.get_bucket")
 
         mock_blob = mock_upload.return_value
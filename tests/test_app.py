@@ -348,23 +348,48 @@ class TestAuthenticatedRequests:
         mocker: "MockerFixture",
     ):
         # mock_get_card.return_value
-        mock_generate_pass_jwt = mocker.patch(
-            "member_card.models.membership_card.generate_pass_jwt"
+        mock_get_pass_jwt = mocker.patch(
+            "member_card.models.membership_card.get_pass_jwt"
         )
         response = authenticated_client.get("/passes/google-pay")
 
-        mock_generate_pass_jwt.assert_not_called()
+        mock_get_pass_jwt.assert_not_called()
         assert response.location == "http://localhost/no-active-membership-found"
 
     def test_passes_google_pay_with_active_membership(
         self,
         authenticated_client: "FlaskClient",
         fake_card,
+        mocker: "MockerFixture",
+    ):
+        mock_publish_message = mocker.patch("member_card.app.publish_message")
+        mock_save_pass_jwt = mocker.patch("member_card.app.gpay.save_pass_jwt")
+        fake_card._google_pay_jwt = "test_google_pay_jwt"
+        response = authenticated_client.get("/passes/google-pay")
+
+        assert response.location == fake_card.google_pass_save_url
+        mock_save_pass_jwt.assert_called_once()
+        mock_publish_message.assert_called_once()
+        assert mock_publish_message.call_args.kwargs["message_data"] == dict(
+            type="sync_google_pay_object_request",
+            member_email_address=fake_card.user.email,
+        )
+
+    def test_passes_google_pay_already_synced(
+        self,
+        authenticated_client: "FlaskClient",
+        fake_card,
+        mocker: "MockerFixture",
     ):
+        mocker.patch("member_card.app.gpay.pass_object_needs_sync", return_value=False)
+        mock_publish_message = mocker.patch("member_card.app.publish_message")
+        mock_save_pass_jwt = mocker.patch("member_card.app.gpay.save_pass_jwt")
         fake_card._google_pay_jwt = "test_google_pay_jwt"
         response = authenticated_client.get("/passes/google-pay")
 
         assert response.location == fake_card.google_pass_save_url
+        mock_save_pass_jwt.assert_called_once()
+        mock_publish_message.assert_not_called()
 
     def test_passes_apple_pay_no_active_membership(
         self,
@@ -384,16 +409,12 @@ class TestAuthenticatedRequests:
         authenticated_client: "FlaskClient",
         fake_card,
         mocker: "MockerFixture",
-        tmpdir,
     ):
         mock_get_apple_pass_from_card = mocker.patch(
             "member_card.app.get_apple_pass_from_card"
         )
         fake_pkpass_content = "<insert pass here>"
-        p = tmpdir.join("path.pkpass")
-        p.write(fake_pkpass_content)
-        fake_pkpass_path = p.strpath
-        mock_get_apple_pass_from_card.return_value = fake_pkpass_path
+        mock_get_apple_pass_from_card.return_value = fake_pkpass_content.encode("utf-8")
         response = authenticated_client.get("/passes/apple-pay")
         assert fake_pkpass_content.encode("utf-8") in response.data
         assert response.headers["Content-Type"] == "application/vnd.apple.pkpass"
@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from typing import TYPE_CHECKING
 
 import pytest
@@ -6,7 +7,7 @@ from mock import sentinel
 
 from member_card import bigcommerce
 from member_card.db import db
-from member_card.models import AnnualMembership, User
+from member_card.models import AnnualMembership, User, table_metadata
 
 if TYPE_CHECKING:
     from flask import Flask
@@ -253,13 +254,83 @@ def test_parse_subscription_orders(app: "Flask", mock_order, mocker):
     ]
     mock_order["date_shipped"] = "2023-01-02T11:22:33Z"
     with app.app_context():
-        returned_membership_orders = bigcommerce.parse_subscription_orders(
+        membership_counts = bigcommerce.parse_subscription_orders(
             bigcommerce_client=mock_bigcomm_api,
             membership_skus=app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"],
             subscription_orders=[mock_order],
         )
-        assert len(returned_membership_orders) == 1
-        assert returned_membership_orders[0].fulfilled_on is not None
+        membership = AnnualMembership.query.filter_by(
+            order_id=f'{mock_order["id"]}_bc'
+        ).one()
+        assert membership_counts["active"] + membership_counts["inactive"] == 1
+        assert membership_counts["unchanged"] == 0
+        assert membership.fulfilled_on is not None
+
+        membership_counts = bigcommerce.parse_subscription_orders(
+            bigcommerce_client=mock_bigcomm_api,
+            membership_skus=app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"],
+            subscription_orders=[mock_order],
+        )
+        assert membership_counts["active"] + membership_counts["inactive"] == 0
+        assert membership_counts["unchanged"] == 1
+
+
+def test_fetch_order_products_preserves_order(mocker):
+    mock_bigcomm_api = mocker.MagicMock()
+    mock_bigcomm_api.connection.rate_limit = {}
+    mock_bigcomm_api.OrderProducts.all.side_effect = lambda order_id: [
+        dict(id=order_id, sku="LOSV-MEM-0001")
+    ]
+    orders = [dict(id=order_id) for order_id in range(10)]
+
+    orders_with_products = list(
+        bigcommerce.fetch_order_products(
+            bigcommerce_client=mock_bigcomm_api,
+            orders=orders,
+            max_workers=3,
+        )
+    )
+
+    assert [o["id"] for o, _ in orders_with_products] == list(range(10))
+    assert all(o["id"] == p[0]["id"] for o, p in orders_with_products)
+    assert mock_bigcomm_api.OrderProducts.all.call_count == 10
+
+
+def test_wait_for_rate_limit_reset(mocker):
+    mock_sleep = mocker.patch("member_card.bigcommerce.sleep")
+    mock_bigcomm_api = mocker.MagicMock()
+    mock_bigcomm_api.connection.rate_limit = dict(
+        ms_until_reset=2500,
+        window_size_ms=30000,
+        requests_remaining=1,
+        requests_quota=150,
+    )
+
+    bigcommerce.wait_for_rate_limit_reset(mock_bigcomm_api, min_requests_remaining=5)
+    mock_sleep.assert_called_once_with(2.5)
+
+    mock_sleep.reset_mock()
+    mock_bigcomm_api.connection.rate_limit["requests_remaining"] = 100
+    bigcommerce.wait_for_rate_limit_reset(mock_bigcomm_api, min_requests_remaining=5)
+    mock_sleep.assert_not_called()
+
+
+def test_get_order_products_retries_when_rate_limited(mocker):
+    from bigcommerce.exception import RateLimitingException
+
+    mock_sleep = mocker.patch("member_card.bigcommerce.sleep")
+    mock_response = mocker.MagicMock()
+    mock_response.headers = {"X-Rate-Limit-Time-Reset-Ms": "1000"}
+    mock_bigcomm_api = mocker.MagicMock()
+    mock_bigcomm_api.OrderProducts.all.side_effect = [
+        RateLimitingException("429 Too Many Requests", mock_response),
+        [dict(id=1, sku="LOSV-MEM-0001")],
+    ]
+
+    order_products = bigcommerce.get_order_products(mock_bigcomm_api, order_id=100)
+
+    assert order_products == [dict(id=1, sku="LOSV-MEM-0001")]
+    mock_sleep.assert_called_once_with(1.0)
 
 
 def test_load_all_bigcommerce_orders(app: "Flask", mocker):
@@ -300,7 +371,9 @@ def test_load_single_order(app: "Flask", mock_order, mocker):
 def test_bigcommerce_orders_etl(app: "Flask", mock_order, mocker):
     mock_bigcomm_api_class = mocker.patch("member_card.bigcommerce.BigcommerceApi")
     mock_bigcomm_api = mock_bigcomm_api_class()
-    mock_load_orders = mocker.patch("member_card.bigcommerce.load_orders")
+    mock_iter_orders = mocker.patch(
+        "member_card.bigcommerce.iter_orders_by_date_modified"
+    )
     mock_parser_orders = mocker.patch(
         "member_card.bigcommerce.parse_subscription_orders"
     )
@@ -311,10 +384,106 @@ def test_bigcommerce_orders_etl(app: "Flask", mock_order, mocker):
             bigcommerce_client=mock_bigcomm_api,
             membership_skus=app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"],
         )
-    mock_load_orders.assert_called_once()
+    mock_iter_orders.assert_called_once()
     mock_parser_orders.assert_called_once()
 
 
+def test_bigcommerce_orders_etl_date_modified_cursor(app: "Flask", mock_order, mocker):
+    mock_bigcomm_api = mocker.MagicMock()
+    mock_bigcomm_api.connection.rate_limit = {}
+    mock_bigcomm_api.OrderProducts.all.return_value = [
+        dict(
+            id=1,
+            product_id=123,
+            name="LOS VERDES TEST MEMBERSHIP!",
+            sku=app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"][0],
+        ),
+    ]
+    mock_bigcomm_api.Orders.all.return_value = [mock_order]
+    table_name = AnnualMembership.__tablename__
+    previous_date_modified = datetime(2018, 12, 1, tzinfo=timezone.utc)
+
+    with app.app_context():
+        table_metadata.set_last_date_modified(table_name, previous_date_modified)
+        db.session.commit()
+
+        bigcommerce.bigcommerce_orders_etl(
+            bigcommerce_client=mock_bigcomm_api,
+            membership_skus=app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"],
+        )
+        last_date_modified = table_metadata.get_last_date_modified(table_name)
+
+    mock_bigcomm_api.Orders.all.assert_called_once_with(
+        min_date_modified=previous_date_modified.isoformat(),
+        sort="date_modified:asc",
+        limit=250,
+        page=1,
+    )
+    assert last_date_modified == datetime(2018, 12, 5, 20, 16, 55, tzinfo=timezone.utc)
+
+
+def test_bigcommerce_orders_etl_cursor_unchanged_on_failure(
+    app: "Flask", mock_order, mocker
+):
+    mock_bigcomm_api = mocker.MagicMock()
+    mock_bigcomm_api.connection.rate_limit = {}
+    mock_bigcomm_api.OrderProducts.all.side_effect = Exception("oh no")
+    mock_bigcomm_api.Orders.all.return_value = [mock_order]
+    table_name = AnnualMembership.__tablename__
+    previous_date_modified = datetime(2018, 12, 1, tzinfo=timezone.utc)
+
+    with app.app_context():
+        table_metadata.set_last_date_modified(table_name, previous_date_modified)
+        db.session.commit()
+
+        with pytest.raises(Exception, match="oh no"):
+            bigcommerce.bigcommerce_orders_etl(
+                bigcommerce_client=mock_bigcomm_api,
+                membership_skus=app.config["BIGCOMMERCE_MEMBERSHIP_SKUS"],
+            )
+        last_date_modified = table_metadata.get_last_date_modified(table_name)
+
+    assert last_date_modified == previous_date_modified
+
+
+def test_iter_orders_by_date_modified(mocker):
+    def order(order_id, date_modified):
+        return dict(id=order_id, date_modified=date_modified)
+
+    first_date_modified = "Wed, 05 Dec 2018 20:16:55 +0000"
+    second_date_modified = "Thu, 06 Dec 2018 10:00:00 +0000"
+    mock_bigcomm_api = mocker.MagicMock()
+    mock_bigcomm_api.Orders.all.side_effect = [
+        [order(1, first_date_modified), order(2, first_date_modified)],
+        # order 1 was modified again mid-run and moved to the end of the sort
+        [order(2, first_date_modified), order(3, second_date_modified)],
+        [order(3, second_date_modified), order(4, second_date_modified)],
+        [order(5, second_date_modified), order(1, second_date_modified)],
+        [order(6, second_date_modified)],
+    ]
+    min_date_modified = datetime(2018, 12, 1, tzinfo=timezone.utc)
+
+    orders = list(
+        bigcommerce.iter_orders_by_date_modified(
+            bigcommerce_client=mock_bigcomm_api,
+            min_date_modified=min_date_modified,
+            page_size=2,
+        )
+    )
+
+    assert [o["id"] for o in orders] == [1, 2, 3, 4, 5, 1, 6]
+    assert [
+        (c.kwargs["min_date_modified"], c.kwargs["page"])
+        for c in mock_bigcomm_api.Orders.all.call_args_list
+    ] == [
+        (min_date_modified.isoformat(), 1),
+        ("2018-12-05T20:16:55+00:00", 1),
+        ("2018-12-06T10:00:00+00:00", 1),
+        ("2018-12-06T10:00:00+00:00", 2),
+        ("2018-12-06T10:00:00+00:00", 3),
+    ]
+
+
 def test_load_orders(app: "Flask", mock_order, mocker):
     mock_bigcomm_api_class = mocker.patch("member_card.bigcommerce.BigcommerceApi")
     mock_bigcomm_api = mock_bigcomm_api_class()
@@ -1,3 +1,4 @@
+from concurrent.futures import Future
 from typing import TYPE_CHECKING
 from member_card.models import User, AnnualMembership
 from member_card.db import db
@@ -106,6 +107,119 @@ class TestCommands:
             output_path=app.config["BASE_DIR"],
         )
 
+    def test_cards_detect_missing_card_images(
+        self,
+        runner: "FlaskCliRunner",
+        fake_card: "MembershipCard",
+        mocker: "MockerFixture",
+    ):
+        mocker.patch("member_card.commands.get_bucket")
+        mocker.patch(
+            "member_card.commands.find_cards_missing_images",
+            return_value=[fake_card],
+        )
+        mock_publish_message = mocker.patch("member_card.commands.publish_message")
+        mocker.patch("member_card.commands.futures")
+
+        result = runner.invoke(args=["cards", "detect-missing-card-images"])
+
+        assert result.exit_code == 0
+        mock_publish_message.assert_called_once()
+        assert (
+            mock_publish_message.call_args.kwargs["message_data"][
+                "member_email_address"
+            ]
+            == fake_card.user.email
+        )
+
+    def test_cards_publish_google_pay_object_syncs(
+        self,
+        runner: "FlaskCliRunner",
+        fake_card: "MembershipCard",
+        mocker: "MockerFixture",
+    ):
+        mock_publish_message = mocker.patch("member_card.commands.publish_message")
+        mocker.patch("member_card.commands.futures")
+
+        result = runner.invoke(args=["cards", "publish-google-pay-object-syncs"])
+
+        assert result.exit_code == 0
+        mock_publish_message.assert_called_once()
+        assert mock_publish_message.call_args.kwargs["message_data"] == dict(
+            type="sync_google_pay_object_request",
+            member_email_address=fake_card.user.email,
+        )
+
+    def test_cards_backfill_card_images(
+        self,
+        app: "Flask",
+        runner: "FlaskCliRunner",
+        fake_card: "MembershipCard",
+        mocker: "MockerFixture",
+    ):
+        mock_get_bucket = mocker.patch("member_card.commands.get_bucket")
+        mocker.patch(
+            "member_card.commands.find_cards_missing_images",
+            return_value=[fake_card],
+        )
+        mock_get_renderer_pool = mocker.patch("member_card.commands.get_renderer_pool")
+        mock_backfill = mocker.patch("member_card.commands.backfill_card_images")
+        mock_backfill.return_value = iter([(fake_card.serial_number, None)])
+
+        result = runner.invoke(
+            args=["cards", "backfill-card-images", "--concurrency", "3"]
+        )
+
+        assert result.exit_code == 0
+        assert "#1 of 1 card images backfilled" in result.output
+        mock_get_renderer_pool.assert_called_once_with(pool_size=3)
+        mock_backfill.assert_called_once_with(
+            app=app,
+            image_bucket=mock_get_bucket.return_value,
+            serial_numbers=[fake_card.serial_number],
+            max_workers=3,
+        )
+
+    def test_cards_backfill_card_images_failures(
+        self,
+        runner: "FlaskCliRunner",
+        fake_card: "MembershipCard",
+        mocker: "MockerFixture",
+    ):
+        mocker.patch("member_card.commands.get_bucket")
+        mocker.patch(
+            "member_card.commands.find_cards_missing_images",
+            return_value=[fake_card],
+        )
+        mock_backfill = mocker.patch("member_card.commands.backfill_card_images")
+        mock_backfill.return_value = iter(
+            [(fake_card.serial_number, RuntimeError("nope"))]
+        )
+
+        result = runner.invoke(args=["cards", "backfill-card-images"])
+
+        assert result.exit_code == 1
+        assert fake_card.serial_number_hex in result.output
+
+    def test_cards_backfill_card_images_dry_run(
+        self,
+        runner: "FlaskCliRunner",
+        fake_card: "MembershipCard",
+        mocker: "MockerFixture",
+    ):
+        mocker.patch("member_card.commands.get_bucket")
+        mocker.patch(
+            "member_card.commands.find_cards_missing_images",
+            return_value=[fake_card],
+        )
+        mock_backfill = mocker.patch("member_card.commands.backfill_card_images")
+
+        result = runner.invoke(args=["cards", "backfill-card-images", "--dry-run"])
+
+        assert result.exit_code == 0
+        assert "#1 card images to backfill" in result.output
+        mock_backfill.assert_not_called()
+
     def test_query_db_no_sqlalchemy(self, runner_without_db: "FlaskCliRunner"):
         # TODO: contrived thing for getting a conditional branch covered. Can prob be moved elsewere or dropped eventually....
         result = runner_without_db.invoke(
@@ -428,3 +542,16 @@ class TestMinibcCommands:
             args=["find-missing-shipping"],
         )
         assert result.exit_code == 0
+
+
+def test_jobs_resume(runner: "FlaskCliRunner", mocker: "MockerFixture"):
+    job_future = Future()
+    job_future.set_result("test-result")
+    mock_resume_jobs = mocker.patch(
+        "member_card.commands.resume_jobs", return_value=[job_future]
+    )
+
+    result = runner.invoke(args=["jobs", "resume", "--status", "failed"])
+
+    assert result.exit_code == 0
+    assert mock_resume_jobs.call_args.kwargs["statuses"] == ("failed",)
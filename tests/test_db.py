@@ -41,6 +41,7 @@ def test_get_gcp_sql_engine_creator(app: "Flask", mocker: "MockerFixture"):
 
 
 def test_get_db_connector_sans_password(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch("member_card.db._connector", None)
     mock_connector = mocker.patch("member_card.db.connector")
     mock_conn_obj = mock_connector.Connector.return_value
     test_conn_string = "test-gcp-instance-connection-string"
@@ -65,6 +66,7 @@ def test_get_db_connector_sans_password(app: "Flask", mocker: "MockerFixture"):
 
 
 def test_get_db_connector_with_password(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch("member_card.db._connector", None)
     mock_connector = mocker.patch("member_card.db.connector")
     mock_conn_obj = mock_connector.Connector.return_value
     test_conn_string = "test-gcp-instance-connection-string"
@@ -91,6 +93,34 @@ def test_get_db_connector_with_password(app: "Flask", mocker: "MockerFixture"):
     assert mock_conn_obj._enable_iam_auth is not True
 
 
+def test_get_db_connector_reuses_connector(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch("member_card.db._connector", None)
+    mock_connector = mocker.patch("member_card.db.connector")
+    mock_conn_obj = mock_connector.Connector.return_value
+
+    with app.app_context():
+        engine_creator = db.get_gcp_sql_engine_creator(
+            instance_connection_string="test-gcp-instance-connection-string",
+            db_name="test-db-name",
+            db_user="test-db-user",
+        )
+
+    engine_creator()
+    engine_creator()
+    mock_connector.Connector.assert_called_once_with()
+    assert mock_conn_obj.connect.call_count == 2
+
+    db.close_connector()
+    mock_conn_obj.close.assert_called_once_with()
+    assert db._connector is None
+
+
+def test_get_pool_stats(app: "Flask"):
+    with app.app_context():
+        pool_stats = db.get_pool_stats(db.db.engine)
+    assert set(pool_stats) == {"size", "checkedin", "checkedout", "overflow"}
+
+
 def test_get_or_update_for_updates(
     app: "Flask", fake_membership_order: AnnualMembership
 ):
@@ -124,3 +154,132 @@ def test_get_or_update_for_creates(
             kwargs=membership_kwargs,
         )
     assert updated_membership.order_id == membership_kwargs["order_id"]
+
+
+def test_bulk_upsert(app: "Flask", fake_membership_order: AnnualMembership):
+    new_order_id = str(uuid.uuid4())[:30]
+    membership_rows = [
+        {
+            "order_id": fake_membership_order.order_id,
+            "order_number": fake_membership_order.order_number,
+            "created_on": fake_membership_order.created_on,
+            "channel_name": "test-bulk-upsert",
+            "customer_email": None,
+        },
+        {
+            "order_id": new_order_id,
+            "order_number": str(uuid.uuid4())[:30],
+            "created_on": datetime.utcnow().replace(tzinfo=timezone.utc),
+            "channel_name": "test-bulk-upsert",
+        },
+    ]
+
+    membership_ids = db.bulk_upsert(
+        session=db.db.session,
+        model=AnnualMembership,
+        rows=membership_rows,
+        conflict_keys=["order_id"],
+    )
+    memberships = db.get_instances_by_pks(
+        session=db.db.session,
+        model=AnnualMembership,
+        pks=membership_ids,
+    )
+
+    assert len(memberships) == 2
+    assert memberships[0].id == fake_membership_order.id
+    assert memberships[0].channel_name == "test-bulk-upsert"
+    # `None` values don't clobber extant column values
+    assert memberships[0].customer_email == fake_membership_order.customer_email
+    assert memberships[1].order_id == new_order_id
+
+    db.db.session.delete(memberships[1])
+    db.db.session.commit()
+
+
+def test_get_source_fingerprint():
+    assert db.get_source_fingerprint(dict(a=1, b=2)) == db.get_source_fingerprint(
+        dict(b=2, a=1)
+    )
+    assert db.get_source_fingerprint(dict(a=1)) != db.get_source_fingerprint(dict(a=2))
+
+
+def test_filter_unchanged_rows(app: "Flask", fake_membership_order: AnnualMembership):
+    fake_membership_order.source_fingerprint = db.get_source_fingerprint("v1")
+    db.db.session.commit()
+    membership_rows = [
+        dict(
+            order_id=fake_membership_order.order_id,
+            source_fingerprint=db.get_source_fingerprint("v1"),
+        ),
+        dict(order_id="some-new-order-id", source_fingerprint="whatever"),
+    ]
+
+    changed_rows = db.filter_unchanged_rows(
+        session=db.db.session,
+        model=AnnualMembership,
+        rows=membership_rows,
+        key="order_id",
+    )
+    assert changed_rows == membership_rows[1:]
+
+    membership_rows[0]["source_fingerprint"] = db.get_source_fingerprint("v2")
+    changed_rows = db.filter_unchanged_rows(
+        session=db.db.session,
+        model=AnnualMembership,
+        rows=membership_rows,
+        key="order_id",
+    )
+    assert changed_rows == membership_rows
+
+
+def test_chunked():
+    assert list(db.chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_unit_of_work_commits_every_n_records(app: "Flask", mocker: "MockerFixture"):
+    mock_session = mocker.MagicMock()
+    with app.app_context():
+        with db.unit_of_work(
+            session=mock_session, commit_every=2, commit_interval_secs=600
+        ) as uow:
+            for _ in range(5):
+                db.checkpoint()
+            assert mock_session.commit.call_count == 2
+
+    # plus one final commit for the remaining record on exit
+    assert mock_session.commit.call_count == 3
+    assert uow.num_committed == 5
+
+
+def test_unit_of_work_rolls_back_on_failure(app: "Flask", mocker: "MockerFixture"):
+    mock_session = mocker.MagicMock()
+    with app.app_context():
+        try:
+            with db.unit_of_work(session=mock_session, commit_every=10):
+                db.checkpoint()
+                raise RuntimeError("chunk failed partway through")
+        except RuntimeError:
+            pass
+
+    mock_session.commit.assert_not_called()
+    mock_session.rollback.assert_called_once()
+
+
+def test_unit_of_work_nested(app: "Flask", mocker: "MockerFixture"):
+    mock_session = mocker.MagicMock()
+    with app.app_context():
+        with db.unit_of_work(session=mock_session, commit_every=10) as outer_uow:
+            with db.unit_of_work() as inner_uow:
+                assert inner_uow is outer_uow
+                db.checkpoint(num_records=0, flush=True)
+            mock_session.commit.assert_not_called()
+            mock_session.flush.assert_called_once()
+
+    mock_session.commit.assert_called_once()
+
+
+def test_checkpoint_sans_unit_of_work(app: "Flask", mocker: "MockerFixture"):
+    mock_session = mocker.MagicMock()
+    db.checkpoint(session=mock_session)
+    mock_session.commit.assert_called_once()
@@ -1,4 +1,5 @@
 import json
+from concurrent import futures
 from typing import TYPE_CHECKING
 
 from google.cloud import pubsub_v1
@@ -9,13 +10,11 @@ if TYPE_CHECKING:
     from pytest_mock.plugin import MockerFixture
 
 
-def test_publish_message(mocker: "MockerFixture"):
-    mock_futures = mocker.patch("member_card.gcp.futures")
-
+def test_publish_message(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch("member_card.gcp._publisher", None)
     mock_publisher = mocker.create_autospec(pubsub_v1.PublisherClient)
-    mocker.patch(
-        "member_card.gcp.pubsub_v1"
-    ).PublisherClient.return_value = mock_publisher
+    mock_pubsub = mocker.patch("member_card.gcp.pubsub_v1")
+    mock_pubsub.PublisherClient.return_value = mock_publisher
 
     test_topic_path = "test-topic-path"
     mock_publisher.topic_path.return_value = test_topic_path
@@ -24,20 +23,47 @@ def test_publish_message(mocker: "MockerFixture"):
     test_topic_id = "test-topic"
     test_message_data = {"this-is": "a-test"}
 
-    gcp.publish_message(
-        project_id=test_project_id,
-        topic_id=test_topic_id,
-        message_data=test_message_data,
+    with app.app_context():
+        for _ in range(2):
+            publish_future = gcp.publish_message(
+                project_id=test_project_id,
+                topic_id=test_topic_id,
+                message_data=test_message_data,
+            )
+
+    mock_pubsub.PublisherClient.assert_called_once_with(
+        batch_settings=mock_pubsub.types.BatchSettings.return_value
     )
-
-    mock_publisher.publish.assert_called_once_with(
+    mock_publisher.publish.assert_called_with(
         test_topic_path, json.dumps(test_message_data).encode("utf-8")
     )
+    assert publish_future == mock_publisher.publish.return_value
+    publish_future.add_done_callback.assert_called()
+    publish_future.result.assert_not_called()
 
-    mock_futures.stop()
-    mock_futures.wait.assert_called_once_with(
-        [mock_publisher.publish.return_value], return_when=mock_futures.ALL_COMPLETED
-    )
+    gcp.shutdown_publisher()
+    mock_publisher.stop.assert_called_once_with()
+
+
+def test_publish_message_failure_callback(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch("member_card.gcp._publisher", None)
+    mock_pubsub = mocker.patch("member_card.gcp.pubsub_v1")
+    mock_publisher = mock_pubsub.PublisherClient.return_value
+    test_topic_path = "test-failing-topic-path"
+    mock_publisher.topic_path.return_value = test_topic_path
+    mock_publisher.publish.return_value = futures.Future()
+
+    with app.app_context():
+        publish_future = gcp.publish_message(
+            project_id="test-project",
+            topic_id="test-topic",
+            message_data=dict(type="test"),
+        )
+
+    failures_before = gcp.publish_failures[test_topic_path]
+    publish_future.set_exception(RuntimeError("publish failed"))
+
+    assert gcp.publish_failures[test_topic_path] == failures_before + 1
 
 
 def test_retrieve_app_secrets(mocker: "MockerFixture"):
@@ -67,20 +93,31 @@ def test_retrieve_app_secrets_none_secret_name():
 
 
 def test_get_gcs_client(mocker: "MockerFixture"):
+    mocker.patch("member_card.gcp._gcs_client", None)
     mock_storage = mocker.patch("member_card.gcp.storage")
-    gcp.get_gcs_client()
+    client = gcp.get_gcs_client()
+    assert gcp.get_gcs_client() is client
     mock_storage.Client.assert_called_once()
 
 
+def test_get_gcs_client_explicit_credentials(mocker: "MockerFixture"):
+    mock_storage = mocker.patch("member_card.gcp.storage")
+    mock_credentials = mocker.Mock()
+    gcp.get_gcs_client(credentials=mock_credentials)
+    mock_storage.Client.assert_called_once_with(credentials=mock_credentials)
+
+
 def test_get_bucket_implicit_client(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch.dict("member_card.gcp._gcs_buckets", clear=True)
     mock_client = mocker.Mock()
     mock_get_client = mocker.patch("member_card.gcp.get_gcs_client")
     mock_get_client.return_value = mock_client
     with app.app_context():
         # in app context cause method being called depends on some implicit current_app.config bits...
-        gcp.get_bucket()
-    mock_get_client.assert_called_once()
-    mock_client.get_bucket.assert_called_once()
+        bucket = gcp.get_bucket()
+        assert gcp.get_bucket() is bucket
+    mock_client.bucket.assert_called_once_with(app.config["GCS_BUCKET_ID"])
+    mock_client.get_bucket.assert_not_called()
 
 
 def test_get_bucket_explicit_client(app: "Flask", mocker: "MockerFixture"):
@@ -91,7 +128,7 @@ def test_get_bucket_explicit_client(app: "Flask", mocker: "MockerFixture"):
         # in app context cause method being called depends on some implicit current_app.config bits...
         gcp.get_bucket(client=mock_client)
     mock_get_client.assert_not_called()
-    mock_client.get_bucket.assert_called_once()
+    mock_client.bucket.assert_called_once()
 
 
 def test_upload_file_to_gcs(app: "Flask", mocker: "MockerFixture"):
@@ -114,3 +151,22 @@ def test_upload_file_to_gcs(app: "Flask", mocker: "MockerFixture"):
 
     mock_bucket.blob.assert_called_with(remote_path)
     mock_blob.upload_from_filename.assert_called_with(local_file)
+
+
+def test_upload_data_to_gcs(mocker: "MockerFixture"):
+    mock_bucket = mocker.Mock()
+    mock_blob = mock_bucket.blob.return_value
+    test_data = b"some-test-data"
+
+    blob = gcp.upload_data_to_gcs(
+        bucket=mock_bucket,
+        data=test_data,
+        remote_path="test-remote-path",
+        content_type="x-some-type",
+    )
+
+    assert blob == mock_blob
+    mock_bucket.blob.assert_called_once_with("test-remote-path")
+    mock_blob.upload_from_string.assert_called_once_with(
+        test_data, content_type="x-some-type"
+    )
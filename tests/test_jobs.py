@@ -0,0 +1,346 @@
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+import pytest
+
+from member_card import jobs
+from member_card.db import db
+from member_card.models import PubsubJob
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from pytest_mock.plugin import MockerFixture
+
+
+@pytest.fixture()
+def job_handlers(mocker: "MockerFixture"):
+    return {
+        "test_job": mocker.Mock(return_value="test-result"),
+        "failing_test_job": mocker.Mock(side_effect=Exception("oh no")),
+    }
+
+
+@pytest.fixture()
+def job_runner(app: "Flask", job_handlers, mocker: "MockerFixture"):
+    mocker.patch("member_card.jobs._job_runner", None)
+    with app.app_context():
+        job_runner = jobs.get_job_runner(handlers=job_handlers)
+    yield job_runner
+    job_runner.shutdown(wait=True)
+
+
+def test_run_job(app: "Flask", job_handlers):
+    with app.app_context():
+        job = jobs.enqueue_job(message=dict(type="test_job"), message_id="1234")
+        result = jobs.run_job(job_id=job.id, handlers=job_handlers)
+        job = PubsubJob.query.filter_by(id=job.id).one()
+
+    assert result == "test-result"
+    job_handlers["test_job"].assert_called_once_with(dict(type="test_job"))
+    assert job.status == "succeeded"
+    assert job.message_id == "1234"
+    assert job.attempts == 1
+    assert job.time_finished >= job.time_started
+
+
+def test_run_job_failure(app: "Flask", job_handlers):
+    with app.app_context():
+        job = jobs.enqueue_job(message=dict(type="failing_test_job"))
+        with pytest.raises(Exception, match="oh no"):
+            jobs.run_job(job_id=job.id, handlers=job_handlers)
+        job = PubsubJob.query.filter_by(id=job.id).one()
+
+    assert job.status == "failed"
+    assert "oh no" in job.error
+
+
+def test_find_duplicate_job(app: "Flask", job_handlers):
+    with app.app_context():
+        job = jobs.enqueue_job(
+            message=dict(type="test_job"),
+            message_id="test-dupe-message-id",
+            dedup_key="test_job:test-dupe-key",
+        )
+
+        assert jobs.find_duplicate_job(message_id="test-dupe-message-id") == job
+        assert jobs.find_duplicate_job(dedup_key="test_job:test-dupe-key") == job
+        assert jobs.find_duplicate_job(message_id="some-other-message-id") is None
+        assert jobs.find_duplicate_job() is None
+
+        job.status = "failed"
+        db.session.commit()
+        assert jobs.find_duplicate_job(message_id="test-dupe-message-id") is None
+
+        job.status = "succeeded"
+        db.session.commit()
+        assert jobs.find_duplicate_job(message_id="test-dupe-message-id") == job
+
+
+def test_find_duplicate_job_lease_expired(app: "Flask", mocker: "MockerFixture"):
+    with app.app_context():
+        job = jobs.enqueue_job(
+            message=dict(type="test_job"), message_id="test-lost-message-id"
+        )
+        job.status = "running"
+        job.time_started = datetime.now(tz=timezone.utc)
+        db.session.commit()
+        assert jobs.find_duplicate_job(message_id="test-lost-message-id") == job
+
+        mocker.patch.dict(app.config, {"WORKER_JOB_LEASE_SECS": -60})
+        assert jobs.find_duplicate_job(message_id="test-lost-message-id") is None
+        job.status = "pending"
+        db.session.commit()
+        assert jobs.find_duplicate_job(message_id="test-lost-message-id") is None
+
+
+def test_find_duplicate_job_expired(app: "Flask", mocker: "MockerFixture"):
+    with app.app_context():
+        jobs.enqueue_job(
+            message=dict(type="test_job"), message_id="test-expired-message-id"
+        )
+        mocker.patch.dict(app.config, {"WORKER_JOB_DEDUP_TTL_SECS": -60})
+
+        assert jobs.find_duplicate_job(message_id="test-expired-message-id") is None
+
+
+def test_record_skipped_duplicate_job(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch.object(jobs, "skipped_duplicate_jobs", jobs.Counter())
+    with app.app_context():
+        job = jobs.enqueue_job(message=dict(type="test_job"))
+        jobs.record_skipped_duplicate_job(message=job.message, duplicate_job=job)
+
+    assert jobs.skipped_duplicate_jobs == dict(test_job=1)
+
+
+def test_job_runner_executors_per_message_type(app: "Flask", job_runner):
+    job_runner.concurrency = dict(test_job=1)
+    job_runner.default_concurrency = 3
+
+    assert job_runner.get_executor("test_job")._max_workers == 1
+    assert job_runner.get_executor("failing_test_job")._max_workers == 3
+    assert job_runner.get_executor("test_job") is job_runner.get_executor("test_job")
+
+
+def test_job_runner_submit(app: "Flask", job_runner, job_handlers):
+    with app.app_context():
+        job = jobs.enqueue_job(message=dict(type="test_job"))
+
+    assert job_runner.submit(job).result(timeout=10) == "test-result"
+
+    with app.app_context():
+        assert PubsubJob.query.filter_by(id=job.id).one().status == "succeeded"
+
+
+def test_resume_jobs(app: "Flask", job_runner, job_handlers):
+    with app.app_context():
+        PubsubJob.query.delete()
+        pending_job = jobs.enqueue_job(message=dict(type="test_job"))
+        exhausted_job = jobs.enqueue_job(message=dict(type="failing_test_job"))
+        exhausted_job.status = "failed"
+        exhausted_job.attempts = app.config["WORKER_JOB_MAX_ATTEMPTS"]
+        db.session.commit()
+
+        job_futures = jobs.resume_jobs(handlers=job_handlers)
+
+    assert [f.result(timeout=10) for f in job_futures] == ["test-result"]
+    with app.app_context():
+        assert PubsubJob.query.filter_by(id=pending_job.id).one().status == "succeeded"
+
+
+def test_supersede_pending_jobs(app: "Flask", job_handlers, mocker: "MockerFixture"):
+    mocker.patch.object(jobs, "superseded_jobs", jobs.Counter())
+    with app.app_context():
+        first_job = jobs.enqueue_job(
+            message=dict(type="test_job"), coalesce_key="test_job:1234"
+        )
+        second_job = jobs.enqueue_job(
+            message=dict(type="test_job"), coalesce_key="test_job:1234"
+        )
+        assert (
+            jobs.supersede_pending_jobs(
+                message_type="test_job", coalesce_key="test_job:1234"
+            )
+            == 2
+        )
+        latest_job = jobs.enqueue_job(
+            message=dict(type="test_job"), coalesce_key="test_job:1234"
+        )
+
+        assert jobs.run_job(job_id=first_job.id, handlers=job_handlers) is None
+        assert jobs.run_job(job_id=second_job.id, handlers=job_handlers) is None
+        assert jobs.run_job(job_id=latest_job.id, handlers=job_handlers) == (
+            "test-result"
+        )
+
+    job_handlers["test_job"].assert_called_once()
+    assert jobs.superseded_jobs == dict(test_job=2)
+
+
+def test_job_runner_submit_with_delay(app: "Flask", job_runner, job_handlers):
+    with app.app_context():
+        job = jobs.enqueue_job(
+            message=dict(type="test_job"),
+            run_after=datetime.now(tz=timezone.utc) + timedelta(seconds=0.1),
+        )
+
+    job_future = job_runner.submit(job)
+
+    assert job_future.result(timeout=10) == "test-result"
+    assert not job_runner._timers
+
+
+def test_job_runner_shutdown_cancels_delayed_jobs(
+    app: "Flask", job_runner, job_handlers
+):
+    with app.app_context():
+        job = jobs.enqueue_job(
+            message=dict(type="test_job"),
+            run_after=datetime.now(tz=timezone.utc) + timedelta(seconds=60),
+        )
+
+    job_runner.submit(job)
+    job_runner.shutdown()
+
+    job_handlers["test_job"].assert_not_called()
+    with app.app_context():
+        assert PubsubJob.query.filter_by(id=job.id).one().status == "pending"
+
+
+def test_sweep_jobs(app: "Flask", job_runner, job_handlers):
+    with app.app_context():
+        PubsubJob.query.delete()
+        lease_expired_at = jobs.get_lease_expired_before() - timedelta(seconds=1)
+        pending_job = jobs.enqueue_job(message=dict(type="test_job"))
+        failed_job = jobs.enqueue_job(message=dict(type="test_job"))
+        failed_job.status = "failed"
+        failed_job.attempts = 1
+        stale_job = jobs.enqueue_job(message=dict(type="test_job"))
+        stale_job.status = "running"
+        stale_job.attempts = 1
+        stale_job.time_started = lease_expired_at
+        running_job = jobs.enqueue_job(message=dict(type="test_job"))
+        running_job.status = "running"
+        running_job.attempts = 1
+        running_job.time_started = datetime.now(tz=timezone.utc)
+        exhausted_job = jobs.enqueue_job(message=dict(type="test_job"))
+        exhausted_job.status = "running"
+        exhausted_job.attempts = app.config["WORKER_JOB_MAX_ATTEMPTS"]
+        exhausted_job.time_started = lease_expired_at
+        db.session.commit()
+
+        expected_statuses = {
+            pending_job.id: "succeeded",
+            failed_job.id: "succeeded",
+            stale_job.id: "succeeded",
+            running_job.id: "running",
+            exhausted_job.id: "failed",
+        }
+
+        job_futures = jobs.sweep_jobs(handlers=job_handlers)
+
+    assert [f.result(timeout=10) for f in job_futures] == ["test-result"] * 3
+    with app.app_context():
+        assert {j.id: j.status for j in PubsubJob.query.all()} == expected_statuses
+
+
+def test_sweep_jobs_skips_active_jobs(app: "Flask", job_runner, job_handlers):
+    with app.app_context():
+        PubsubJob.query.delete()
+        job = jobs.enqueue_job(message=dict(type="test_job"))
+        job.run_after = datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+        db.session.commit()
+        job_runner._active_job_ids.add(job.id)
+
+        assert jobs.sweep_jobs(handlers=job_handlers) == []
+
+
+def test_sweep_jobs_past_run_after(app: "Flask", job_runner, job_handlers):
+    with app.app_context():
+        PubsubJob.query.delete()
+        now = datetime.now(tz=timezone.utc)
+        # e.g. left pending by a worker instance that shut down mid coalescing window
+        due_job = jobs.enqueue_job(
+            message=dict(type="test_job"), run_after=now - timedelta(seconds=1)
+        )
+        jobs.enqueue_job(
+            message=dict(type="test_job"), run_after=now + timedelta(seconds=60)
+        )
+        due_job_id = due_job.id
+
+        job_futures = jobs.sweep_jobs(handlers=job_handlers)
+
+    assert [f.result(timeout=10) for f in job_futures] == ["test-result"]
+    with app.app_context():
+        assert PubsubJob.query.filter_by(id=due_job_id).one().status == "succeeded"
+
+
+def test_prune_jobs(app: "Flask", job_runner, job_handlers):
+    with app.app_context():
+        PubsubJob.query.delete()
+        expired_at = datetime.now(tz=timezone.utc) - timedelta(
+            seconds=app.config["WORKER_JOB_DEDUP_TTL_SECS"] + 60
+        )
+        expired_jobs = []
+        for status in ["succeeded", "failed", "superseded", "pending"]:
+            job = jobs.enqueue_job(message=dict(type="test_job"))
+            job.status = status
+            job.attempts = app.config["WORKER_JOB_MAX_ATTEMPTS"]
+            job.time_created = expired_at
+            expired_jobs.append(job)
+        recent_job = jobs.enqueue_job(message=dict(type="test_job"))
+        recent_job.status = "succeeded"
+        db.session.commit()
+        expected_job_ids = [expired_jobs[-1].id, recent_job.id]
+
+        assert jobs.sweep_jobs(handlers=job_handlers) == []
+        assert [j.id for j in PubsubJob.query.order_by(PubsubJob.id)] == (
+            expected_job_ids
+        )
+
+
+def test_enqueue_job_message_id_conflict(app: "Flask"):
+    with app.app_context():
+        job = jobs.enqueue_job(
+            message=dict(type="test_job"), message_id="test-conflicting-message-id"
+        )
+        assert job is not None
+        assert (
+            jobs.enqueue_job(
+                message=dict(type="test_job"),
+                message_id="test-conflicting-message-id",
+            )
+            is None
+        )
+        # Jobs without a message ID never conflict
+        assert jobs.enqueue_job(message=dict(type="test_job")) is not None
+        assert jobs.enqueue_job(message=dict(type="test_job")) is not None
+        assert (
+            PubsubJob.query.filter_by(message_id="test-conflicting-message-id").count()
+            == 1
+        )
+
+
+def test_supersede_pending_jobs_before_job_id(app: "Flask", job_handlers):
+    with app.app_context():
+        first_job = jobs.enqueue_job(
+            message=dict(type="test_job"), coalesce_key="test_job:4321"
+        )
+        second_job = jobs.enqueue_job(
+            message=dict(type="test_job"), coalesce_key="test_job:4321"
+        )
+        first_job_id, second_job_id = first_job.id, second_job.id
+
+        jobs.supersede_pending_jobs(
+            message_type="test_job",
+            coalesce_key="test_job:4321",
+            before_job_id=first_job_id,
+        )
+        assert PubsubJob.query.get(first_job_id).status == "pending"
+
+        jobs.supersede_pending_jobs(
+            message_type="test_job",
+            coalesce_key="test_job:4321",
+            before_job_id=second_job_id,
+        )
+        assert PubsubJob.query.get(first_job_id).status == "superseded"
+        assert PubsubJob.query.get(second_job_id).status == "pending"
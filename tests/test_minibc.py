@@ -1,8 +1,10 @@
+from copy import deepcopy
 from typing import TYPE_CHECKING
 
 import pytest
 
 from member_card import minibc
+from member_card.models import Subscription
 
 if TYPE_CHECKING:
     from flask import Flask
@@ -86,7 +88,87 @@ def mock_subscriptions():
 
 def test_parse_subscriptions(app: "Flask", mock_subscriptions, mocker):
     with app.app_context():
-        returned_subscriptions = minibc.parse_subscriptions(
+        num_subscriptions_upserted = minibc.parse_subscriptions(
             subscriptions=mock_subscriptions
         )
-    assert len(returned_subscriptions) == 1
+    assert num_subscriptions_upserted == 1
+
+
+def test_request_rate_limiter(mocker):
+    mocker.patch("member_card.minibc.monotonic", return_value=100.0)
+    mock_sleep = mocker.patch("member_card.minibc.sleep")
+
+    rate_limiter = minibc.RequestRateLimiter(max_requests_per_sec=10)
+    for _ in range(3):
+        rate_limiter.wait()
+
+    assert [c.args[0] for c in mock_sleep.call_args_list] == pytest.approx(
+        [0, 0.1, 0.2]
+    )
+
+
+def test_fetch_subscription_pages(mocker):
+    mock_client = mocker.Mock()
+    mock_client.search_subscriptions.side_effect = lambda product_sku, page_num: (
+        [dict(id=page_num)] if page_num <= 3 else None
+    )
+
+    subscription_pages = minibc.fetch_subscription_pages(
+        minibc_client=mock_client,
+        sku="TEST-001",
+        start_page_num=1,
+        end_page_num=100,
+        max_workers=2,
+        max_requests_per_sec=1000,
+    )
+
+    assert list(subscription_pages) == [
+        (1, [dict(id=1)]),
+        (2, [dict(id=2)]),
+        (3, [dict(id=3)]),
+    ]
+    requested_page_nums = {
+        c.kwargs["page_num"] for c in mock_client.search_subscriptions.call_args_list
+    }
+    assert requested_page_nums == {1, 2, 3, 4, 5}
+
+
+def test_minibc_subscriptions_etl(app: "Flask", mock_subscriptions, mocker):
+    mock_subscriptions[0]["id"] = 1023
+    mock_client = mocker.Mock()
+    mock_client.search_subscriptions.side_effect = lambda product_sku, page_num: (
+        deepcopy(mock_subscriptions) if page_num == 1 else []
+    )
+    mock_set_start_page = mocker.patch(
+        "member_card.minibc.table_metadata.set_last_run_start_page"
+    )
+
+    with app.app_context():
+        num_subscriptions_upserted = minibc.minibc_subscriptions_etl(
+            minibc_client=mock_client, skus=["TEST-001"]
+        )
+        assert num_subscriptions_upserted == 1
+        assert Subscription.query.filter_by(subscription_id=1023).count() == 1
+
+    mock_set_start_page.assert_called_once_with("subscription", 1)
+
+
+def test_perform_request_headers(requests_mock):
+    requests_mock.post(f"{minibc.api_baseurl}/subscriptions/search", json=[])
+    minibc_client = minibc.Minibc(api_key="test-api-key")
+
+    assert minibc_client.search_subscriptions(product_sku="TEST-001") == []
+    assert requests_mock.last_request.headers["X-MBC-TOKEN"] == "test-api-key"
+    assert requests_mock.last_request.headers["User-Agent"] == minibc_client.useragent
+
+
+def test_parse_subscriptions_skips_unchanged(app: "Flask", mock_subscriptions, mocker):
+    mock_subscriptions[0]["id"] = 1024
+    with app.app_context():
+        assert minibc.parse_subscriptions(deepcopy(mock_subscriptions)) == 1
+        assert minibc.parse_subscriptions(deepcopy(mock_subscriptions)) == 0
+
+        mock_subscriptions[0]["status"] = "inactive"
+        assert minibc.parse_subscriptions(deepcopy(mock_subscriptions)) == 1
+        subscription = Subscription.query.filter_by(subscription_id=1024).one()
+        assert subscription.status == "inactive"
@@ -0,0 +1,169 @@
+import base64
+import json
+import os
+from collections import deque
+from typing import TYPE_CHECKING
+
+import pytest
+
+from member_card import renderer
+
+if TYPE_CHECKING:
+    from pytest_mock.plugin import MockerFixture
+
+
+class FakeDevToolsWebSocket(object):
+    def __init__(self, screenshot=b"fake-png-bytes"):
+        self.connected = True
+        self.screenshot = screenshot
+        self.sent_methods = []
+        self._pending = deque()
+
+    def send(self, payload):
+        message = json.loads(payload)
+        method = message["method"]
+        self.sent_methods.append(method)
+        result = {}
+        if method == "Page.navigate":
+            # Chrome may well fire the load event before responding to the navigate command
+            self._pending.append(dict(method="Page.loadEventFired", params={}))
+            result = dict(frameId="test-frame-id")
+        elif method == "Page.captureScreenshot":
+            result = dict(data=base64.b64encode(self.screenshot).decode())
+        elif method == "Runtime.evaluate":
+            result = dict(result=dict(type="number", value=2))
+        self._pending.append(dict(id=message["id"], result=result))
+
+    def recv(self):
+        return json.dumps(self._pending.popleft())
+
+    def close(self):
+        self.connected = False
+
+
+@pytest.fixture()
+def fake_ws(mocker: "MockerFixture"):
+    fake_ws = FakeDevToolsWebSocket()
+    mocker.patch("member_card.renderer.create_connection", return_value=fake_ws)
+    return fake_ws
+
+
+@pytest.fixture()
+def mock_chrome_proc(mocker: "MockerFixture"):
+    mocker.patch("member_card.renderer.shutil.which", return_value="/usr/bin/chrome")
+    mock_popen = mocker.patch("member_card.renderer.subprocess.Popen")
+    mock_proc = mock_popen.return_value
+    mock_proc.poll.return_value = None
+
+    def write_active_port_file(command, **kwargs):
+        user_data_dir = [
+            c.split("=", 1)[1] for c in command if c.startswith("--user-data-dir=")
+        ][0]
+        os.makedirs(user_data_dir)
+        with open(os.path.join(user_data_dir, "DevToolsActivePort"), "w") as f:
+            f.write("9222\n/devtools/browser/test\n")
+        return mock_proc
+
+    mock_popen.side_effect = write_active_port_file
+    mock_requests = mocker.patch("member_card.renderer.requests")
+    mock_requests.get.return_value.json.return_value = [
+        dict(type="page", webSocketDebuggerUrl="ws://127.0.0.1:9222/devtools/page/1")
+    ]
+    return mock_proc
+
+
+def test_chrome_renderer_render(fake_ws, mock_chrome_proc):
+    chrome_renderer = renderer.ChromeRenderer(max_renders=2)
+    chrome_renderer.start()
+
+    assert chrome_renderer.is_healthy()
+    screenshot = chrome_renderer.render(html_content="<p>hi</p>", size=(793, 500))
+    assert screenshot == fake_ws.screenshot
+    assert chrome_renderer.num_renders == 1
+    assert not chrome_renderer.needs_recycling
+    assert fake_ws.sent_methods == [
+        "Page.enable",
+        "Runtime.evaluate",
+        "Emulation.setDeviceMetricsOverride",
+        "Page.navigate",
+        "Page.captureScreenshot",
+    ]
+
+    chrome_renderer.render(html_content="<p>hi again</p>", size=(793, 500))
+    assert chrome_renderer.needs_recycling
+
+    work_dir = chrome_renderer._work_dir
+    chrome_renderer.close()
+    assert not fake_ws.connected
+    mock_chrome_proc.terminate.assert_called_once()
+    assert not os.path.exists(work_dir)
+
+
+def test_chrome_renderer_unhealthy_when_exited(fake_ws, mock_chrome_proc):
+    chrome_renderer = renderer.ChromeRenderer()
+    chrome_renderer.start()
+    mock_chrome_proc.poll.return_value = 1
+
+    assert not chrome_renderer.is_healthy()
+    chrome_renderer.close()
+
+
+def test_chrome_renderer_pool_reuses_renderers(mocker: "MockerFixture"):
+    mock_renderer_class = mocker.patch("member_card.renderer.ChromeRenderer")
+    mock_renderer = mock_renderer_class.return_value
+    mock_renderer.needs_recycling = False
+    mock_renderer.is_healthy.return_value = True
+
+    renderer_pool = renderer.ChromeRendererPool(size=1, max_renders=10)
+    renderer_pool.render(html_content="<p>one</p>", size=(1, 1))
+    renderer_pool.render(html_content="<p>two</p>", size=(1, 1))
+
+    mock_renderer_class.assert_called_once()
+    mock_renderer.start.assert_called_once()
+    assert mock_renderer.render.call_count == 2
+
+    renderer_pool.close()
+    mock_renderer.close.assert_called_once()
+
+
+def test_chrome_renderer_pool_recycles_renderers(mocker: "MockerFixture"):
+    mock_renderer_class = mocker.patch("member_card.renderer.ChromeRenderer")
+    mock_renderer = mock_renderer_class.return_value
+    mock_renderer.needs_recycling = True
+
+    renderer_pool = renderer.ChromeRendererPool(size=1, max_renders=1)
+    renderer_pool.render(html_content="<p>one</p>", size=(1, 1))
+    renderer_pool.render(html_content="<p>two</p>", size=(1, 1))
+
+    assert mock_renderer.start.call_count == 2
+    mock_renderer.close.assert_called_once()
+
+
+def test_chrome_renderer_pool_discards_failed_renderers(mocker: "MockerFixture"):
+    mock_renderer_class = mocker.patch("member_card.renderer.ChromeRenderer")
+    mock_renderer = mock_renderer_class.return_value
+    mock_renderer.render.side_effect = renderer.ChromeRendererError("oh no")
+
+    renderer_pool = renderer.ChromeRendererPool(size=1)
+    with pytest.raises(renderer.ChromeRendererError):
+        renderer_pool.render(html_content="<p>one</p>", size=(1, 1))
+
+    mock_renderer.close.assert_called_once()
+    assert renderer_pool._idle_renderers.empty()
+
+
+def test_find_chrome_executable(mocker: "MockerFixture"):
+    mock_which = mocker.patch("member_card.renderer.shutil.which")
+
+    assert renderer.find_chrome_executable("/opt/chrome") == "/opt/chrome"
+    mock_which.assert_not_called()
+
+    mock_which.side_effect = (
+        lambda name: "/usr/bin/chromium" if name == "chromium" else None
+    )
+    assert renderer.find_chrome_executable() == "/usr/bin/chromium"
+
+    mock_which.side_effect = None
+    mock_which.return_value = None
+    with pytest.raises(renderer.ChromeRendererError):
+        renderer.find_chrome_executable()
@@ -1,6 +1,7 @@
 from typing import TYPE_CHECKING
 
 from slack_sdk import WebClient
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
 from slack_sdk.web import SlackResponse
 from member_card import slack
 
@@ -11,7 +12,9 @@ if TYPE_CHECKING:
 
 def test_get_web_client(app: "Flask"):
     with app.app_context():
-        assert slack.get_web_client()
+        client = slack.get_web_client()
+
+    assert any(isinstance(h, RateLimitErrorRetryHandler) for h in client.retry_handlers)
 
 
 def test_slack_members_generator(app: "Flask", mocker: "MockerFixture"):
@@ -68,10 +71,7 @@ def test_slack_members_generator(app: "Flask", mocker: "MockerFixture"):
 
 def test_slack_members_etl(app: "Flask", mocker: "MockerFixture"):
     mock_client = mocker.create_autospec(WebClient, instance=True)
-    mock_slack_members_generator = mocker.patch(
-        "member_card.slack.slack_members_generator"
-    )
-    mock_slack_members_generator.return_value = [
+    slack_members = [
         {
             "id": "W012A3CDE",
             "team_id": "T012AB3C4",
@@ -150,9 +150,22 @@ def test_slack_members_etl(app: "Flask", mocker: "MockerFixture"):
             "has_2fa": False,
         },
     ]
+    mock_slack_member_pages_generator = mocker.patch(
+        "member_card.slack.slack_member_pages_generator"
+    )
+    mock_slack_member_pages_generator.return_value = [slack_members]
     with app.app_context():
         # in app context cause method being called depends on some implicit current_app.config bits...
-        assert slack.slack_members_etl(client=mock_client)
+        slack_users = slack.slack_members_etl(client=mock_client)
+        assert [u.slack_id for u in slack_users] == ["W012A3CDE", "W07QCRPA4"]
+        assert all(u.profile_hash and u.user_id for u in slack_users)
+
+        # Members unchanged since the last run are skipped outright
+        slack_members[1]["profile"]["title"] = "Glinda the Great"
+        mock_upsert_slack_members = mocker.spy(slack, "upsert_slack_members")
+        slack_users = slack.slack_members_etl(client=mock_client)
+        assert [u.slack_id for u in slack_users] == ["W07QCRPA4"]
+        mock_upsert_slack_members.assert_called_once_with([slack_members[1]])
 
     # assert return_value is not None
     # mock_client.users_list.assert_called_with(
@@ -1,3 +1,183 @@
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+import pytest
+
+from member_card import squarespace
+from member_card.models import AnnualMembership
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from pytest_mock.plugin import MockerFixture
+
+
+def make_squarespace_order(num, sku="SQ3671268"):
+    return dict(
+        id=f"squarespace-test-order-{num}",
+        orderNumber=f"squarespace-test-{num}",
+        channel="web",
+        channelName="Squarespace",
+        billingAddress=dict(firstName="Jane", lastName="Doe"),
+        externalOrderReference=None,
+        createdOn="2022-05-01T00:00:00Z",
+        modifiedOn="2022-05-02T00:00:00Z",
+        fulfilledOn=None,
+        customerEmail=f"squarespace-test-{num}@example.com",
+        fulfillmentStatus="PENDING",
+        testmode=False,
+        lineItems=[
+            dict(
+                id=f"squarespace-test-line-item-{num}",
+                sku=sku,
+                variantId="test-variant-id",
+                productId="test-product-id",
+                productName="Los Verdes Membership",
+            )
+        ],
+    )
+
+
+@pytest.fixture()
+def squarespace_client():
+    return squarespace.Squarespace(api_key="test-api-key")
+
+
+def test_load_all_membership_orders_streams_orders(
+    squarespace_client, mocker: "MockerFixture"
+):
+    orders_retrieved = []
+
+    def all_orders(**order_params):
+        for num, sku in enumerate(["SQ3671268", "NOT-A-MEMBERSHIP", "SQ6438806"]):
+            orders_retrieved.append(num)
+            yield make_squarespace_order(num, sku=sku)
+
+    mocker.patch.object(squarespace_client, "all_orders", side_effect=all_orders)
+
+    membership_orders = squarespace_client.load_all_membership_orders(
+        membership_skus=["SQ3671268", "SQ6438806"]
+    )
+    assert orders_retrieved == []
+    assert next(membership_orders)["id"] == "squarespace-test-order-0"
+    assert orders_retrieved == [0]
+    assert [o["id"] for o in membership_orders] == ["squarespace-test-order-2"]
+
+
+def test_parse_subscription_orders(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch.dict(app.config, {"ETL_BATCH_SIZE": 2})
+    subscription_orders = (make_squarespace_order(num) for num in range(3))
+
+    with app.app_context():
+        membership_counts = squarespace.parse_subscription_orders(
+            membership_skus=["SQ3671268"],
+            subscription_orders=subscription_orders,
+        )
+        memberships = AnnualMembership.query.filter(
+            AnnualMembership.order_id.like("squarespace-test-order-%")
+        ).all()
+        assert membership_counts["active"] + membership_counts["inactive"] == 3
+        assert membership_counts["unchanged"] == 0
+        assert sorted(m.order_id for m in memberships) == [
+            f"squarespace-test-order-{num}" for num in range(3)
+        ]
+        assert all(m.user_id for m in memberships)
+
+        membership_counts = squarespace.parse_subscription_orders(
+            membership_skus=["SQ3671268"],
+            subscription_orders=(make_squarespace_order(num) for num in range(3)),
+        )
+        assert membership_counts["active"] + membership_counts["inactive"] == 0
+        assert membership_counts["unchanged"] == 3
+
+
+def fake_orders_pages_get(num_pages):
+    # Pages of two orders each, chained together by "<modifiedAfter>|<page_num>" cursors
+    def get(path, args):
+        if "cursor" in args:
+            modified_after, page_num = args["cursor"].split("|")
+            page_num = int(page_num)
+        else:
+            modified_after, page_num = args.get("modifiedAfter"), 0
+        pagination = {}
+        if page_num + 1 < num_pages:
+            pagination["nextPageCursor"] = f"{modified_after}|{page_num + 1}"
+        return dict(
+            result=[
+                make_squarespace_order(f"{modified_after}-{page_num}-{n}")
+                for n in range(2)
+            ],
+            pagination=pagination,
+        )
+
+    return get
+
+
+def test_iter_order_pages_interleaved(squarespace_client, mocker: "MockerFixture"):
+    mocker.patch.object(squarespace_client, "get", side_effect=fake_orders_pages_get(3))
+
+    first_pages = squarespace_client.iter_order_pages()
+    second_pages = squarespace_client.iter_order_pages()
+    first_page_nums = []
+    for first_page, second_page in zip(first_pages, second_pages):
+        assert first_page == second_page
+        first_page_nums.append(first_page[0]["id"])
+
+    assert first_page_nums == [
+        "squarespace-test-order-None-0-0",
+        "squarespace-test-order-None-1-0",
+        "squarespace-test-order-None-2-0",
+    ]
+
+
+def test_split_datetime_window():
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    end = datetime(2022, 1, 5, tzinfo=timezone.utc)
+
+    shard_windows = squarespace.split_datetime_window(
+        start=start, end=end, num_shards=2
+    )
+
+    assert shard_windows == [
+        (start - timedelta(seconds=1), datetime(2022, 1, 3, tzinfo=timezone.utc)),
+        (datetime(2022, 1, 3, tzinfo=timezone.utc) - timedelta(seconds=1), end),
+    ]
+
+
+def test_all_orders_sharded(squarespace_client, mocker: "MockerFixture"):
+    mock_get = mocker.patch.object(
+        squarespace_client, "get", side_effect=fake_orders_pages_get(2)
+    )
+
+    orders = list(
+        squarespace_client.all_orders_sharded(
+            modified_after=datetime(2022, 1, 1, tzinfo=timezone.utc),
+            modified_before=datetime(2022, 1, 5, tzinfo=timezone.utc),
+            num_shards=4,
+            max_workers=2,
+        )
+    )
+
+    assert len(orders) == 4 * 2 * 2
+    assert len({o["id"] for o in orders}) == len(orders)
+    assert mock_get.call_count == 4 * 2
+
+
+def test_all_orders_sharded_shard_failure(squarespace_client, mocker: "MockerFixture"):
+    mocker.patch.object(
+        squarespace_client, "get", side_effect=RuntimeError("Squarespace is down")
+    )
+
+    with pytest.raises(RuntimeError, match="Squarespace is down"):
+        list(
+            squarespace_client.all_orders_sharded(
+                modified_after=datetime(2022, 1, 1, tzinfo=timezone.utc),
+                modified_before=datetime(2022, 1, 5, tzinfo=timezone.utc),
+                num_shards=2,
+                max_workers=2,
+            )
+        )
+
+
 # class TestSquarespaceOauth:
 #     def test_squarespace_oauth_callback_error_in_args(
 #         self,
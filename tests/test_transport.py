@@ -0,0 +1,127 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import TYPE_CHECKING
+
+import pytest
+import requests
+
+from member_card import transport
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from pytest_mock.plugin import MockerFixture
+    from requests_mock.contrib.fixture import Fixture as RequestsMockFixture
+
+TEST_URL = "https://api.example.com/v1/things"
+
+
+@pytest.fixture()
+def mock_sleep(mocker: "MockerFixture"):
+    return mocker.patch("member_card.transport.sleep")
+
+
+@pytest.fixture()
+def request_metrics(mocker: "MockerFixture"):
+    for counter_name in ["request_counts", "request_retries", "request_duration_secs"]:
+        mocker.patch.object(transport, counter_name, Counter())
+
+
+@pytest.fixture()
+def http_session():
+    http_session = transport.ResilientSession(max_attempts=4, backoff_base_secs=0.5)
+    yield http_session
+    http_session.close()
+
+
+def test_retries_rate_limited_requests(
+    requests_mock: "RequestsMockFixture", http_session, mock_sleep, request_metrics
+):
+    requests_mock.post(
+        TEST_URL,
+        [
+            dict(status_code=429, headers={"Retry-After": "2"}),
+            dict(status_code=200, json=dict(ok=True)),
+        ],
+    )
+
+    response = http_session.post(TEST_URL, json=dict(hi="there"))
+
+    assert response.json() == dict(ok=True)
+    mock_sleep.assert_called_once_with(2.0)
+    assert transport.request_counts == {"api.example.com": 2}
+    assert transport.request_retries == {"api.example.com": 1}
+    assert transport.get_request_timings()["api.example.com"]["requests"] == 2
+
+
+def test_backs_off_exponentially(
+    requests_mock: "RequestsMockFixture", http_session, mock_sleep, request_metrics
+):
+    requests_mock.get(TEST_URL, status_code=503)
+
+    response = http_session.get(TEST_URL)
+
+    assert response.status_code == 503
+    assert requests_mock.call_count == 4
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [0.5, 1.0, 2.0]
+
+
+def test_server_errors_not_retried_for_post(
+    requests_mock: "RequestsMockFixture", http_session, mock_sleep, request_metrics
+):
+    requests_mock.post(TEST_URL, status_code=503)
+
+    assert http_session.post(TEST_URL).status_code == 503
+    assert requests_mock.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+def test_retries_connection_errors(
+    requests_mock: "RequestsMockFixture", http_session, mock_sleep, request_metrics
+):
+    requests_mock.get(
+        TEST_URL,
+        [dict(exc=requests.ConnectionError("nope")), dict(status_code=200)],
+    )
+
+    assert http_session.get(TEST_URL).status_code == 200
+    assert requests_mock.last_request.timeout == http_session.timeout_secs
+    mock_sleep.assert_called_once_with(0.5)
+
+
+def test_get_retry_after_secs():
+    response = requests.Response()
+    assert transport.get_retry_after_secs(response) is None
+
+    retry_at = datetime.now(tz=timezone.utc) + timedelta(seconds=30)
+    response.headers["Retry-After"] = format_datetime(retry_at, usegmt=True)
+    assert 25 < transport.get_retry_after_secs(response) <= 30
+
+    response = requests.Response()
+    response.headers["X-Rate-Limit-Time-Reset-Ms"] = "1500"
+    assert transport.get_retry_after_secs(response) == 1.5
+
+
+def test_get_http_session(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch("member_card.transport._http_session", None)
+    mocker.patch.dict(app.config, {"HTTP_MAX_REQUESTS_PER_HOST": 3})
+
+    with app.app_context():
+        http_session = transport.get_http_session()
+        assert transport.get_http_session() is http_session
+
+    assert http_session.max_requests_per_host == 3
+    assert http_session.get_host_slots("api.example.com")._value == 3
+    transport.close_http_session()
+
+
+def test_init_http_session(app: "Flask", mocker: "MockerFixture"):
+    mocker.patch("member_card.transport._http_session", None)
+    mocker.patch.dict(app.config, {"HTTP_TIMEOUT_SECS": 12})
+
+    http_session = transport.init_http_session(app)
+
+    # e.g. requests from client pool threads, which have no app context
+    assert transport.get_http_session() is http_session
+    assert http_session.timeout_secs == 12
+    transport.close_http_session()
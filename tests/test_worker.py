@@ -1,10 +1,13 @@
 import base64
 import json
 import logging
+from collections import Counter
 
+import pytest
 from bigcommerce import connection
 
 from member_card import worker
+from member_card.models import PubsubJob
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -73,6 +76,89 @@ class TestPubsubIngress:
         # Check that we return a 400 / Bad Request in these cases
         assert response.status_code == 204
 
+    def test_message_acked_before_job_runs(self, app, client, mocker):
+        mocker.patch.dict(app.config, {"WORKER_RUN_JOBS_INLINE": False})
+        mock_get_job_runner = mocker.patch("member_card.worker.get_job_runner")
+        mock_run_job = mocker.patch("member_card.worker.run_job")
+        test_message = dict(
+            type="email_distribution_request",
+            email_distribution_recipient="los.verdes.tester+pls-ack-me@gmail.com",
+        )
+        response = client.post(
+            "/pubsub",
+            json=self.generate_test_envelope(test_message),
+        )
+
+        assert response.status_code == 204
+        mock_run_job.assert_not_called()
+        submitted_job = mock_get_job_runner.return_value.submit.call_args.args[0]
+        assert submitted_job.message_type == "email_distribution_request"
+        assert submitted_job.status == "pending"
+
+    def test_duplicate_message_skipped(self, client, mocker):
+        mock_run_job = mocker.patch("member_card.worker.run_job")
+        test_message = dict(
+            type="sync_bigcommerce_order",
+            store_hash="test-store-hash",
+            hash="test-webhook-hash",
+            data=dict(type="order", id=1234),
+        )
+        test_envelope = self.generate_test_envelope(test_message)
+        test_envelope["message"]["messageId"] = "test-duplicate-message-id"
+
+        first_response = client.post("/pubsub", json=test_envelope)
+        # Redelivery of the same message
+        second_response = client.post("/pubsub", json=test_envelope)
+
+        assert first_response.status_code == second_response.status_code == 204
+        mock_run_job.assert_called_once()
+
+    def test_order_update_webhooks_not_skipped(self, client, mocker):
+        mock_run_job = mocker.patch("member_card.worker.run_job")
+        test_message = dict(
+            type="sync_bigcommerce_order",
+            store_hash="test-store-hash",
+            hash="test-webhook-hash",
+            data=dict(type="order", id=4321),
+        )
+        test_envelope = self.generate_test_envelope(test_message)
+        for message_id in ["test-order-created-message-id", "test-order-updated-id"]:
+            # BigCommerce's webhook payloads (and "hash") are the same for every update to an order
+            test_envelope["message"]["messageId"] = message_id
+            assert client.post("/pubsub", json=test_envelope).status_code == 204
+
+        assert mock_run_job.call_count == 2
+
+    def test_order_webhooks_coalesced(self, app, client, mocker):
+        mocker.patch.dict(app.config, {"WORKER_RUN_JOBS_INLINE": False})
+        mock_get_job_runner = mocker.patch("member_card.worker.get_job_runner")
+        mock_submit = mock_get_job_runner.return_value.submit
+        submitted_job_ids = []
+        mock_submit.side_effect = lambda job: submitted_job_ids.append(job.id)
+        for webhook_hash in ["created-hash", "updated-hash"]:
+            test_message = dict(
+                type="sync_bigcommerce_order",
+                store_hash="test-store-hash",
+                hash=webhook_hash,
+                data=dict(type="order", id=5678),
+            )
+            response = client.post(
+                "/pubsub",
+                json=self.generate_test_envelope(test_message),
+            )
+            assert response.status_code == 204
+
+        assert mock_submit.call_count == 2
+        first_job_id, second_job_id = submitted_job_ids
+        with app.app_context():
+            assert PubsubJob.query.get(first_job_id).status == "superseded"
+            second_job = PubsubJob.query.get(second_job_id)
+            assert second_job.status == "pending"
+            coalesce_window = second_job.run_after - second_job.time_created
+            assert coalesce_window.total_seconds() == pytest.approx(
+                app.config["WORKER_JOB_COALESCE_WINDOW_SECS"], abs=5
+            )
+
     def test_sync_subscriptions_etl(self, client, mocker):
         mock_store_hash = "mock_store_hash"
         mock_orders = [
@@ -224,6 +310,7 @@ class TestEmailDistribution:
         mock_upload_apple_pass = mocker.patch(
             "member_card.worker.generate_and_upload_apple_pass"
         )
+        mock_gpay = mocker.patch("member_card.worker.gpay")
         mock_generate_email = mocker.patch("member_card.worker.generate_email_message")
         mock_send_email = mocker.patch("member_card.worker.send_email_message")
         test_message = dict(
@@ -240,11 +327,75 @@ class TestEmailDistribution:
 
         mock_upload_image.assert_called_once()
         mock_upload_apple_pass.assert_called_once()
+        mock_gpay.sync_pass_object.assert_called_once()
 
         mock_generate_email.assert_called_once()
 
         mock_send_email.assert_called_once_with(mock_generate_email.return_value)
 
+    def test_gpay_sync_failure_still_sends_email(self, mocker, fake_member):
+        mocker.patch("member_card.worker.ensure_uploaded_card_image")
+        mocker.patch("member_card.worker.generate_and_upload_apple_pass")
+        mock_gpay = mocker.patch("member_card.worker.gpay")
+        mock_gpay.sync_pass_object.side_effect = Exception("wallet api is down")
+        mock_generate_email = mocker.patch("member_card.worker.generate_email_message")
+        mock_send_email = mocker.patch("member_card.worker.send_email_message")
+        test_message = dict(
+            type="email_distribution_request",
+            email_distribution_recipient=fake_member.email,
+        )
+
+        return_value = worker.process_email_distribution_request(
+            message=test_message,
+        )
+
+        assert return_value is mock_send_email.return_value
+        mock_send_email.assert_called_once_with(mock_generate_email.return_value)
+
+
+class TestSyncGooglePayObject:
+    def test_no_matching_user(self, mocker):
+        mock_gpay = mocker.patch("member_card.worker.gpay")
+        test_message = dict(
+            type="sync_google_pay_object_request",
+            member_email_address="los.verdes.tester+pls-no-matchy@gmail.com",
+        )
+
+        return_value = worker.process_sync_google_pay_object_request(
+            message=test_message,
+        )
+
+        assert return_value is None
+        mock_gpay.sync_pass_object.assert_not_called()
+
+    def test_with_matching_user_no_memberships(self, mocker, fake_user):
+        mock_gpay = mocker.patch("member_card.worker.gpay")
+        test_message = dict(
+            type="sync_google_pay_object_request",
+            member_email_address=fake_user.email,
+        )
+
+        return_value = worker.process_sync_google_pay_object_request(
+            message=test_message,
+        )
+
+        assert return_value is None
+        mock_gpay.sync_pass_object.assert_not_called()
+
+    def test_with_matching_user_with_memberships(self, mocker, fake_card):
+        mock_gpay = mocker.patch("member_card.worker.gpay")
+        test_message = dict(
+            type="sync_google_pay_object_request",
+            member_email_address=fake_card.user.email,
+        )
+
+        return_value = worker.process_sync_google_pay_object_request(
+            message=test_message,
+        )
+
+        assert return_value is mock_gpay.sync_pass_object.return_value
+        mock_gpay.sync_pass_object.assert_called_once_with(fake_card)
+
 
 class TestEnsureCardImage:
     def test_no_matching_user(self, mocker):
@@ -325,6 +476,23 @@ def test_sync_bigcommerce_order(app: "Flask", mocker):
     )
 
 
+def test_sync_subscriptions_etl_stats(app: "Flask", mocker):
+    mock_bigcommerce = mocker.patch("member_card.worker.bigcommerce")
+    mock_bigcommerce.bigcommerce_orders_etl.return_value = Counter(
+        active=2, inactive=1, unchanged=5
+    )
+
+    with app.app_context():
+        result = worker.sync_subscriptions_etl(
+            message=dict(type="sync_subscriptions_etl")
+        )
+
+    assert result["stats"]["num_membership"] == 3
+    assert result["stats"]["num_active_membership"] == 2
+    assert result["stats"]["num_inactive_membership"] == 1
+    assert result["stats"]["num_unchanged_membership"] == 5
+
+
 def test_worker_sync_customers_etl(mocker):
     mock_bigcommerce = mocker.patch("member_card.worker.bigcommerce")
     test_message = dict(
@@ -369,3 +537,55 @@ def test_sync_minibc_subscriptions_etl(app: "Flask", mocker):
         )
 
     mock_minibc.minibc_subscriptions_etl.assert_called_once()
+
+
+def test_sweep_pubsub_jobs(app: "Flask", mocker):
+    mock_sweep_jobs = mocker.patch("member_card.worker.sweep_jobs")
+    mock_sweep_jobs.return_value = [mocker.Mock(), mocker.Mock()]
+
+    with app.app_context():
+        assert worker.sweep_pubsub_jobs(message=dict(type="sweep_pubsub_jobs")) == 2
+
+    mock_sweep_jobs.assert_called_once_with(handlers=worker.MESSAGE_TYPE_HANDLERS)
+
+
+def test_sweep_jobs_on_startup(app: "Flask", mocker):
+    mock_sweep_jobs = mocker.patch("member_card.worker.sweep_jobs")
+
+    with app.app_context():
+        worker.sweep_jobs_on_startup()
+        mock_sweep_jobs.assert_not_called()
+
+        mocker.patch.dict(app.config, {"WORKER_RUN_JOBS_INLINE": False})
+        worker.sweep_jobs_on_startup()
+        mock_sweep_jobs.assert_called_once_with(handlers=worker.MESSAGE_TYPE_HANDLERS)
+
+
+def test_get_message_dedup_key():
+    email_request = dict(
+        type="email_distribution_request",
+        email_distribution_recipient="Los.Verdes.Tester@gmail.com",
+        submitted_on="2022-02-22T12:34:56",
+    )
+    assert (
+        worker.get_message_dedup_key(email_request)
+        == "email_distribution_request:los.verdes.tester@gmail.com:2022-02-22"
+    )
+    same_day_request = dict(
+        email_request,
+        email_distribution_recipient="los.verdes.tester@gmail.com",
+        submitted_on="2022-02-22T18:00:01",
+    )
+    assert worker.get_message_dedup_key(
+        same_day_request
+    ) == worker.get_message_dedup_key(email_request)
+    del email_request["submitted_on"]
+    assert worker.get_message_dedup_key(email_request) is None
+    assert worker.get_message_dedup_key(dict(type="sync_subscriptions_etl")) is None
+    order_webhook = dict(
+        type="sync_bigcommerce_order",
+        store_hash="test-store-hash",
+        hash="test-webhook-hash",
+        data=dict(type="order", id=1234),
+    )
+    assert worker.get_message_dedup_key(order_webhook) is None